@@ -0,0 +1,472 @@
+"""
+ANALYTICS.PY
+
+Records which scenes players enter and which choices they make, and works out
+from millions of such events where players go, where their games end and how
+long they stay in each scene.
+
+Events are kept as columns rather than as one object per event: a column of
+session numbers, one of timestamps, one of event kinds, and so on, each an
+array.array of plain numbers. Scene names, choice texts and session ids are
+stored once in a table of names and referred to by number. An event costs 19
+bytes, and the columns are appended to one file each, so the analysis can
+read a whole column into a NumPy array in one go and answer every question
+with a handful of vectorized operations instead of a loop over events.
+
+Scenes often call the next scene directly instead of returning it, so
+game.play()'s on_scene callback does not see every scene. Recording wraps
+every scene function (scenegraph.watching_scenes) for the duration instead,
+and hears about choices through gametools.choice_listeners:
+
+    log = ColumnarLog("analytics")
+    with log.recording("alice"):
+        game.play(game.intro)
+    log.flush()
+
+    events = load("analytics")
+    transitions(events)   # how often each scene is followed by each other one
+    funnel(events, ["intro", "hall", "attack_bob", "surface_hub"])
+    dwell_times(events)
+    choices(events, "hall")
+    endings(events)       # the scenes games ended (or players died) in
+
+NumPy is only needed for the analysis, not for recording.
+
+    python analytics.py report analytics
+    python analytics.py bench
+"""
+
+import argparse
+import json
+import os
+from array import array
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from time import time
+
+import gametools
+from encounters import numpy_for
+from scenegraph import watching_scenes
+
+# The columns, with the array typecode each is stored as.
+COLUMNS = {
+    "session": "I",  # number of the session id in sessions
+    "time": "d",  # seconds since the epoch
+    "kind": "B",  # SCENE, CHOICE or END
+    "scene": "H",  # number of the scene's name in names
+    "choice": "h",  # index of the choice picked, -1 for other events
+    "label": "H",  # number of the choice's text in names, 0 ("") otherwise
+}
+
+SCENE = 0  # a scene started
+CHOICE = 1  # a choice was picked in the scene
+END = 2  # the game ended in the scene
+
+KINDS = ("scene", "choice", "end")
+
+_META = "names.json"
+
+# The recording() block running in the current context, if any.
+_recording = ContextVar("analytics_recording", default=None)
+
+
+class ColumnarLog:
+    """Scene and choice events, appended to a folder of column files.
+
+    Events are held in memory until flush(), which happens by itself every
+    flush_every events. Logging into a folder that already has events adds to
+    them.
+    """
+
+    def __init__(self, folder, flush_every=65536):
+        os.makedirs(folder, exist_ok=True)
+        self.folder = folder
+        self.flush_every = flush_every
+        self.names = [""]
+        self.sessions = []
+        self.flushed = 0
+        meta = os.path.join(folder, _META)
+        if os.path.exists(meta):
+            with open(meta, encoding="utf-8") as file:
+                saved = json.load(file)
+            self.names = saved["names"]
+            self.sessions = saved["sessions"]
+            self.flushed = saved["events"]
+        self._names = {name: code for code, name in enumerate(self.names)}
+        self._sessions = {name: code for code, name in enumerate(self.sessions)}
+        self.columns = {name: array(typecode) for name, typecode in COLUMNS.items()}
+
+    def __len__(self):
+        return self.flushed + len(self.columns["kind"])
+
+    def name(self, text):
+        """Return the number text is stored under in names."""
+        code = self._names.get(text)
+        if code is None:
+            code = self._names[text] = len(self.names)
+            self.names.append(text)
+        return code
+
+    def session(self, session_id):
+        """Return the number session_id is stored under in sessions."""
+        code = self._sessions.get(session_id)
+        if code is None:
+            code = self._sessions[session_id] = len(self.sessions)
+            self.sessions.append(session_id)
+        return code
+
+    def append(self, session, kind, scene, choice=-1, label="", when=None):
+        """Log one event; session is a number from session()."""
+        columns = self.columns
+        columns["session"].append(session)
+        columns["time"].append(time() if when is None else when)
+        columns["kind"].append(kind)
+        columns["scene"].append(self.name(scene))
+        columns["choice"].append(choice)
+        columns["label"].append(self.name(label))
+        if len(columns["kind"]) >= self.flush_every:
+            self.flush()
+
+    def flush(self):
+        """Append the events held in memory to the column files."""
+        pending = len(self.columns["kind"])
+        for name, column in self.columns.items():
+            with open(os.path.join(self.folder, name), "ab") as file:
+                column.tofile(file)
+            del column[:]
+        self.flushed += pending
+        meta = os.path.join(self.folder, _META)
+        with open(meta + ".tmp", "w", encoding="utf-8") as file:
+            json.dump(
+                {"events": self.flushed, "names": self.names, "sessions": self.sessions},
+                file,
+            )
+        os.replace(meta + ".tmp", meta)
+
+    @contextmanager
+    def recording(self, session_id, namespace=None):
+        """Log the scenes entered and choices made inside the block.
+
+        namespace is where the scene functions live: game.py's globals by
+        default, or a namespace from asyncgame.new_game(). Start the game from
+        a scene looked up inside the block (game.play(game.intro), not
+        game.play()), so the first scene is logged too.
+        """
+        import game
+
+        namespace = vars(game) if namespace is None else namespace
+        session = self.session(session_id)
+        current = [""]
+
+        def entered(name):
+            current[0] = name
+            self.append(session, SCENE, name)
+
+        def chose(all_choices, choice):
+            # choice_listeners hears from every game in the process; only the
+            # choices made where this block is running belong to this session.
+            if _recording.get() is marker:
+                self.append(
+                    session, CHOICE, current[0], choice, str(all_choices[choice])
+                )
+
+        marker = object()
+        recorded = _recording.set(marker)
+        gametools.choice_listeners.append(chose)
+        try:
+            with watching_scenes(namespace, entered):
+                yield self
+        finally:
+            gametools.choice_listeners.remove(chose)
+            _recording.reset(recorded)
+            self.append(session, END, current[0])
+
+
+# Analysis
+
+
+@dataclass
+class Events:
+    """Logged events as NumPy arrays, one per column, in session order.
+
+    Within a session the events are in the order they happened.
+    """
+
+    names: list
+    sessions: list
+    session: object
+    time: object
+    kind: object
+    scene: object
+    choice: object
+    label: object
+
+    def __len__(self):
+        return len(self.kind)
+
+    def code(self, name):
+        return self.names.index(name)
+
+
+def load(folder):
+    """Read a folder written by ColumnarLog into an Events."""
+    np = numpy_for("the analysis")
+    with open(os.path.join(folder, _META), encoding="utf-8") as file:
+        meta = json.load(file)
+    columns = {
+        name: np.fromfile(os.path.join(folder, name), dtype=typecode)[: meta["events"]]
+        for name, typecode in COLUMNS.items()
+    }
+    # Sessions played at the same time have their events interleaved; a
+    # stable sort groups them by session without reordering any session.
+    order = np.argsort(columns["session"], kind="stable")
+    return Events(
+        meta["names"],
+        meta["sessions"],
+        **{name: column[order] for name, column in columns.items()},
+    )
+
+
+def _scene_codes(np, events):
+    """Return the codes of the names used as scenes, and for every code its
+    row in a table of those scenes."""
+    codes = np.unique(events.scene[events.kind == SCENE])
+    rows = np.full(len(events.names), -1, dtype=np.int64)
+    rows[codes] = np.arange(len(codes))
+    return codes, rows
+
+
+def transitions(events):
+    """Count how often each scene was entered straight after each other one.
+
+    Returns (scenes, counts): counts[i, j] is the number of times scenes[j]
+    followed scenes[i].
+    """
+    np = numpy_for("the analysis")
+    codes, rows = _scene_codes(np, events)
+    entered = events.kind == SCENE
+    session = events.session[entered]
+    scene = rows[events.scene[entered]]
+    same = session[1:] == session[:-1]
+    pairs = scene[:-1][same] * len(codes) + scene[1:][same]
+    counts = np.bincount(pairs, minlength=len(codes) ** 2)
+    return [events.names[code] for code in codes], counts.reshape(len(codes), -1)
+
+
+def funnel(events, steps):
+    """Count the sessions that entered the scenes in steps in that order, up
+    to each one: a session reaches a step by entering its scene at some point
+    after it reached the step before. Other scenes may come in between.
+
+    Returns a list of (scene, sessions) pairs, one per step.
+    """
+    np = numpy_for("the analysis")
+    entered = events.kind == SCENE
+    never = len(events)  # a position after every event
+    # For every session number, the position of the event at which the
+    # session reached the latest step; -1 before the first step.
+    reached = np.full(len(events.sessions), never)
+    reached[np.unique(events.session)] = -1
+    counts = []
+    for step in steps:
+        at = np.flatnonzero(entered & (events.scene == events.code(step)))
+        who = events.session[at]
+        later = at > reached[who]
+        reached = np.full(len(events.sessions), never)
+        np.minimum.at(reached, who[later], at[later])
+        counts.append((step, int(np.count_nonzero(reached < never))))
+    return counts
+
+
+def dwell_times(events):
+    """Work out how long players stay in each scene, from entering it until
+    the next scene starts or the game ends.
+
+    Returns {scene: (visits, mean, median, p95)} with times in seconds.
+    """
+    np = numpy_for("the analysis")
+    codes, rows = _scene_codes(np, events)
+    steps = (events.kind == SCENE) | (events.kind == END)
+    session, when, kind = events.session[steps], events.time[steps], events.kind[steps]
+    scene = rows[events.scene[steps]]
+    left = (session[1:] == session[:-1]) & (kind[:-1] == SCENE)
+    scene = scene[:-1][left]
+    dwell = (when[1:] - when[:-1])[left]
+
+    order = np.lexsort((dwell, scene))
+    scene, dwell = scene[order], dwell[order]
+    visits = np.bincount(scene, minlength=len(codes))
+    starts = np.concatenate(([0], np.cumsum(visits)[:-1]))
+    totals = np.bincount(scene, weights=dwell, minlength=len(codes))
+    times = {}
+    for row, code in enumerate(codes):
+        count = visits[row]
+        if not count:
+            continue
+        start = starts[row]
+        times[events.names[code]] = (
+            int(count),
+            totals[row] / count,
+            float(dwell[start + (count - 1) // 2]),
+            float(dwell[start + min(count - 1, int(count * 0.95))]),
+        )
+    return times
+
+
+def choices(events, scene=None):
+    """Count how often each choice was picked.
+
+    Returns {(scene, choice text): count}, or just {choice text: count} for
+    one scene, most picked first.
+    """
+    np = numpy_for("the analysis")
+    chosen = events.kind == CHOICE
+    if scene is not None:
+        chosen &= events.scene == events.code(scene)
+    keys = events.scene[chosen].astype(np.int64) * len(events.names)
+    keys += events.label[chosen]
+    keys, counts = np.unique(keys, return_counts=True)
+    table = {}
+    for key, count in sorted(zip(keys.tolist(), counts.tolist()), key=lambda kc: -kc[1]):
+        where, label = divmod(key, len(events.names))
+        name = events.names[label]
+        table[name if scene else (events.names[where], name)] = count
+    return table
+
+
+def endings(events):
+    """Count the games that ended in each scene, most first."""
+    np = numpy_for("the analysis")
+    counts = np.bincount(events.scene[events.kind == END], minlength=len(events.names))
+    return {
+        events.names[code]: int(counts[code])
+        for code in np.argsort(-counts, kind="stable")
+        if counts[code]
+    }
+
+
+def report(events, steps=("intro", "cell", "hall", "attack_bob", "surface_hub",
+                          "final_signal")):
+    """Print every analysis of the events."""
+    print(f"{len(events):,} events from {len(set(events.session.tolist())):,} sessions")
+    print()
+    scenes, counts = transitions(events)
+    print("most common transitions")
+    flat = counts.ravel()
+    for index in flat.argsort()[::-1][:10]:
+        if flat[index]:
+            source, target = divmod(int(index), len(scenes))
+            print(f"  {scenes[source]:>18} -> {scenes[target]:<18}{flat[index]:>12,}")
+    print()
+    print("funnel")
+    for step, reached in funnel(events, [s for s in steps if s in events.names]):
+        print(f"  {step:>18}{reached:>12,}")
+    print()
+    print(f"{'dwell times':<20}{'visits':>12}{'mean':>9}{'median':>9}{'p95':>9}")
+    for scene, (visits, mean, median, p95) in dwell_times(events).items():
+        print(f"  {scene:>18}{visits:>12,}{mean:>8.1f}s{median:>8.1f}s{p95:>8.1f}s")
+    print()
+    print("most picked choices")
+    for (scene, label), count in list(choices(events).items())[:10]:
+        print(f"  {scene:>18}  {label:<40}{count:>10,}")
+    print()
+    print("games ended in")
+    for scene, count in endings(events).items():
+        print(f"  {scene:>18}{count:>12,}")
+
+
+def _random_games(log, games, seed=2110):
+    """Play games with a player who answers every prompt at random."""
+    import random
+    from itertools import islice
+
+    import game
+    import playthrough
+
+    chooser = random.Random(seed)
+    answers = iter(lambda: str(chooser.randint(1, 4)), None)
+    with playthrough.captured(profile="plain") as output:
+        for number in range(games):
+            game.reset()
+            with log.recording(f"sample-{number}"):
+                playthrough.replay(islice(answers, 300), game.intro)
+            output.seek(0)
+            output.truncate()
+
+
+def bench(events=2_000_000, sample=200):
+    """Record real games played at random, log millions of events shaped like
+    them, then time loading and analyzing everything."""
+    import random
+    import shutil
+    import sys
+    import tempfile
+    from time import perf_counter
+
+    folder = tempfile.mkdtemp()
+    try:
+        log = ColumnarLog(folder, flush_every=sys.maxsize)  # keep the sample
+        start = perf_counter()
+        _random_games(log, sample)
+        played = perf_counter() - start
+        recorded = len(log)
+        print(f"recorded {sample} random games: {recorded:,} events, "
+              f"{played / recorded * 1e6:.0f} us per event including playing")
+
+        # Replay the sampled games over and over as new sessions, with the
+        # player taking a random while over every event.
+        template = list(zip(*(log.columns[name] for name in COLUMNS)))
+        names = log.names
+        log.flush_every = 65536
+        chooser = random.Random(2110)
+        start = perf_counter()
+        session, clock = None, 0.0
+        while len(log) < events:
+            for number, _, kind, scene, choice, label in template:
+                if number != session:
+                    session = number
+                    current = log.session(f"player-{len(log.sessions)}")
+                clock += chooser.expovariate(0.2)
+                log.append(current, kind, names[scene], choice, names[label], clock)
+        log.flush()
+        appended = perf_counter() - start
+        size = sum(os.path.getsize(os.path.join(folder, name)) for name in COLUMNS)
+        print(f"appended {len(log):,} events in {appended:.2f} s "
+              f"({len(log) / appended:,.0f} per s), {size / 1e6:.1f} MB on disk "
+              f"({size / len(log):.0f} bytes each)")
+
+        timings = {}
+        start = perf_counter()
+        loaded = load(folder)
+        timings["load"] = perf_counter() - start
+        for label, analysis in (
+            ("transitions", transitions),
+            ("funnel", lambda e: funnel(e, ["intro", "hall", "attack_bob"])),
+            ("dwell times", dwell_times),
+            ("choices", choices),
+            ("endings", endings),
+        ):
+            start = perf_counter()
+            analysis(loaded)
+            timings[label] = perf_counter() - start
+        print("  ".join(f"{label} {seconds * 1e3:.0f} ms" for label, seconds in timings.items()))
+        print()
+        report(loaded)
+    finally:
+        shutil.rmtree(folder)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    commands = parser.add_subparsers(dest="command", required=True)
+    report_command = commands.add_parser("report", help="analyze a folder of events")
+    report_command.add_argument("folder")
+    test = commands.add_parser("bench", help="log and analyze millions of events")
+    test.add_argument("--events", type=int, default=2_000_000)
+    args = parser.parse_args()
+
+    if args.command == "report":
+        report(load(args.folder))
+    else:
+        bench(args.events)
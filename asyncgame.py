@@ -0,0 +1,346 @@
+"""
+ASYNCGAME.PY
+
+game.py's scenes as coroutines, so one event loop can run thousands of games.
+
+The async scenes are not a second copy of the story to keep in step with
+game.py. They are made from game.py itself when this module is first used:
+its source is rewritten so that every scene is an async function, every call
+to a gametools function (or to a scene, or to anything else that ends up
+waiting for the player) is awaited, and the gametools functions come from
+asyncgametools instead. Each game gets its own copy of the result, with its
+own game_state and inventory, so any number of games can share the process.
+
+    scenes = new_game()
+    with Session(reader, writer).activate():
+        await play(scenes["intro"])
+
+Run this file to host the game from a single event loop, or to compare it
+with a thread for every player:
+
+    python asyncgame.py serve --port 4000
+    python asyncgame.py bench
+"""
+
+import argparse
+import ast
+import asyncio
+import inspect
+import sys
+from functools import lru_cache
+
+import asyncgametools
+import gametools
+from asyncgametools import Session
+from scenegraph import GAME_PATH
+
+# The gametools functions that become coroutines.
+ASYNC_API = {"write", "write_md", "get_input", "get_choice", "clear", "pause", "spin"}
+
+
+class _Asyncify(ast.NodeTransformer):
+    """Make the named functions coroutines and await every call to them."""
+
+    def __init__(self, coroutines):
+        self.coroutines = coroutines
+
+    def visit_ImportFrom(self, node):
+        if node.module == "gametools":
+            node.module = "asyncgametools"
+        return node
+
+    def visit_FunctionDef(self, node):
+        self.generic_visit(node)
+        if node.name not in self.coroutines:
+            return node
+        return ast.copy_location(
+            ast.AsyncFunctionDef(
+                **{field: getattr(node, field) for field in node._fields}
+            ),
+            node,
+        )
+
+    def visit_Call(self, node):
+        self.generic_visit(node)
+        if isinstance(node.func, ast.Name) and node.func.id in self.coroutines:
+            return ast.copy_location(ast.Await(node), node)
+        return node
+
+
+def _waiting_functions(tree):
+    """Return the names of game.py's functions that wait, directly or through
+    other functions, on one of the gametools functions in ASYNC_API."""
+    calls = {
+        func.name: {
+            node.func.id
+            for node in ast.walk(func)
+            if isinstance(node, ast.Call) and isinstance(node.func, ast.Name)
+        }
+        for func in tree.body
+        if isinstance(func, ast.FunctionDef)
+    }
+    waiting = set(ASYNC_API)
+    while True:
+        more = {name for name, called in calls.items() if called & waiting}
+        if more <= waiting:
+            return waiting
+        waiting |= more
+
+
+@lru_cache(maxsize=None)
+def _compiled(path=GAME_PATH):
+    with open(path, encoding="utf-8") as source:
+        tree = ast.parse(source.read(), path)
+    # game.play() and the __main__ block are replaced by play() below.
+    tree.body = [
+        node
+        for node in tree.body
+        if not (isinstance(node, ast.FunctionDef) and node.name == "play")
+        and not (isinstance(node, ast.If) and "__main__" in ast.unparse(node.test))
+    ]
+    tree = ast.fix_missing_locations(_Asyncify(_waiting_functions(tree)).visit(tree))
+    return compile(tree, path, "exec")
+
+
+def new_game(path=GAME_PATH):
+    """Return a fresh copy of game.py's namespace with coroutine scenes."""
+    # The built-in exit() closes sys.stdin on its way out, under every other
+    # game in the process, and does not exist at all under python -S.
+    namespace = {
+        "__name__": "asyncgame.session",
+        "print": asyncgametools.print,
+        "exit": sys.exit,
+    }
+    exec(_compiled(path), namespace)
+    return namespace
+
+
+async def play(current_scene, on_scene=None):
+    """
+    Run scenes starting from current_scene until the game ends.
+    Scenes may be coroutine functions or plain ones.
+    If on_scene is given it is called with each scene just before it runs.
+    """
+    while current_scene is not None:
+        if on_scene:
+            on_scene(current_scene)
+        try:
+            current_scene = current_scene()
+            if inspect.isawaitable(current_scene):
+                current_scene = await current_scene
+        except SystemExit:
+            # allow clean exit from scenes with exit()
+            break
+
+
+async def play_session(session, scene="intro", on_scene=None):
+    """Play a new game from the named scene to the end for one session."""
+    scenes = new_game()
+    with session.activate():
+        await play(scenes[scene], on_scene)
+    await session.writer.drain()
+
+
+async def _handle(reader, writer, width, profile):
+    try:
+        await play_session(Session(reader, writer, width, profile))
+    except OSError:
+        pass  # the player hung up
+    finally:
+        writer.close()
+        try:
+            await writer.wait_closed()
+        except OSError:
+            pass
+
+
+async def serve(host="127.0.0.1", port=4000, width=80, profile="full", ready=None):
+    """Host the game, every player's game a task on this event loop."""
+    server = await asyncio.start_server(
+        lambda reader, writer: _handle(reader, writer, width, profile),
+        host,
+        port,
+        backlog=4096,
+    )
+    if ready:
+        ready(server.sockets[0].getsockname())
+    async with server:
+        await server.serve_forever()
+
+
+# Benchmark: the same sessions served by one event loop, or by one thread each.
+
+
+class _BlockingReader:
+    def __init__(self, conn):
+        self.file = conn.makefile("rb")
+
+    async def readline(self):
+        return self.file.readline()  # blocks this session's thread
+
+
+class _BlockingWriter:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def write(self, data):
+        self.conn.sendall(data)
+
+    async def drain(self):
+        pass
+
+
+class _ThreadSession(Session):
+    async def sleep(self, seconds):
+        import time
+
+        time.sleep(seconds)
+
+
+def _run_blocking(coroutine):
+    """Run a coroutine that never has to wait on an event loop."""
+    try:
+        coroutine.send(None)
+    except StopIteration as done:
+        return done.value
+    coroutine.close()
+    raise RuntimeError("a thread-per-session game tried to wait on an event loop")
+
+
+def _serve_threads(listener, sessions, width, profile):
+    import threading
+
+    def one(conn):
+        with conn:
+            try:
+                session = _ThreadSession(
+                    _BlockingReader(conn), _BlockingWriter(conn), width, profile
+                )
+                _run_blocking(play_session(session))
+            except OSError:
+                pass
+
+    threads = []
+    for _ in range(sessions):
+        conn, _ = listener.accept()
+        thread = threading.Thread(target=one, args=(conn,))
+        thread.start()
+        threads.append(thread)
+    for thread in threads:
+        thread.join()
+
+
+def _bench_server(mode, sessions, width, profile, pipe):
+    import resource
+    import socket
+
+    gametools.set_output_profile(profile)
+    new_game()  # compile the scenes before timing anything
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    if mode == "threads":
+        listener = socket.create_server(("127.0.0.1", 0), backlog=4096)
+        pipe.send(listener.getsockname())
+        _serve_threads(listener, sessions, width, profile)
+    else:
+
+        async def main():
+            done = asyncio.Event()
+            finished = [0]
+
+            async def handle(reader, writer):
+                await _handle(reader, writer, width, profile)
+                finished[0] += 1
+                if finished[0] == sessions:
+                    done.set()
+
+            server = await asyncio.start_server(
+                handle, "127.0.0.1", 0, backlog=4096
+            )
+            pipe.send(server.sockets[0].getsockname())
+            await done.wait()
+            server.close()
+
+        asyncio.run(main())
+
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    pipe.send((baseline, usage.ru_maxrss, usage.ru_utime + usage.ru_stime))
+
+
+async def _clients(address, sessions, answers, think):
+    """Play the given number of games at once, thinking before every answer."""
+
+    async def one():
+        reader, writer = await asyncio.open_connection(*address)
+
+        async def type_answers():
+            for answer in answers:
+                await asyncio.sleep(think)
+                writer.write(answer.encode() + b"\n")
+            writer.write_eof()
+
+        typing = asyncio.create_task(type_answers())
+        received = 0
+        while chunk := await reader.read(65536):
+            received += len(chunk)
+        typing.cancel()
+        writer.close()
+        return received
+
+    return await asyncio.gather(*(one() for _ in range(sessions)))
+
+
+def bench(counts=(100, 1000, 2000), think=0.05, width=80, profile="plain"):
+    """Serve many concurrent players with one event loop, and with a thread per
+    player, and compare the server's time, memory and CPU."""
+    import multiprocessing
+    import time
+
+    import playthrough
+
+    context = multiprocessing.get_context("fork")
+    print(
+        f"{'mode':<10}{'sessions':>9}{'wall':>9}{'peak rss':>11}"
+        f"{'per session':>13}{'cpu':>8}   bytes per session"
+    )
+    for count in counts:
+        for mode in ("threads", "asyncio"):
+            ours, theirs = context.Pipe()
+            server = context.Process(
+                target=_bench_server, args=(mode, count, width, profile, theirs)
+            )
+            server.start()
+            address = ours.recv()
+            start = time.perf_counter()
+            received = asyncio.run(
+                _clients(address, count, playthrough.WALKTHROUGH, think)
+            )
+            wall = time.perf_counter() - start
+            baseline, max_rss, cpu = ours.recv()
+            server.join()
+            sizes = sorted(set(received))
+            print(
+                f"{mode:<10}{count:>9}{wall:>8.2f}s{max_rss / 1024:>9.1f}MB"
+                f"{(max_rss - baseline) / count:>11.1f}KB{cpu:>7.2f}s   {sizes}"
+            )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    commands = parser.add_subparsers(dest="command", required=True)
+    serve_command = commands.add_parser("serve", help="host the game")
+    serve_command.add_argument("--host", default="127.0.0.1")
+    serve_command.add_argument("--port", type=int, default=4000)
+    serve_command.add_argument("--width", type=int, default=80)
+    serve_command.add_argument(
+        "--profile", choices=gametools.OUTPUT_PROFILES, default="full"
+    )
+    test = commands.add_parser("bench", help="compare with a thread per player")
+    test.add_argument("--sessions", type=int, nargs="*", default=[100, 1000, 2000])
+    test.add_argument("--think", type=float, default=0.05)
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        asyncio.run(serve(args.host, args.port, args.width, args.profile))
+    else:
+        bench(args.sessions, args.think)
@@ -0,0 +1,180 @@
+"""
+ASYNCGAMETOOLS.PY
+
+The gametools functions as coroutines, for scenes written as async functions.
+
+Every gametools function that waits for the player (get_choice, get_input,
+pause) or for time to pass (spin) blocks the thread that calls it, so a
+process can only run as many games at once as it has threads. Here they are
+coroutines instead: while one player is thinking, the event loop gets on with
+everybody else's game, and one thread can run thousands of games side by side.
+
+Each game belongs to a Session, which holds the player's connection and a
+console of its own. Activate it in the task that runs the game, and every
+function here (and every gametools function called from that task) renders to
+that player:
+
+    session = Session(reader, writer, width=80)
+    with session.activate():
+        await asyncgame.play(scenes["intro"])
+
+Input is read one line per prompt, just as gametools reads piped input: a
+number or the text of a choice for get_choice() (or a command, in
+gametools' parser mode), any line for pause().
+"""
+
+import asyncio
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+import gametools
+
+_session = ContextVar("asyncgametools_session")
+
+
+class Session:
+    """One player's game: their connection and the console that draws it.
+
+    reader needs an async readline() returning bytes (b"" once the player has
+    gone); writer needs write(bytes) and an async drain(), as asyncio's
+    streams have.
+    """
+
+    def __init__(
+        self,
+        reader,
+        writer,
+        width=80,
+        profile=None,
+        encoding="utf-8",
+        newline="\r\n",
+    ):
+        self.reader = reader
+        self.writer = writer
+        self._encoding = encoding
+        self._newline = newline
+        self.console = gametools._make_console(
+            width, profile or gametools.get_output_profile()
+        )
+        self.console.file = self
+
+    @contextmanager
+    def activate(self):
+        """Make this the session that everything in the current context
+        draws to and reads from."""
+        session = _session.set(self)
+        console = gametools._session_console.set(self.console)
+        try:
+            yield self
+        finally:
+            gametools._session_console.reset(console)
+            _session.reset(session)
+
+    # The console writes here.
+
+    @property
+    def encoding(self):
+        return self._encoding
+
+    def write(self, text):
+        text = text.replace("\n", self._newline)
+        self.writer.write(text.encode(self._encoding, "replace"))
+        return len(text)
+
+    def flush(self):
+        pass
+
+    def isatty(self):
+        return True
+
+    # Waiting for the player, or for time to pass.
+
+    async def read_line(self):
+        """Wait until the player has seen everything, then for a line.
+
+        Ends the game (with SystemExit, as gametools does at the end of piped
+        input) if the player has gone.
+        """
+        await self.writer.drain()
+        line = await self.reader.readline()
+        if not line:
+            raise SystemExit(0)
+        return line.decode(self._encoding, "replace").rstrip("\r\n")
+
+    async def sleep(self, seconds):
+        await asyncio.sleep(seconds)
+
+
+def current_session():
+    """Return the session active in the current context."""
+    return _session.get()
+
+
+def print(*values, sep=" ", end="\n"):
+    """The built-in print(), but to the current session's player."""
+    current_session().write(sep.join(str(value) for value in values) + end)
+
+
+async def write(content="", **options):
+    """Like gametools.write()."""
+    gametools.write(content, **options)
+
+
+async def write_md(content, style="", boxed=False):
+    """Like gametools.write_md()."""
+    gametools.write_md(content, style=style, boxed=boxed)
+
+
+async def clear():
+    """Like gametools.clear()."""
+    gametools.clear()
+
+
+async def get_choice(all_choices, hidden_choices=None):
+    """Like gametools.get_choice(), with the choices shown as a numbered list."""
+    choices, hidden_choices = gametools._visible_choices(all_choices, hidden_choices)
+    gametools.write(choices, numbered=True)
+    while True:
+        answer = await current_session().read_line()
+        choice = gametools._pick(answer, choices)
+        if choice is not None:
+            break
+        gametools.write(gametools._INVALID_INPUT)
+
+    return gametools._chosen(all_choices, gametools._unhide(choice, hidden_choices))
+
+
+async def get_input(
+    prompt_text="Enter Choice", choices=None, show_choices=True, min_length=0
+):
+    """Like gametools.get_input()."""
+    prompt_text, valid = gametools._input_rules(
+        prompt_text, choices, show_choices, min_length
+    )
+    gametools.write(prompt_text)
+    user_text = (await current_session().read_line()).strip()
+    while not valid(user_text):
+        gametools.write(gametools._INVALID_INPUT)
+        user_text = (await current_session().read_line()).strip()
+
+    gametools.write(f"{prompt_text}: {user_text}")
+    return user_text
+
+
+async def pause(message="Press any key to continue...", style="", justify="left"):
+    """Like gametools.pause(); any line of input continues."""
+    console = gametools._current_console()
+    console.print(message, style=style, justify=justify)
+    await current_session().read_line()
+    console.line()
+
+
+async def spin(seconds, message="", spinner=None):
+    """Like gametools.spin(), but only the message is shown.
+
+    Animating a spinner would mean redrawing it for every player several times
+    a second, for no more than a decoration.
+    """
+    if message:
+        gametools._current_console().print(message)
+    await current_session().sleep(seconds)
@@ -0,0 +1,73 @@
+"""
+BANDWIDTH.PY
+
+Reports how many bytes each scene sends to the terminal under every output
+profile, across the recorded playthrough in playthrough.py.
+
+Run it with: python bandwidth.py
+"""
+
+from collections import Counter
+
+import gametools
+import playthrough
+
+
+class _ByteMeter:
+    """A stand-in for sys.stdout that counts bytes instead of showing them.
+
+    It claims to be a terminal so rich emits exactly what a player would get.
+    """
+
+    encoding = "utf-8"
+
+    def __init__(self):
+        self.total = 0
+
+    def write(self, text):
+        self.total += len(text.encode("utf-8"))
+        return len(text)
+
+    def flush(self):
+        pass
+
+    def isatty(self):
+        return True
+
+
+def measure(profile, answers=playthrough.WALKTHROUGH, width=80):
+    """Replay the game under a profile and count the bytes sent per scene.
+
+    Returns a Counter mapping scene names to bytes. Scenes visited more than
+    once are added together.
+    """
+    meter = _ByteMeter()
+    per_scene = Counter()
+    current = [None, 0]
+
+    def on_scene(name):
+        if current[0]:
+            per_scene[current[0]] += meter.total - current[1]
+        current[0], current[1] = name, meter.total
+
+    playthrough.play_captured(
+        answers, on_scene=on_scene, output=meter, profile=profile, width=width
+    )
+    return per_scene
+
+
+def report(profiles=gametools.OUTPUT_PROFILES, width=80):
+    """Print a table of bytes per scene, one column per output profile."""
+    results = {profile: measure(profile, width=width) for profile in profiles}
+    scenes = list(results[profiles[-1]])
+
+    print(f"{'scene':<16}" + "".join(f"{profile:>12}" for profile in profiles))
+    for scene in scenes:
+        row = "".join(f"{results[profile][scene]:>12,}" for profile in profiles)
+        print(f"{scene:<16}{row}")
+    totals = "".join(f"{sum(results[p].values()):>12,}" for p in profiles)
+    print(f"{'TOTAL':<16}{totals}")
+
+
+if __name__ == "__main__":
+    report()
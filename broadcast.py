@@ -0,0 +1,459 @@
+"""
+BROADCAST.PY
+
+Lets any number of spectators watch one player's game as it is played.
+
+The player's session renders every scene once, as usual. Everything it
+writes is also encoded once into an immutable bytes chunk, and every
+spectator's send queue gets a memoryview of that same chunk: no matter how
+many people are watching, nothing is rendered, encoded or copied per
+spectator. A spectator whose socket only takes part of a chunk keeps a slice
+of the view for the rest, which is not a copy either.
+
+The chunks written since the last clear() make up the current screen (the
+latest frame). Someone who starts watching mid-game is sent that frame first,
+so they see the whole screen rather than half a scene. A spectator who falls
+too far behind is skipped ahead the same way, once the chunk they are part
+way through has gone out: skipping never cuts a chunk, or the escape codes
+in it, in half. A spectator who is already part way through the latest frame
+only skips ahead within it, so nothing is sent to them twice; and when a
+frame will not fit in max_pending (a plain game never clears the screen, so
+its frame is the whole game), only its newest chunks that do are sent.
+Spectators who hang up are noticed even while nothing is being sent to them.
+
+    python broadcast.py serve --port 4000 --watch-port 4001
+    python broadcast.py bench       # 1, 100 and 1000 spectators
+"""
+
+import argparse
+import io
+import selectors
+import socket
+import sys
+import threading
+import time
+from collections import deque
+from contextlib import nullcontext
+
+
+class _Spectator:
+    def __init__(self, sock):
+        self.sock = sock
+        self.pending = deque()  # memoryviews, oldest first
+        self.depth = 0
+        # once pending[0] has been handed to send(), the view it was cut from
+        self.sending = None
+        self.registered = False  # with the sender's selector, for reading
+        self.watching = False  # ...and for writing as well
+
+
+class Broadcast:
+    """Fans one session's output out to every spectator."""
+
+    def __init__(self, max_pending=256 * 1024):
+        self.max_pending = max_pending
+        self.frames = 0
+        self.bytes_published = 0
+        self.bytes_sent = 0
+        self.skipped_ahead = 0
+
+        self._frame = []  # a view of each chunk of the latest frame
+        self._in_frame = {}  # id() of each of those views: its index
+        self._latest = b""
+        self._spectators = {}
+        self._lock = threading.Lock()
+        self._closed = False
+        self._selector = selectors.DefaultSelector()
+        self._wake_read, self._wake_write = socket.socketpair()
+        self._wake_read.setblocking(False)
+        self._wake_write.setblocking(False)
+        self._woken = False
+        self._selector.register(self._wake_read, selectors.EVENT_READ)
+        self._sender = threading.Thread(target=self._send_loop, daemon=True)
+        self._sender.start()
+
+    @property
+    def spectators(self):
+        return len(self._spectators)
+
+    def latest_frame(self):
+        """Return everything written since the last new_frame(), as bytes."""
+        with self._lock:
+            return self._latest_frame()
+
+    def publish(self, data):
+        """Send already-encoded bytes to every spectator."""
+        if not data:
+            return
+        data = bytes(data)
+        view = memoryview(data)
+        with self._lock:
+            self._in_frame[id(view)] = len(self._frame)
+            self._frame.append(view)
+            self._latest = None
+            self.bytes_published += len(data)
+            for spectator in self._spectators.values():
+                if spectator.depth + len(data) > self.max_pending:
+                    self._skip_ahead(spectator)
+                else:
+                    spectator.pending.append(view)
+                    spectator.depth += len(data)
+            self._wake()
+
+    def new_frame(self):
+        """Start a new screen; late joiners are sent from here on."""
+        with self._lock:
+            self._frame = []
+            self._in_frame = {}
+            self._latest = b""
+            self.frames += 1
+
+    def watch(self, sock):
+        """Add a spectator, who is sent the latest frame straight away."""
+        sock.setblocking(False)
+        spectator = _Spectator(sock)
+        with self._lock:
+            self._skip_ahead(spectator)
+            self._spectators[sock] = spectator
+            self._wake()
+        return spectator
+
+    def close(self):
+        """Stop sending and hang up on every spectator."""
+        with self._lock:
+            self._closed = True
+            self._wake()
+        self._sender.join()
+        for sock in list(self._spectators):
+            sock.close()
+        self._spectators.clear()
+        self._wake_read.close()
+        self._wake_write.close()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "spectators": len(self._spectators),
+                "frames": self.frames,
+                "bytes_published": self.bytes_published,
+                "bytes_sent": self.bytes_sent,
+                "skipped_ahead": self.skipped_ahead,
+                "pending": sum(s.depth for s in self._spectators.values()),
+            }
+
+    # called with the lock held
+
+    def _latest_frame(self):
+        if self._latest is None:
+            self._latest = b"".join(self._frame)
+        return self._latest
+
+    def _skip_ahead(self, spectator):
+        kept = deque()
+        start = 0
+        if spectator.pending:
+            self.skipped_ahead += 1
+            head = spectator.sending
+            if head is None:
+                head = spectator.pending[0]
+            # If the spectator is already in the latest frame, the chunks of
+            # it before their oldest one have been sent.
+            position = self._in_frame.get(id(head))
+            if spectator.sending is not None:
+                # It is part sent, or being sent right now, so it stays and
+                # the skip starts after it.
+                kept.append(spectator.pending[0])
+                if position is not None:
+                    start = position + 1
+            elif position is not None:
+                start = position
+        # As much of the end of the frame as fits, but always its newest chunk
+        depth = sum(len(view) for view in kept)
+        end = len(self._frame)
+        first = end
+        while first > start and (
+            first == end or depth + len(self._frame[first - 1]) <= self.max_pending
+        ):
+            first -= 1
+            depth += len(self._frame[first])
+        kept.extend(self._frame[first:end])
+        spectator.pending = kept
+        spectator.depth = depth
+
+    def _wake(self):
+        if not self._woken:
+            self._woken = True
+            try:
+                self._wake_write.send(b"\0")
+            except BlockingIOError:
+                pass
+
+    # the sender thread
+
+    def _send_loop(self):
+        while True:
+            for key, events in self._selector.select():
+                if key.fileobj is self._wake_read:
+                    if not self._wake_up():
+                        return
+                    continue
+                if events & selectors.EVENT_READ:
+                    self._receive(key.data)
+                if events & selectors.EVENT_WRITE and key.data.registered:
+                    self._send(key.data)
+
+    def _wake_up(self):
+        try:
+            self._wake_read.recv(4096)
+        except BlockingIOError:
+            pass
+        with self._lock:
+            self._woken = False
+            if self._closed:
+                return False
+            for spectator in self._spectators.values():
+                if not spectator.registered:
+                    self._selector.register(
+                        spectator.sock, selectors.EVENT_READ, spectator
+                    )
+                    spectator.registered = True
+                if spectator.pending and not spectator.watching:
+                    self._selector.modify(
+                        spectator.sock,
+                        selectors.EVENT_READ | selectors.EVENT_WRITE,
+                        spectator,
+                    )
+                    spectator.watching = True
+        return True
+
+    def _receive(self, spectator):
+        # Spectators have nothing to say; all that matters is whether they
+        # have hung up, which they may well do while no frames are going out.
+        try:
+            if spectator.sock.recv(4096):
+                return
+        except BlockingIOError:
+            return
+        except OSError:
+            pass
+        self._drop(spectator)
+
+    def _drop(self, spectator):
+        with self._lock:
+            self._selector.unregister(spectator.sock)
+            spectator.registered = spectator.watching = False
+            del self._spectators[spectator.sock]
+        spectator.sock.close()
+
+    def _send(self, spectator):
+        while True:
+            with self._lock:
+                if not spectator.pending:
+                    self._selector.modify(
+                        spectator.sock, selectors.EVENT_READ, spectator
+                    )
+                    spectator.watching = False
+                    return
+                view = spectator.pending[0]
+                if spectator.sending is None:
+                    spectator.sending = view
+            try:
+                sent = spectator.sock.send(view)
+            except BlockingIOError:
+                return
+            except OSError:
+                self._drop(spectator)
+                return
+            with self._lock:
+                self.bytes_sent += sent
+                if spectator.pending and spectator.pending[0] is view:
+                    spectator.depth -= sent
+                    if sent < len(view):
+                        spectator.pending[0] = view[sent:]
+                        return
+                    spectator.pending.popleft()
+                    spectator.sending = None
+
+
+class BroadcastStream(io.TextIOBase):
+    """Use in place of a session's sys.stdout to broadcast what it writes.
+
+    Everything still goes to the player's own stream as before.
+    """
+
+    def __init__(self, player, broadcast, newline="\r\n"):
+        self.player = player
+        self.broadcast = broadcast
+        self._newline = newline
+
+    @property
+    def encoding(self):
+        return getattr(self.player, "encoding", None) or "utf-8"
+
+    def writable(self):
+        return True
+
+    def isatty(self):
+        return self.player.isatty()
+
+    def write(self, text):
+        self.player.write(text)
+        self.broadcast.publish(
+            text.replace("\n", self._newline).encode(self.encoding, "replace")
+        )
+        return len(text)
+
+    def flush(self):
+        self.player.flush()
+
+    def transient(self):
+        return getattr(self.player, "transient", nullcontext)()
+
+    def new_frame(self):
+        self.broadcast.new_frame()
+
+    def close(self):
+        self.player.close()
+        super().close()
+
+
+def serve(address, watch_address, width=80, profile="full"):
+    """Play one game at a time on address while anyone can watch it on
+    watch_address."""
+    import gametools
+    import host
+    from outqueue import OutputQueue
+
+    gametools.set_output_profile(profile)
+
+    broadcast = Broadcast()
+    players = socket.create_server(address)
+    watchers = socket.create_server(watch_address, backlog=512)
+
+    def accept_spectators():
+        while True:
+            conn, _ = watchers.accept()
+            broadcast.watch(conn)
+
+    threading.Thread(target=accept_spectators, daemon=True).start()
+    print(f"playing on {address[0]}:{address[1]}, "
+          f"watching on {watch_address[0]}:{watch_address[1]}", file=sys.stderr)
+    while True:
+        conn, _ = players.accept()
+        output = BroadcastStream(OutputQueue(conn), broadcast)
+        host.serve_session(conn, width, output)
+
+
+class _Sink:
+    """Stands in for the player's terminal in the benchmark."""
+
+    encoding = "utf-8"
+
+    def write(self, text):
+        return len(text)
+
+    def flush(self):
+        pass
+
+    def isatty(self):
+        return True
+
+    def close(self):
+        pass
+
+
+def bench(counts=(1, 100, 1000)):
+    """Time one playthrough broadcast to different numbers of spectators.
+
+    Rendering per spectator is estimated as that many renders of the game.
+    """
+    import playthrough
+
+    start = time.thread_time()
+    playthrough.play_captured(output=_Sink(), width=80)
+    render = time.thread_time() - start
+
+    print(
+        f"{'spectators':>10}{'publish cpu':>13}{'delivered':>12}"
+        f"{'all caught up':>15}{'render each (est.)':>20}"
+    )
+    for count in counts:
+        broadcast = Broadcast()
+        readers = []
+        for _ in range(count):
+            ours, theirs = socket.socketpair()
+            broadcast.watch(ours)
+            theirs.setblocking(False)
+            readers.append(theirs)
+
+        received = [0]
+        done = threading.Event()
+
+        def read_all():
+            selector = selectors.DefaultSelector()
+            for reader in readers:
+                selector.register(reader, selectors.EVENT_READ)
+            while not done.is_set() or received[0] < expected[0]:
+                for key, _ in selector.select(timeout=0.05):
+                    try:
+                        received[0] += len(key.fileobj.recv(65536))
+                    except BlockingIOError:
+                        pass
+            selector.close()
+
+        expected = [float("inf")]
+        reader = threading.Thread(target=read_all)
+        reader.start()
+
+        wall = time.perf_counter()
+        cpu = time.thread_time()
+        playthrough.play_captured(
+            output=BroadcastStream(_Sink(), broadcast), width=80
+        )
+        cpu = time.thread_time() - cpu
+        expected[0] = broadcast.bytes_published * count
+        done.set()
+        reader.join()
+        wall = time.perf_counter() - wall
+
+        print(
+            f"{count:>10}{cpu * 1e3:>11.1f}ms{received[0] / 1e6:>10.2f}MB"
+            f"{wall * 1e3:>13.1f}ms{render * count * 1e3:>18.0f}ms"
+        )
+
+        late, theirs = socket.socketpair()
+        broadcast.watch(late)
+        joined = b""
+        while len(joined) < len(broadcast.latest_frame()):
+            joined += theirs.recv(65536)
+        broadcast.close()
+        for sock in readers + [theirs]:
+            sock.close()
+    print(f"a late joiner is sent the latest frame: {len(joined):,} bytes")
+
+
+if __name__ == "__main__":
+    import gametools
+
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    commands = parser.add_subparsers(dest="command", required=True)
+    serve_command = commands.add_parser("serve", help="host a game to watch")
+    serve_command.add_argument("--host", default="127.0.0.1")
+    serve_command.add_argument("--port", type=int, default=4000)
+    serve_command.add_argument("--watch-port", type=int, default=4001)
+    serve_command.add_argument("--width", type=int, default=80)
+    serve_command.add_argument(
+        "--profile", choices=gametools.OUTPUT_PROFILES, default="full"
+    )
+    commands.add_parser("bench", help="time 1, 100 and 1000 spectators")
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        serve(
+            (args.host, args.port),
+            (args.host, args.watch_port),
+            args.width,
+            args.profile,
+        )
+    else:
+        bench()
@@ -0,0 +1,187 @@
+"""
+BUILD.PY
+
+Bundles the game into a single self-contained zipapp (dist/redfacility.pyz)
+for hosts that should not need anything installed besides Python.
+
+The bundle holds game.py, its helper modules and every pure-Python package
+they import (rich, beaupy and their own dependencies), all compiled ahead of
+time to .pyc files that never need re-checking against their source. When it
+starts it cuts sys.path down to the bundle and the standard library, so no
+import wastes time searching site-packages.
+
+    python build.py              # build dist/redfacility.pyz
+    python build.py --bench      # build, then time startup and a playthrough
+    python -I -S dist/redfacility.pyz
+"""
+
+import argparse
+import compileall
+import os
+import py_compile
+import re
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import zipapp
+from importlib.metadata import distribution
+
+import playthrough
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+DIST = os.path.join(HERE, "dist")
+TARGET = os.path.join(DIST, "redfacility.pyz")
+
+GAME_MODULES = ["game.py", "gametools.py", "encounters.py"]
+REQUIREMENTS = ["rich", "beaupy"]
+
+MAIN = '''\
+import builtins
+import sys
+
+# Only look for modules in this bundle and the standard library.
+sys.path[:] = [sys.path[0]] + [
+    path for path in sys.path[1:] if "-packages" not in path
+]
+
+import game
+
+# The scenes end the game with exit(), which python -S never installs.
+builtins.exit = sys.exit
+game.play()
+'''
+
+
+def _requirement_names(dist):
+    for requirement in dist.requires or []:
+        if "extra ==" in requirement.replace("extra==", "extra =="):
+            continue
+        yield re.match(r"[A-Za-z0-9._-]+", requirement).group(0)
+
+
+def _collect(names):
+    """Return every distribution needed by the named ones, dependencies too."""
+    found = {}
+    waiting = list(names)
+    while waiting:
+        dist = distribution(waiting.pop())
+        name = dist.metadata["Name"].lower()
+        if name in found:
+            continue
+        found[name] = dist
+        waiting.extend(_requirement_names(dist))
+    return list(found.values())
+
+
+def _copy_distribution(dist, staging):
+    for path in dist.files or []:
+        if path.parts[0] == ".." or path.suffix in (".pyc", ".so", ".pyd"):
+            continue
+        source = dist.locate_file(path)
+        if not os.path.isfile(source):
+            continue
+        target = os.path.join(staging, *path.parts)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        shutil.copy2(source, target)
+
+
+def _precompile(staging):
+    """Compile every module to a .pyc next to it and drop the source, which
+    is where zipimport looks for compiled modules."""
+    compileall.compile_dir(
+        staging,
+        quiet=1,
+        legacy=True,
+        optimize=0,
+        invalidation_mode=py_compile.PycInvalidationMode.UNCHECKED_HASH,
+    )
+    for folder, _, files in os.walk(staging):
+        for name in files:
+            if name.endswith(".py") and name != "__main__.py":
+                if os.path.exists(os.path.join(folder, name + "c")):
+                    os.remove(os.path.join(folder, name))
+
+
+def build(target=TARGET, interpreter="/usr/bin/env python3"):
+    """Build the bundle and return its path."""
+    with tempfile.TemporaryDirectory() as staging:
+        for module in GAME_MODULES:
+            shutil.copy2(os.path.join(HERE, module), staging)
+        for dist in _collect(REQUIREMENTS):
+            _copy_distribution(dist, staging)
+        with open(os.path.join(staging, "__main__.py"), "w") as main:
+            main.write(MAIN)
+        _precompile(staging)
+
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        zipapp.create_archive(staging, target, interpreter=interpreter)
+    return target
+
+
+def startup_times(command, runs=20, env=None, answers=b""):
+    """Return the median seconds from starting command until the first byte
+    of intro() arrives on its stdout, and until the game has ended.
+
+    The game is fed answers on its stdin; it fails unless they carry it to an
+    ending it leaves through cleanly.
+    """
+    first, whole = [], []
+    for _ in range(runs):
+        start = time.perf_counter()
+        process = subprocess.Popen(
+            command,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            cwd=HERE,
+            env=env,
+        )
+        process.stdout.read(1)
+        first.append(time.perf_counter() - start)
+        process.stdin.write(answers)
+        process.stdin.close()
+        process.stdout.read()
+        errors = process.stderr.read()
+        if process.wait() != 0 or errors:
+            raise RuntimeError(f"{' '.join(command)} failed:\n{errors.decode()}")
+        whole.append(time.perf_counter() - start)
+    return statistics.median(first), statistics.median(whole)
+
+
+def bench(target=TARGET):
+    """Compare startup of the plain scripts with the bundle, each played
+    through the walkthrough to its ending."""
+    python = sys.executable
+    answers = "".join(answer + "\n" for answer in playthrough.WALKTHROUGH).encode()
+    with tempfile.TemporaryDirectory() as empty:
+        # A fresh host has no __pycache__ yet: point Python at an empty cache
+        # it may not write to, so every module is compiled on every start.
+        cold = dict(
+            os.environ, PYTHONPYCACHEPREFIX=empty, PYTHONDONTWRITEBYTECODE="1"
+        )
+        runs = {
+            "python game.py (cold)": ([python, "game.py"], cold),
+            "python game.py (cached)": ([python, "game.py"], None),
+            "python redfacility.pyz": ([python, target], None),
+            "python -I -S redfacility.pyz": ([python, "-I", "-S", target], None),
+        }
+        for label, (command, env) in runs.items():
+            first, whole = startup_times(command, env=env, answers=answers)
+            print(
+                f"{label:<30} {first * 1e3:8.1f} ms to the first frame, "
+                f"{whole * 1e3:8.1f} ms to the ending"
+            )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bundle the game as a zipapp.")
+    parser.add_argument("--bench", action="store_true", help="time startup too")
+    args = parser.parse_args()
+
+    path = build()
+    print(f"built {path} ({os.path.getsize(path) / 1024:,.0f} KiB)")
+    if args.bench:
+        bench(path)
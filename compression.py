@@ -0,0 +1,290 @@
+"""
+COMPRESSION.PY
+
+Optional compression of everything sent to a networked player.
+
+Scene text is very repetitive: players walk back and forth through the same
+rooms, and every room is drawn with the same styling codes. A single zlib
+stream kept open for the whole connection remembers what it has already sent,
+so a second visit costs a fraction of the first. The stream also starts from
+a preset dictionary made of game.py's own text, so even a first visit finds
+most of its words and sentences already there.
+
+Compression is negotiated the way MUD clients expect (MCCP2, telnet option
+86): the server offers IAC WILL COMPRESS2, and if the client answers
+IAC DO COMPRESS2, the server sends IAC SB COMPRESS2 IAC SE and everything after
+it is one zlib stream. The preset dictionary is offered the same way, as the
+private telnet option SCENE_DICTIONARY. Clients that do not answer it (every
+ordinary MUD client) get a stream without one. The stream is flushed every
+time the game waits for input, so the player always sees a whole frame.
+
+Run this file for the compression ratio and CPU cost of every scene in the
+recorded playthrough.
+"""
+
+import ast
+import io
+import socket
+import time
+import zlib
+from functools import lru_cache
+from textwrap import dedent
+
+from scenegraph import GAME_PATH
+
+IAC, DONT, DO, WONT, WILL, SB, SE = 255, 254, 253, 252, 251, 250, 240
+COMPRESS2 = 86
+SCENE_DICTIONARY = 199  # private: "use game.py's text as a preset dictionary"
+
+START_COMPRESSION = bytes([IAC, SB, COMPRESS2, IAC, SE])
+
+_MAX_DICTIONARY = 32 * 1024  # zlib only looks back this far
+
+
+@lru_cache(maxsize=None)
+def scene_dictionary(path=GAME_PATH):
+    """Return the preset dictionary: every piece of text in game.py.
+
+    Clients must build it from the same game.py, byte for byte; zlib checks
+    this and refuses a stream made with a different dictionary.
+    """
+    with open(path, encoding="utf-8") as source:
+        tree = ast.parse(source.read())
+    texts = [
+        dedent(node.value).strip()
+        for node in ast.walk(tree)
+        if isinstance(node, ast.Constant)
+        and isinstance(node.value, str)
+        and len(node.value) >= 8
+    ]
+    return "\n".join(texts).encode("utf-8")[-_MAX_DICTIONARY:]
+
+
+class Compressor:
+    """One connection's zlib stream, with counters for what it has cost."""
+
+    def __init__(self, dictionary=None, level=6):
+        if dictionary:
+            self._stream = zlib.compressobj(level, zdict=dictionary)
+        else:
+            self._stream = zlib.compressobj(level)
+        self.dictionary = bool(dictionary)
+        self.raw_bytes = 0
+        self.wire_bytes = 0
+        self.cpu_seconds = 0.0
+
+    def compress(self, data, flush=True):
+        """Compress data; with flush, return everything needed to show it."""
+        start = time.thread_time()
+        out = self._stream.compress(data)
+        if flush:
+            out += self._stream.flush(zlib.Z_SYNC_FLUSH)
+        self.cpu_seconds += time.thread_time() - start
+        self.raw_bytes += len(data)
+        self.wire_bytes += len(out)
+        return out
+
+    def finish(self):
+        """End the stream; the connection is uncompressed again after this."""
+        out = self._stream.flush(zlib.Z_FINISH)
+        self.wire_bytes += len(out)
+        return out
+
+    @property
+    def ratio(self):
+        return self.raw_bytes / self.wire_bytes if self.wire_bytes else 1.0
+
+
+def negotiate(conn, dictionary=None, timeout=0.5):
+    """Offer compression to a freshly connected player.
+
+    Returns a Compressor if the client accepted, after sending the marker
+    that starts the stream, or None if it refused or did not answer within
+    timeout seconds. Only telnet negotiation is read from the socket; anything
+    the player has typed is left for the game.
+    """
+    offers = bytes([IAC, WILL, COMPRESS2])
+    waiting = {COMPRESS2}
+    if dictionary:
+        offers += bytes([IAC, WILL, SCENE_DICTIONARY])
+        waiting.add(SCENE_DICTIONARY)
+    conn.sendall(offers)
+
+    accepted = set()
+    deadline = time.monotonic() + timeout
+    try:
+        while waiting and time.monotonic() < deadline:
+            conn.settimeout(max(deadline - time.monotonic(), 0.001))
+            try:
+                data = conn.recv(64, socket.MSG_PEEK)
+            except socket.timeout:
+                break
+            if not data or data[0] != IAC:
+                break  # the player has started typing, or hung up
+            used = 0
+            while len(data) - used >= 3 and data[used] == IAC:
+                verb, option = data[used + 1], data[used + 2]
+                if verb not in (WILL, WONT, DO, DONT):
+                    break
+                if option in waiting and verb in (DO, DONT):
+                    waiting.discard(option)
+                    if verb == DO:
+                        accepted.add(option)
+                used += 3
+            if used:
+                conn.recv(used)
+            else:
+                time.sleep(0.01)  # only part of a command has arrived
+    finally:
+        conn.settimeout(None)
+
+    if COMPRESS2 not in accepted:
+        return None
+    conn.sendall(START_COMPRESSION)
+    return Compressor(dictionary if SCENE_DICTIONARY in accepted else None)
+
+
+class TelnetInput(io.RawIOBase):
+    """A player's input with the telnet commands taken out.
+
+    Telnet clients mix commands into what the player types: answers to the
+    options offered by negotiate() that arrive late, window sizes (NAWS
+    subnegotiations) and the NUL they send after every carriage return. The
+    game only ever sees the typed text. UTF-8 text never contains the IAC
+    byte, so the filter is safe for clients that do not speak telnet at all.
+    Wrap it in io.BufferedReader to read it as a stream.
+    """
+
+    def __init__(self, conn):
+        self.conn = conn
+        self._held = b""  # the start of a command split across reads
+        self._after_cr = False
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while True:
+            data = self.conn.recv(len(buffer))
+            if not data:
+                return 0
+            text = self._filter(self._held + data)
+            if text:
+                buffer[: len(text)] = text
+                return len(text)
+
+    def _filter(self, data):
+        out = bytearray()
+        pos = 0
+        while pos < len(data):
+            byte = data[pos]
+            if byte != IAC:
+                if byte or not self._after_cr:  # CR NUL is a bare CR
+                    out.append(byte)
+                self._after_cr = byte == 13
+                pos += 1
+                continue
+            if pos + 1 >= len(data):
+                break
+            command = data[pos + 1]
+            if command == IAC:  # an escaped 255
+                out.append(IAC)
+                self._after_cr = False
+                length = 2
+            elif command in (WILL, WONT, DO, DONT):
+                length = 3
+            elif command == SB:
+                end = data.find(bytes([IAC, SE]), pos + 2)
+                length = end + 2 - pos if end >= 0 else len(data) + 1
+            else:
+                length = 2
+            if pos + length > len(data):
+                break
+            pos += length
+        self._held = data[pos:]
+        return bytes(out)
+
+
+def _record(profile="full", width=80):
+    """Replay the recorded playthrough and return what it sent, as a list of
+    (scene, bytes) with one entry every time the game waited for input."""
+    import playthrough
+
+    class Recorder:
+        encoding = "utf-8"
+
+        def __init__(self):
+            self.frames = []
+            self.scene = None
+            self.text = []
+
+        def write(self, text):
+            self.text.append(text)
+            return len(text)
+
+        def flush(self):
+            if self.text:
+                data = "".join(self.text).replace("\n", "\r\n").encode("utf-8")
+                self.frames.append((self.scene, data))
+                self.text = []
+
+        def isatty(self):
+            return True
+
+    recorder = Recorder()
+
+    def on_scene(name):
+        recorder.flush()
+        recorder.scene = name
+
+    playthrough.play_captured(
+        on_scene=on_scene, output=recorder, profile=profile, width=width
+    )
+    return recorder.frames
+
+
+def report(profile="full", width=80):
+    """Print bytes on the wire and CPU cost per scene of the playthrough,
+    compressing every frame on its own and as one stream with and without
+    the preset dictionary."""
+    frames = _record(profile, width)
+    dictionary = scene_dictionary()
+    streams = {"stream": Compressor(), "+dictionary": Compressor(dictionary)}
+
+    scenes = {}
+    for scene, data in frames:
+        row = scenes.setdefault(
+            scene, {"raw": 0, "frames": 0, "stream": 0, "+dictionary": 0, "cpu": 0.0}
+        )
+        row["raw"] += len(data)
+        row["frames"] += len(zlib.compress(data))
+        for label, compressor in streams.items():
+            before, cpu = compressor.wire_bytes, compressor.cpu_seconds
+            compressor.compress(data)
+            row[label] += compressor.wire_bytes - before
+            if label == "+dictionary":
+                row["cpu"] += compressor.cpu_seconds - cpu
+
+    print(
+        f"{'scene':<20}{'raw':>8}{'per frame':>11}{'stream':>9}"
+        f"{'+dictionary':>13}{'ratio':>7}{'cpu us':>9}"
+    )
+    totals = dict.fromkeys(["raw", "frames", "stream", "+dictionary", "cpu"], 0)
+    for scene, row in scenes.items():
+        for key in totals:
+            totals[key] += row[key]
+        print(
+            f"{scene:<20}{row['raw']:>8,}{row['frames']:>11,}{row['stream']:>9,}"
+            f"{row['+dictionary']:>13,}{row['raw'] / row['+dictionary']:>6.1f}x"
+            f"{row['cpu'] * 1e6:>9.0f}"
+        )
+    print(
+        f"{'TOTAL':<20}{totals['raw']:>8,}{totals['frames']:>11,}"
+        f"{totals['stream']:>9,}{totals['+dictionary']:>13,}"
+        f"{totals['raw'] / totals['+dictionary']:>6.1f}x{totals['cpu'] * 1e6:>9.0f}"
+    )
+    print(f"preset dictionary: {len(dictionary):,} bytes")
+
+
+if __name__ == "__main__":
+    report()
@@ -0,0 +1,230 @@
+"""
+ENCOUNTERS.PY
+
+Stat-based fights for the game's encounters.
+
+Every fighter has hit points, damage and a chance to hit, and items in the
+player's inventory modify the player's stats. A fight is a series of rounds in
+which the player strikes first and the enemy strikes back, until one of them
+drops or the round limit runs out (the player got away).
+
+Each fight is driven by an integer seed, and the random numbers are derived
+from the seed and the round number alone. That makes a single fight resolved
+with resolve() come out exactly the same as the same fight in a batch run with
+simulate(), which uses NumPy to play out millions of fights at once for
+balancing. NumPy is only needed for simulate().
+
+Run this file to benchmark simulate() against a plain Python loop.
+"""
+
+import random
+from dataclasses import dataclass, replace
+
+DIED = 0
+WON = 1
+ESCAPED = 2
+
+OUTCOMES = ("died", "won", "escaped")
+
+
+@dataclass(frozen=True)
+class Fighter:
+    """The stats one side of a fight is resolved with."""
+
+    name: str
+    hp: int
+    damage: int
+    hit_chance: float
+
+
+PLAYER = Fighter("You", hp=20, damage=2, hit_chance=0.6)
+
+# How each item changes the player's stats when it is in the inventory.
+ITEM_MODIFIERS = {
+    "Pipe Spear": {"damage": 10, "hit_chance": 0.25},
+    "Adrenaline Shot": {"hp": 10},
+}
+
+B0B = Fighter("B-0B", hp=36, damage=9, hit_chance=0.45)
+PHARMACY_CREATURE = Fighter("Pharmacy Creature", hp=30, damage=12, hit_chance=0.5)
+
+# Ways of getting away from an enemy instead of fighting it. The player does
+# not strike back, the enemy's chance to hit is replaced, and surviving until
+# the round limit means the player got away.
+TACTICS = {
+    "Run": {"max_rounds": 2, "hit_chance": 0.3},
+    "Hide": {"max_rounds": 3, "hit_chance": 0.15},
+    "Freeze": {"max_rounds": 6, "hit_chance": 0.9},
+}
+
+
+def player_stats(inventory, base=PLAYER):
+    """Return the player's stats with every item in the inventory applied."""
+    stats = {"hp": base.hp, "damage": base.damage, "hit_chance": base.hit_chance}
+    for item in inventory:
+        for stat, bonus in ITEM_MODIFIERS.get(item, {}).items():
+            stats[stat] += bonus
+    stats["hit_chance"] = min(stats["hit_chance"], 1.0)
+    return replace(base, **stats)
+
+
+@dataclass
+class Result:
+    """How a single fight ended."""
+
+    outcome: int
+    rounds: int
+    player_hp: int
+    enemy_hp: int
+
+    @property
+    def name(self):
+        return OUTCOMES[self.outcome]
+
+
+_MASK = (1 << 64) - 1
+
+
+def _roll(seed, draw):
+    # splitmix64 of the seed and the draw number, scaled to [0, 1)
+    z = ((seed << 16) + draw + 0x9E3779B97F4A7C15) & _MASK
+    z = ((z ^ (z >> 30)) * 0xBF58476D1CE4E5B9) & _MASK
+    z = ((z ^ (z >> 27)) * 0x94D049BB133111EB) & _MASK
+    z ^= z >> 31
+    return (z >> 11) * 2.0**-53
+
+
+def new_seed():
+    """Return a fresh random seed for a fight."""
+    return random.getrandbits(47)
+
+
+def resolve(player, enemy, seed=None, max_rounds=20):
+    """Fight it out between the player and an enemy, one round at a time."""
+    if seed is None:
+        seed = new_seed()
+    player_hp, enemy_hp = player.hp, enemy.hp
+    for rnd in range(max_rounds):
+        if player.damage and _roll(seed, 2 * rnd) < player.hit_chance:
+            enemy_hp -= player.damage
+            if enemy_hp <= 0:
+                return Result(WON, rnd + 1, player_hp, enemy_hp)
+        if _roll(seed, 2 * rnd + 1) < enemy.hit_chance:
+            player_hp -= enemy.damage
+            if player_hp <= 0:
+                return Result(DIED, rnd + 1, player_hp, enemy_hp)
+    return Result(ESCAPED, max_rounds, player_hp, enemy_hp)
+
+
+def flee(player, enemy, tactic, seed=None):
+    """Try to get away from an enemy using one of the TACTICS."""
+    rules = TACTICS[tactic]
+    return resolve(
+        replace(player, damage=0),
+        replace(enemy, hit_chance=rules["hit_chance"]),
+        seed,
+        rules["max_rounds"],
+    )
+
+
+def numpy_for(purpose):
+    """Import NumPy and return it; if it is missing, say that purpose needs it.
+
+    Modules import it on first use through here: the game itself never needs
+    NumPy, and importing it would slow down every start of game.py.
+    """
+    try:
+        import numpy
+    except ImportError:
+        raise ImportError(f"{purpose} needs numpy: pip install numpy") from None
+    return numpy
+
+
+def _roll_array(np, seeds, draw):
+    z = (seeds << np.uint64(16)) + np.uint64(draw + 0x9E3779B97F4A7C15)
+    z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    z ^= z >> np.uint64(31)
+    return (z >> np.uint64(11)).astype(np.float64) * 2.0**-53
+
+
+def simulate(
+    player_hp, player_damage, player_hit_chance, enemy, seeds, max_rounds=20
+):
+    """Resolve a whole batch of fights against one enemy at once.
+
+    The player stats may each be a single number or an array with one entry
+    per fight, and seeds is an array with one seed per fight. Returns a tuple
+    of arrays (outcomes, rounds, player_hp), where outcomes holds DIED, WON or
+    ESCAPED for every fight.
+    """
+    np = numpy_for("simulate()")
+    seeds = np.asarray(seeds, dtype=np.uint64)
+    count = seeds.shape[0]
+    player_hp = np.broadcast_to(np.asarray(player_hp, dtype=np.int64), count).copy()
+    player_damage = np.broadcast_to(np.asarray(player_damage, dtype=np.int64), count)
+    player_hit_chance = np.broadcast_to(
+        np.asarray(player_hit_chance, dtype=np.float64), count
+    )
+    enemy_hp = np.full(count, enemy.hp, dtype=np.int64)
+    outcomes = np.full(count, ESCAPED, dtype=np.int8)
+    rounds = np.full(count, max_rounds, dtype=np.int32)
+    active = np.ones(count, dtype=bool)
+
+    for rnd in range(max_rounds):
+        hits = (
+            active
+            & (player_damage > 0)
+            & (_roll_array(np, seeds, 2 * rnd) < player_hit_chance)
+        )
+        enemy_hp -= np.where(hits, player_damage, 0)
+        won = active & (enemy_hp <= 0)
+        outcomes[won] = WON
+        rounds[won] = rnd + 1
+        active &= ~won
+
+        hits = active & (_roll_array(np, seeds, 2 * rnd + 1) < enemy.hit_chance)
+        player_hp -= np.where(hits, enemy.damage, 0)
+        died = active & (player_hp <= 0)
+        outcomes[died] = DIED
+        rounds[died] = rnd + 1
+        active &= ~died
+
+        if not active.any():
+            break
+
+    return outcomes, rounds, player_hp
+
+
+if __name__ == "__main__":
+    from time import perf_counter
+
+    try:
+        np = numpy_for("simulate()")
+    except ImportError as error:
+        raise SystemExit(error)
+
+    fights = 1_000_000
+    seeds = np.arange(fights, dtype=np.uint64)
+    loadouts = {
+        "bare hands": player_stats([]),
+        "pipe spear": player_stats(["Pipe Spear"]),
+    }
+
+    for label, player in loadouts.items():
+        start = perf_counter()
+        outcomes, _, _ = simulate(
+            player.hp, player.damage, player.hit_chance, B0B, seeds
+        )
+        batch_time = perf_counter() - start
+
+        sample = 100_000
+        start = perf_counter()
+        looped = [resolve(player, B0B, seed).outcome for seed in range(sample)]
+        loop_time = (perf_counter() - start) * fights / sample
+
+        assert looped == outcomes[:sample].tolist()
+        win_rate = (outcomes == WON).mean()
+        print(f"{label:>10} vs B-0B: win rate {win_rate:6.1%}")
+        print(f"{'':>10}   numpy batch   {batch_time:8.3f} s for {fights:,} fights")
+        print(f"{'':>10}   python loop   {loop_time:8.3f} s (estimated)")
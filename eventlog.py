@@ -0,0 +1,297 @@
+"""
+EVENTLOG.PY
+
+A log of everything that happens to a player's game, as a list of events:
+a flag was set, an item was gained, a scene was entered, the game was reset.
+
+Any point of a game can be rebuilt by applying the events up to it, one after
+another, starting from a new game. To keep that cheap the log also takes a
+snapshot (see snapshots.py) every few events, so a rebuild starts from the
+closest snapshot and only applies the events logged after it. Compacting the
+log throws away the events and snapshots older than the latest snapshot,
+once the history before it is no longer needed.
+
+Recording a game logs the state changes game.py reports and every scene that
+starts, including the ones a scene calls directly instead of returning (see
+scenegraph.watching_scenes). Events can be streamed to another process as
+JSON lines, where a log can be built back up from them:
+
+    log = EventLog()
+    with log.recording():
+        game.play(game.intro)
+    log.rebuild()                 # the Snapshot the game ended on
+    log.subscribe(pipe.write, since=0)
+    ...
+    copy = EventLog.from_lines(lines)
+
+A log that has been compacted can only stream from its oldest snapshot on,
+so the copy has to start from that snapshot too:
+
+    applied, state = log.snapshots[0]
+    log.subscribe(pipe.write, since=applied)
+    ...
+    copy = EventLog.from_lines(lines, base=state, start=applied)
+
+Run this file to benchmark appending and rebuilding.
+"""
+
+import json
+from bisect import bisect_right
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import ClassVar
+
+import game
+from scenegraph import watching_scenes
+from snapshots import Snapshot
+
+NEW_GAME = Snapshot("intro")
+
+
+@dataclass(frozen=True)
+class FlagSet:
+    """A flag was added to game_state."""
+
+    flag: str
+    kind: ClassVar[str] = "flag"
+
+    def apply(self, state):
+        return state.fork(game_state=state.game_state + (self.flag,))
+
+
+@dataclass(frozen=True)
+class ItemGained:
+    """An item was added to the inventory."""
+
+    item: str
+    kind: ClassVar[str] = "item"
+
+    def apply(self, state):
+        return state.fork(inventory=state.inventory + (self.item,))
+
+
+@dataclass(frozen=True)
+class SceneEntered:
+    """A scene started to run."""
+
+    scene: str
+    kind: ClassVar[str] = "scene"
+
+    def apply(self, state):
+        return state.fork(scene=self.scene)
+
+
+@dataclass(frozen=True)
+class GameReset:
+    """game_state and inventory were emptied for a new game."""
+
+    kind: ClassVar[str] = "reset"
+
+    def apply(self, state):
+        return state.fork(game_state=(), inventory=())
+
+
+EVENT_TYPES = {
+    event.kind: event for event in (FlagSet, ItemGained, SceneEntered, GameReset)
+}
+
+
+def dumps(seq, event):
+    """Encode one event, with its place in the log, as a line of JSON."""
+    fields = dict(vars(event), seq=seq, kind=event.kind)
+    return json.dumps(fields, separators=(",", ":")) + "\n"
+
+
+def loads(line):
+    """Decode a line written by dumps(); return (seq, event)."""
+    fields = json.loads(line)
+    seq = fields.pop("seq")
+    return seq, EVENT_TYPES[fields.pop("kind")](**fields)
+
+
+class EventLog:
+    """An append-only list of events with a snapshot every few events.
+
+    Events are numbered from 0 in the order they were appended; the numbers
+    stay the same after compaction. A log can also start part way through a
+    game: base is then the state after the first start events, which the log
+    does not have.
+    """
+
+    def __init__(self, snapshot_every=64, base=NEW_GAME, start=0):
+        self.snapshot_every = snapshot_every
+        self.events = []
+        self.start = start  # the number of the first event still in the log
+        # (number of events applied, state); the first is the base state
+        self.snapshots = [(start, base)]
+        self._subscribers = []
+
+    def __len__(self):
+        """The number of events appended over the log's whole life."""
+        return self.start + len(self.events)
+
+    def append(self, event):
+        """Add an event to the end of the log and return its number."""
+        seq = len(self)
+        self.events.append(event)
+        for subscriber in self._subscribers:
+            subscriber(dumps(seq, event))
+        if self.snapshot_every and (seq + 1) % self.snapshot_every == 0:
+            self.snapshots.append((seq + 1, self.rebuild()))
+        return seq
+
+    def rebuild(self, upto=None):
+        """Return the state after the first upto events (default: all of them).
+
+        Only the events after the closest snapshot are applied.
+        """
+        upto = len(self) if upto is None else upto
+        if not self.start <= upto <= len(self):
+            raise IndexError(f"event {upto} is not in the log")
+        index = bisect_right(self.snapshots, upto, key=lambda item: item[0]) - 1
+        applied, state = self.snapshots[index]
+        for event in self.events[applied - self.start : upto - self.start]:
+            state = event.apply(state)
+        return state
+
+    def history(self, since=None):
+        """Yield (number, event) for every event still in the log."""
+        since = self.start if since is None else max(since, self.start)
+        for offset, event in enumerate(self.events[since - self.start :]):
+            yield since + offset, event
+
+    def compact(self):
+        """Drop every event and snapshot older than the latest snapshot.
+
+        The log can no longer rebuild, audit or stream anything from before
+        that snapshot. Returns the number of events dropped.
+        """
+        applied, _ = self.snapshots[-1]
+        dropped = applied - self.start
+        del self.events[:dropped]
+        del self.snapshots[:-1]
+        self.start = applied
+        return dropped
+
+    def subscribe(self, send, since=None):
+        """Call send() with a JSON line (see dumps) for every event.
+
+        Events still in the log from number since onward are sent first;
+        without since, only new events are sent.
+        """
+        if since is not None:
+            for seq, event in self.history(since):
+                send(dumps(seq, event))
+        self._subscribers.append(send)
+        return send
+
+    def unsubscribe(self, send):
+        self._subscribers.remove(send)
+
+    @classmethod
+    def from_lines(cls, lines, snapshot_every=64, base=NEW_GAME, start=0):
+        """Build a log from JSON lines written by dumps().
+
+        The lines must start at event start, applied to base: event 0 and a
+        new game unless they were streamed from a compacted log.
+        """
+        log = cls(snapshot_every, base, start)
+        for line in lines:
+            seq, event = loads(line)
+            if seq != len(log):
+                raise ValueError(f"expected event {len(log)}, got event {seq}")
+            log.append(event)
+        return log
+
+    # Recording a game as it is played.
+
+    def _on_scene(self, name):
+        self.append(SceneEntered(name))
+
+    def _on_state_change(self, change, value):
+        if change == "flag":
+            self.append(FlagSet(value))
+        elif change == "item":
+            self.append(ItemGained(value))
+        elif change == "reset":
+            self.append(GameReset())
+
+    @contextmanager
+    def recording(self, namespace=None):
+        """Log every scene entered and every change game.py makes to its state
+        inside the block.
+
+        namespace is where the scene functions live: game.py's globals by
+        default. Start the game from a scene looked up inside the block
+        (game.play(game.intro), not game.play()), so the first scene is
+        logged too.
+        """
+        namespace = vars(game) if namespace is None else namespace
+        game.state_listeners.append(self._on_state_change)
+        try:
+            with watching_scenes(namespace, self._on_scene):
+                yield self
+        finally:
+            game.state_listeners.remove(self._on_state_change)
+
+
+if __name__ == "__main__":
+    import io
+    from time import perf_counter
+
+    import playthrough
+
+    # One real playthrough, to show what gets logged and that it adds up.
+    log = EventLog()
+    with log.recording():
+        playthrough.play_captured()
+    print(f"playthrough: {len(log)} events")
+    for seq, event in log.history():
+        print(f"  {seq:>3} {event}")
+    rebuilt = log.rebuild()
+    assert rebuilt.game_state == tuple(game.game_state)
+    assert rebuilt.inventory == tuple(game.inventory)
+    print(f"rebuilt: {rebuilt}")
+    print()
+
+    # A short game, over and over, so the state itself stays small.
+    events = [
+        GameReset(),
+        SceneEntered("cell"),
+        FlagSet("flashlight_on"),
+        SceneEntered("hall"),
+        ItemGained("Level-1 Keycard"),
+    ]
+    count = 200_032  # half a snapshot interval past the last snapshot
+
+    for every in (0, 64):
+        log = EventLog(snapshot_every=every)
+        start = perf_counter()
+        for number in range(count):
+            log.append(events[number % len(events)])
+        elapsed = perf_counter() - start
+        label = f"snapshot every {every}" if every else "no snapshots"
+        print(f"{label:<20} append  {count / elapsed:12,.0f} events/s")
+
+        runs = 20 if every else 3
+        start = perf_counter()
+        for _ in range(runs):
+            log.rebuild()
+        elapsed = (perf_counter() - start) / runs
+        print(f"{label:<20} rebuild {elapsed * 1e6:12,.1f} us "
+              f"({len(log) - log.snapshots[-1][0]} events replayed)")
+
+    dropped = log.compact()
+    print(f"compaction dropped {dropped:,} events, "
+          f"{len(log.events)} left after snapshot {log.start:,}")
+
+    stream = io.StringIO()
+    log = EventLog()
+    log.subscribe(stream.write)
+    for number in range(count):
+        log.append(events[number % len(events)])
+    start = perf_counter()
+    copy = EventLog.from_lines(stream.getvalue().splitlines())
+    elapsed = perf_counter() - start
+    assert copy.rebuild() == log.rebuild()
+    print(f"streamed and rebuilt in another log: {count / elapsed:,.0f} events/s")
@@ -1,8 +1,37 @@
 from gametools import write, write_md, get_input, get_choice, clear, pause, spin
+from encounters import B0B, PHARMACY_CREATURE, ESCAPED, WON, flee, player_stats, resolve
 
 game_state = []
 inventory = []
 
+# Called as listener(change, value) after every change to the lists above:
+# ("flag", flag), ("item", item) or ("reset", None).
+state_listeners = []
+
+
+################################################################################
+# STATE CHANGES
+def set_flag(flag):
+    """
+    Remember that something has happened, for scenes that check game_state.
+    """
+    game_state.append(flag)
+    _state_changed("flag", flag)
+
+
+def gain_item(item):
+    """
+    Put an item in the player's inventory.
+    """
+    inventory.append(item)
+    _state_changed("item", item)
+
+
+def _state_changed(change, value):
+    for listener in state_listeners:
+        listener(change, value)
+
+
 ################################################################################
 # SHOW_INVENTORY
 def show_inventory():
@@ -84,7 +113,7 @@ What do you do?
         user_choice = get_choice(choices)
 
         if user_choice == 0:
-            game_state.append("flashlight_on")
+            set_flag("flashlight_on")
             write()
             write("The flashlight sputters to life with a weak, jittery beam.")
             write("Shadows dance. In the beam you can see the corridor beyond.")
@@ -187,7 +216,7 @@ to his chest rig.
             return attack_bob
         else:
             if has_keycard:
-                game_state.append("b0b_door_open")
+                set_flag("b0b_door_open")
                 write()
                 write("You swipe the Level-1 Keycard. The heavy door grinds and unlocks.")
                 write()
@@ -201,7 +230,7 @@ to his chest rig.
                 return hall
 
     elif user_choice == 2:  # Take Keycard
-        inventory.append("Level-1 Keycard")
+        gain_item("Level-1 Keycard")
         write()
         write(
 """
@@ -335,7 +364,7 @@ have been smashed beyond recognition. Blood prints lead out toward the lair.
         return attack_bob
 
     elif user_choice == 1:
-        inventory.append("Pipe Spear")
+        gain_item("Pipe Spear")
         write()
         write(
 """
@@ -371,8 +400,25 @@ Make your attack count.
 """
     )
     write()
-    # If player doesn't have spear, it's an instant death
-    if "Pipe Spear" not in inventory:
+    has_spear = "Pipe Spear" in inventory
+    fight = resolve(player_stats(inventory), B0B)
+
+    # Nobody landed the final blow: the player breaks away
+    if fight.outcome == ESCAPED:
+        write_md(
+"""
+The fight drags on until neither of you can land a clean blow. When B-0B
+rears back to catch its breath, you throw yourself out of the nest and run.
+
+Its howl chases you down the corridor, but it does not follow. Not yet.
+"""
+        )
+        write()
+        pause("Press any key to fall back to the corridor.")
+        return hall
+
+    # Without the spear the odds are hopeless
+    if fight.outcome != WON and not has_spear:
         write_md(
 """
 Desperate, you lunge with bare hands. It's a terrible idea.
@@ -394,8 +440,25 @@ Everything goes dark.
         pause("Press any key to accept the end.")
         exit()
 
-    # Player has spear -> detailed fight
-    else:
+    # The spear is not always enough
+    if fight.outcome != WON:
+        write_md(
+"""
+You drive the Pipe Spear into B-0B's shoulder, but the shaft skids off bone.
+The creature tears it from your grip and flings it into the dark.
+
+Its claws find you before you can run. The last thing you hear is the wet
+rumble of its breathing, right next to your ear.
+
+*** YOU DIED ***
+"""
+        )
+        write()
+        pause("Press any key to accept the end.")
+        exit()
+
+    # Player won the fight, with the spear or somehow without it
+    if has_spear:
         write_md(
 """
 You plant your feet and jab the Pipe Spear with everything you have directly
@@ -411,27 +474,36 @@ claws scrabbling uselessly at the floor.
 The module around its neck, cracked and sparking, hangs within reach.
 """
         )
-        write()
-        # take module
-        inventory.append("Exit Gate Access Module")
-        write("You tear the glowing Access Module free from the cord around its neck.")
-        write()
-        pause("Press any key to catch your breath as alarms flare back to life.")
-
-        # After taking it, alarms reactivate -> short dramatic countdown
-        write()
+    else:
         write_md(
 """
+Against all odds your bare fists find the soft places in its rotted hide.
+Blow after blow, B-0B staggers, sags, and finally crashes to the floor.
+
+The module around its neck, cracked and sparking, hangs within reach.
+"""
+        )
+    write()
+    # take module
+    gain_item("Exit Gate Access Module")
+    write("You tear the glowing Access Module free from the cord around its neck.")
+    write()
+    pause("Press any key to catch your breath as alarms flare back to life.")
+
+    # After taking it, alarms reactivate -> short dramatic countdown
+    write()
+    write_md(
+"""
 A blaring alarm shrieks somewhere in the facility: **FACILITY PURGE INITIATED**.
 Red lights strobe. Somewhere above, mechanisms begin the process of
 sealing and sterilizing entire wings.
 
 You have only moments before automatic systems lock down the exit or worse.
 """
-        )
-        write()
-        pause("Press any key to run for the exit gate")
-        return surface_scene()
+    )
+    write()
+    pause("Press any key to run for the exit gate")
+    return surface_scene()
 
 
 ################################################################################
@@ -527,7 +599,7 @@ def ruined_street():
 
 
     if "Respirator Mask" not in inventory:
-        inventory.append("Respirator Mask")
+        gain_item("Respirator Mask")
     write("You find a damaged but functional respirator mask on a skeleton.")
 
 
@@ -577,22 +649,23 @@ def creature_fight():
     3. Freeze completely
     """
     )
-    choice = get_choice(["Run", "Hide", "Freeze"])
+    choices = ["Run", "Hide", "Freeze"]
+    choice = get_choice(choices)
+    escape = flee(player_stats(inventory), PHARMACY_CREATURE, choices[choice])
 
 
-    if choice == 1:
-        write("You bolt for the doorway. The creature lunges but slips on glass. You escape.")
+    if escape.outcome == ESCAPED:
+        if choice == 0:
+            write("You bolt for the doorway. The creature lunges but slips on glass. You escape.")
+        elif choice == 1:
+            write("You crouch behind a collapsed shelf. The creature sniffs the air and slowly drifts away. There is an opening to leave now.")
+        else:
+            write("You freeze. The creature circles you twice, close enough to touch, then loses interest and drags itself away.")
         pause("Press any key to continue...")
         return ruined_street()
 
 
     if choice == 2:
-        write("You crouch behind a collapsed shelf. The creature sniffs the air and slowly drifts away. There is an opening to leave now.")
-        pause("Press any key to continue...")
-        return ruined_street()
-
-
-    if choice == 3:
         write_md(
     """
     You freeze. Total stillness.
@@ -602,6 +675,9 @@ def creature_fight():
     *** YOU DIED ***
     """
     )
+    else:
+        write("You are not fast enough. The creature is on you before you reach cover.")
+        write("*** YOU DIED ***")
     pause("Press any key...")
     exit()
 ################################################################################
@@ -626,7 +702,7 @@ def radio_tower():
 
 
     if "Saw the Flare" not in inventory:
-        inventory.append("Saw the Flare")
+        gain_item("Saw the Flare")
 
 
     pause("Press any key to continue.")
@@ -751,13 +827,31 @@ def ending_ambush():
 
 ################################################################################
 # MAIN RUNNER
-if __name__ == "__main__":
-    # Start the game
-    current_scene = intro
+def reset():
+    """
+    Put the game back the way it is when game.py first starts.
+    """
+    game_state.clear()
+    inventory.clear()
+    _state_changed("reset", None)
+
+
+def play(current_scene=intro, on_scene=None):
+    """
+    Run scenes starting from current_scene until the game ends.
+    If on_scene is given it is called with each scene just before it runs.
+    """
     # run scenes in a loop; scene functions return the next scene function
-    while True:
+    while current_scene is not None:
+        if on_scene:
+            on_scene(current_scene)
         try:
             current_scene = current_scene()
         except SystemExit:
             # allow clean exit from scenes with exit()
             break
+
+
+if __name__ == "__main__":
+    # Start the game
+    play()
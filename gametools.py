@@ -5,24 +5,41 @@ A set of functions to make AIST2110's games AWESOME!!
 """
 
 from typing import Literal
+import codecs
+import os
+import re
 import sys
+from collections import deque
+from contextlib import contextmanager, nullcontext
+from functools import lru_cache
+from contextvars import ContextVar
 from time import sleep
 from textwrap import fill, dedent
 from collections.abc import Iterable
 from shutil import get_terminal_size
-from beaupy import Config, select, prompt
 from rich import box
 from rich.console import Console
 from rich.markdown import Markdown
 from rich.panel import Panel
+from rich.segment import Segment
+from rich.text import Text
 
 
-Config.raise_on_interrupt = True
-
 _console = None
 
+# Sessions sharing this process (see asyncgametools.py) each render through a
+# console of their own, set here for the task or thread running the session.
+_session_console = ContextVar("gametools_session_console", default=None)
+
+# Called as listener(all_choices, index) whenever get_choice() returns.
+choice_listeners = []
+
 MAX_REASONABLE_WIDTH = 120
 
+OutputProfile = Literal["plain", "16color", "full"]
+
+OUTPUT_PROFILES = ("plain", "16color", "full")
+
 
 def _get_terminal_width(max_term_width: int = MAX_REASONABLE_WIDTH):
     try:
@@ -46,12 +63,127 @@ def set_terminal_width(width=None):
     if not width:
         width = _get_terminal_width()
     global _console
-    _console = Console(width=width)
+    _console = _make_console(width, _profile)
+
+
+def _trimmed(line):
+    """Drop the spaces at the end of a line of segments, as far as nothing
+    would show them (no background, underline, reverse or strike)."""
+    while line:
+        text, style, control = line[-1]
+        if control or (style and (style.bgcolor or style.underline
+                                  or style.reverse or style.strike)):
+            break
+        text = text.rstrip(" ")
+        if text:
+            line[-1] = Segment(text, style)
+            break
+        line.pop()
+    return line
+
+
+def _without_padding(segments):
+    line = []
+    for segment in segments:
+        if segment.control or "\n" not in segment.text:
+            line.append(segment)
+            continue
+        *ended, rest = segment.text.split("\n")
+        for text in ended:
+            if text:
+                line.append(Segment(text, segment.style))
+            yield from _trimmed(line)
+            yield Segment("\n", segment.style)
+            line = []
+        if rest:
+            line.append(Segment(rest, segment.style))
+    yield from line
+
+
+class _SlowLinkConsole(Console):
+    """A Console that leaves off the spaces rich pads every line with.
+
+    Left-justified text is padded out to the full width of the console, which
+    is about half of what a game sends. On a slow link that is not worth it.
+    """
+
+    def _render_buffer(self, buffer):
+        return super()._render_buffer(_without_padding(buffer))
+
+
+class _AsciiConsole(_SlowLinkConsole):
+    """A Console that reports an ASCII encoding.
+
+    Rich swaps every box (panels, markdown headings) for its plain ASCII
+    equivalent when the console cannot encode box-drawing characters.
+    """
+
+    @property
+    def encoding(self):
+        return "ascii"
+
+
+def _make_console(width, profile, force_terminal=None):
+    if profile == "plain":
+        console = _AsciiConsole(width=width, color_system=None, emoji=False)
+    elif profile == "16color":
+        console = _SlowLinkConsole(
+            width=width, color_system="standard", force_terminal=force_terminal
+        )
+    else:
+        console = Console(width=width, force_terminal=force_terminal)
+    # What the console was made for, which its color_system does not tell:
+    # a "full" console on a 16-color terminal also reports "standard".
+    console.output_profile = profile
+    return console
+
+
+def set_output_profile(profile: OutputProfile = "full"):
+    """Choose how much styling is sent to the terminal.
+
+    Slow or metered links (serial lines, SSH over a bad connection) spend most
+    of their bytes on color codes and box-drawing characters rather than on the
+    story itself. The output profile controls this:
 
+    - "full" (default) uses every color and box the terminal supports.
+    - "16color" limits colors to the basic 16-color palette, which uses much
+      shorter escape codes, leaves off the spaces that pad lines out to the
+      width of the terminal, and slows down spinner animations.
+    - "plain" sends no escape codes at all: no colors, no screen clearing, no
+      animations, no padding, and boxes are drawn with ASCII characters.
 
+    The profile can also be chosen before the game starts by setting the
+    GAMETOOLS_PROFILE environment variable.
+    """
+    if profile not in OUTPUT_PROFILES:
+        raise ValueError(f"Output profile must be one of {OUTPUT_PROFILES}")
+    global _profile
+    _profile = profile
+    set_terminal_width(_console.width if _console else None)
+
+
+def get_output_profile() -> str:
+    """Return the name of the output profile currently in use."""
+    return _profile
+
+
+_profile = os.environ.get("GAMETOOLS_PROFILE", "full")
+if _profile not in OUTPUT_PROFILES:
+    _profile = "full"
 set_terminal_width()
 
 
+def _current_console():
+    console = _session_console.get()
+    return _console if console is None else console
+
+
+def _is_plain(console):
+    # Ask the console rather than _profile, since a session's console can
+    # have a profile of its own.
+    return isinstance(console, _AsciiConsole)
+
+
 def write(
     content="",
     prefix="",
@@ -107,7 +239,8 @@ def write(
         prefix = " 1 "
         indent = "   "
 
-    line_width = _console.width
+    console = _current_console()
+    line_width = console.width
     if boxed:
         line_width -= 4
 
@@ -141,9 +274,9 @@ def write(
             to_print = " "
 
     if boxed:
-        to_print = Panel(to_print, width=_console.width, box=box.ROUNDED)
+        to_print = Panel(to_print, width=console.width, box=box.ROUNDED)
 
-    _console.print(to_print, style=style, justify=justify, end=end)
+    console.print(to_print, style=style, justify=justify, end=end)
 
 
 def write_md(content, style="", boxed=False):
@@ -158,16 +291,325 @@ def write_md(content, style="", boxed=False):
 
     Setting boxed=True will display the content inside of a box.
     """
-    to_print = Markdown(dedent(content).strip())
+    console = _current_console()
+    to_print = _markdown(dedent(content).strip())
 
     if boxed:
-        to_print = Panel(to_print, width=_console.width, box=box.ROUNDED)
+        to_print = Panel(to_print, width=console.width, box=box.ROUNDED)
     elif " on " in style:
         to_print = Panel(
-            to_print, width=_console.width, box=box.SIMPLE, padding=0, expand=True
+            to_print, width=console.width, box=box.SIMPLE, padding=0, expand=True
+        )
+
+    console.print(to_print, style=style)
+
+
+# Scenes only use a sliver of markdown: "# " headings, paragraphs, **bold**
+# and *italic*. Text limited to that is rendered directly into rich Text
+# objects, the same ones rich.Markdown would build, which skips the full
+# markdown parser. Anything else goes through rich.Markdown as before.
+
+_fast_markdown = None  # None until checked against rich.Markdown
+
+_UNSUPPORTED_MARKDOWN = re.compile(r"[`\[\]<>&\\_~|]|^\s*(?:[-+=>]|\d+[.)]|#[^ ])")
+_EMPHASIS = re.compile(
+    r"\*\*(?P<strong>[^*\s](?:[^*]*[^*\s])?)\*\*"
+    r"|(?<!\*)\*(?P<em>[^*\s](?:[^*]*[^*\s])?)\*(?!\*)"
+)
+
+
+class _SimpleMarkdown:
+    """A rich renderable for markdown limited to headings and paragraphs."""
+
+    def __init__(self, blocks):
+        self.blocks = blocks  # [(style name, [(text, inline style or None)])]
+
+    def __rich_console__(self, console, options):
+        base = console.get_style("none")
+        for number, (block_style, runs) in enumerate(self.blocks):
+            block = base + console.get_style(block_style, default="none")
+            text = Text(justify="center" if block_style == "markdown.h1" else "left")
+            for run, inline in runs:
+                if inline:
+                    text.append(run, block + console.get_style(inline, default="none"))
+                else:
+                    text.append(run, block)
+            if number:
+                yield Segment.line()
+            yield text
+
+
+def _inline_runs(text):
+    runs = []
+
+    def add(run, inline):
+        for number, line in enumerate(run.split("\n")):
+            if number:
+                runs.append((" ", None))
+            if line:
+                runs.append((line, inline))
+
+    position = 0
+    for match in _EMPHASIS.finditer(text):
+        add(text[position : match.start()], None)
+        if match["strong"]:
+            add(match["strong"], "markdown.strong")
+        else:
+            add(match["em"], "markdown.em")
+        position = match.end()
+    add(text[position:], None)
+    if any("*" in run for run, _ in runs):
+        return None
+    return runs
+
+
+def _parse_simple_markdown(text):
+    """Split text into heading and paragraph blocks, or return None if it uses
+    any markdown beyond them."""
+    blocks = []
+    paragraph = []
+
+    def end_paragraph():
+        if paragraph:
+            runs = _inline_runs("\n".join(paragraph))
+            blocks.append(("markdown.paragraph", runs))
+            paragraph.clear()
+            return runs is not None
+        return True
+
+    for line in text.split("\n"):
+        if "\t" in line or _UNSUPPORTED_MARKDOWN.search(line):
+            return None
+        stripped = line.strip()
+        if not stripped:
+            if not end_paragraph():
+                return None
+        elif line.startswith("# "):
+            runs = _inline_runs(stripped[2:].strip())
+            if not end_paragraph() or runs is None or stripped.endswith("#"):
+                return None
+            blocks.append(("markdown.h1", runs))
+        elif not paragraph and line.startswith("    "):
+            return None  # an indented code block
+        elif line.endswith("  ") and line.rstrip():
+            return None  # a hard line break
+        else:
+            paragraph.append(stripped)
+    if not end_paragraph():
+        return None
+    return blocks
+
+
+def _markdown(text):
+    global _fast_markdown
+    if _fast_markdown is None:
+        _fast_markdown = _renders_like_rich(
+            "# Heading **bold**\nA *short*\nparagraph.\n\nAnother **one**."
         )
+    blocks = _parse_simple_markdown(text) if _fast_markdown else None
+    if blocks is None:
+        return Markdown(text)
+    return _SimpleMarkdown(blocks)
+
+
+def _renders_like_rich(text, width=40):
+    """Check that the fast path matches the installed version of rich."""
+    outputs = []
+    for renderable in (Markdown(text), _SimpleMarkdown(_parse_simple_markdown(text))):
+        console = Console(width=width, force_terminal=True, color_system="truecolor")
+        with console.capture() as capture:
+            console.print(renderable)
+        outputs.append(capture.get())
+    return outputs[0] == outputs[1]
+
+
+def set_fast_markdown(enabled=True):
+    """Turn the fast markdown renderer used by write_md() on or off.
+
+    write_md() renders headings, paragraphs, bold and italic text itself and
+    only hands anything fancier to rich's full markdown renderer. The output is
+    identical either way; turning it off is only useful for comparison.
+    """
+    global _fast_markdown
+    _fast_markdown = None if enabled else False
+
+
+_INVALID_INPUT = "[b white on red]INVALID INPUT | TRY AGAIN[/]"
+
+
+def _beaupy():
+    # beaupy is only needed once a player is at the keyboard, so it is not
+    # imported until then; this keeps it off the path to the first frame.
+    import beaupy
+
+    beaupy.Config.raise_on_interrupt = True
+    return beaupy
+
+
+class _Input:
+    """Where one game's answers come from, and the lines typed ahead of the
+    prompts that will use them."""
+
+    def __init__(self, stream=None):
+        self.stream = stream  # None: whatever sys.stdin is at the time
+        self.typeahead = deque()
+        self.source = None
+        self.decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        self.partial_line = ""
+
+    @property
+    def file(self):
+        return sys.stdin if self.stream is None else self.stream
+
+
+_stdin_input = _Input()
+
+# Like _session_console, but for where a session's answers are read from.
+_session_input = ContextVar("gametools_session_input", default=None)
+
+
+def _current_input():
+    state = _session_input.get()
+    return _stdin_input if state is None else state
+
+
+def set_input_source(lines=None):
+    """Answer prompts from a list of lines instead of the keyboard.
+
+    Each line answers one prompt: get_input() uses it as the typed text,
+    get_choice() accepts either the number shown next to a choice or the text
+    of the choice itself, and pause() simply consumes it. Once the lines run
+    out the game exits, just as it would at the end of piped input.
+
+    Calling it with no arguments goes back to reading from the keyboard (or
+    from standard input, if that has been piped in).
+    """
+    state = _current_input()
+    state.typeahead.clear()
+    state.decoder.reset()
+    state.partial_line = ""
+    state.source = None if lines is None else iter(lines)
+
+
+@contextmanager
+def session(output, stream, width=None, profile=None, force_terminal=None):
+    """Draw to output and read answers from stream for everything that runs
+    in the current context, until the block ends.
+
+    Each thread starts with a context of its own, so sessions in different
+    threads never share a console or type-ahead; set_terminal_width() and the
+    other module-wide settings only change the default console. Returns the
+    session's console.
+
+    output is usually not a terminal itself (a socket, a queue), so rich
+    would leave out colors and animations; pass force_terminal=True when
+    there is a terminal at the far end of it.
+    """
+    console = _make_console(
+        width or _current_console().width,
+        profile or get_output_profile(),
+        force_terminal,
+    )
+    console.file = output
+    console_token = _session_console.set(console)
+    input_token = _session_input.set(_Input(stream))
+    try:
+        yield console
+    finally:
+        _session_input.reset(input_token)
+        _session_console.reset(console_token)
+
+
+def _stdin_is_tty(state):
+    try:
+        return state.file.isatty()
+    except (AttributeError, ValueError):
+        return False
+
+
+def _non_interactive():
+    state = _current_input()
+    return state.source is not None or bool(state.typeahead) or not _stdin_is_tty(state)
+
+
+def _fill_typeahead(state):
+    if state.source is not None:
+        line = next(state.source, None)
+        if line is not None:
+            state.typeahead.append(str(line).rstrip("\r\n"))
+        return
+
+    # Everything is read through the stream itself, never around it with
+    # os.read(), so nothing it has already buffered is skipped. Binary streams
+    # (sockets, sys.stdin.buffer) hand over everything that is waiting in one
+    # read1(), and each complete line is queued for the prompts that follow.
+    stream = state.file
+    read1 = getattr(stream, "read1", None)
+    while not state.typeahead:
+        chunk = read1(65536) if read1 else stream.readline()
+        if not chunk:
+            if state.partial_line:
+                state.typeahead.append(state.partial_line.rstrip("\r"))
+                state.partial_line = ""
+            return
+        if isinstance(chunk, bytes):
+            chunk = state.decoder.decode(chunk)
+        lines = (state.partial_line + chunk).split("\n")
+        state.partial_line = lines.pop()
+        state.typeahead.extend(line.rstrip("\r") for line in lines)
+
+
+def _read_line():
+    # Make sure the player has seen everything before answering for them
+    _current_console().file.flush()
+    state = _current_input()
+    if not state.typeahead:
+        _fill_typeahead(state)
+    if not state.typeahead:
+        sys.exit(0)
+    return state.typeahead.popleft()
+
+
+def _match_choice(answer, choices):
+    """Return the index of the choice a line of input picks, or None."""
+    answer = answer.strip()
+    if answer.isdigit() and 1 <= int(answer) <= len(choices):
+        return int(answer) - 1
+    by_text = {text.lower(): idx for idx, text in enumerate(choices)}
+    return by_text.get(answer.lower())
+
+
+def _pick(answer, choices):
+    """Like _match_choice(), but also takes commands in parser mode."""
+    choice = _match_choice(answer, choices)
+    if choice is None and _parser_mode:
+        choice = command_parser(choices).resolve(answer)
+    return choice
+
+
+def _choose_from_queue(choices):
+    write(choices, numbered=True)
+    while True:
+        choice = _pick(_read_line(), choices)
+        if choice is not None:
+            return choice
+        write(_INVALID_INPUT)
 
-    _console.print(to_print, style=style)
+
+def _input_rules(prompt_text, choices, show_choices, min_length):
+    """Return the prompt get_input() shows and a check for valid answers."""
+    if choices and show_choices:
+        prompt_text += " \[" + ",".join(choices) + "]"
+
+    lower_choices = frozenset(choice.lower() for choice in choices or ())
+
+    def _valid(val):
+        if choices:
+            return val.lower() in lower_choices
+        else:
+            return len(val) >= min_length
+
+    return prompt_text, _valid
 
 
 def get_input(
@@ -189,31 +631,30 @@ def get_input(
     are allowed. To require the user to enter something, you can specify a
     min_length using the optional named argument.
     """
-    if choices and show_choices:
-        prompt_text += " \[" + ",".join(choices) + "]"
-
-    lower_choices = []
-    if choices:
-        lower_choices = [choice.lower() for choice in choices]
-
-    def _valid(val):
-        if choices:
-            return val.lower() in lower_choices
-        else:
-            return len(val) >= min_length
+    prompt_text, _valid = _input_rules(prompt_text, choices, show_choices, min_length)
 
     user_text = ""
     prompt_prefix = ""
+    shown = False  # the prompt is still on screen, above where the answer goes
     while not _valid(user_text):
+        if _non_interactive():
+            # A player on the other end of a pipe or socket has to see the
+            # prompt before they can answer it.
+            write(prompt_prefix + prompt_text)
+            user_text = _read_line().strip()
+            prompt_prefix = _INVALID_INPUT + "\n"
+            shown = True
+            continue
         try:
-            user_text = prompt(
+            user_text = _beaupy().prompt(
                 prompt_prefix + prompt_text, initial_value=user_text
             ).strip()
-            prompt_prefix = "[b white on red]INVALID INPUT | TRY AGAIN[/]\n"
+            prompt_prefix = _INVALID_INPUT + "\n"
+            shown = False
         except KeyboardInterrupt:
             sys.exit(1)
 
-    write(f"{prompt_text}: {user_text}")
+    write(user_text if shown else f"{prompt_text}: {user_text}")
     return user_text
 
 
@@ -223,6 +664,10 @@ def get_choice(all_choices: Iterable[str], hidden_choices: Iterable[int] = None)
     The user is presented with a navigable list of choices. Using the up/down
     arrow keys, the user selects an item and presses Enter to select.
 
+    When input is piped in (or supplied with set_input_source()) the choices
+    are printed as a numbered list instead, and each line of input picks one
+    either by its number or by its text.
+
     The _index_ of the selected item is returned.
 
     If desired, specific indexes can be hidden from a user. This may be useful
@@ -230,6 +675,32 @@ def get_choice(all_choices: Iterable[str], hidden_choices: Iterable[int] = None)
     need to alter the available choices for a user based on some game state
     change.
     """
+    choices, hidden_choices = _visible_choices(all_choices, hidden_choices)
+
+    choice = None
+    if _non_interactive():
+        choice = _choose_from_queue(choices)
+    elif _parser_mode:
+        choice = _choose_by_command(choices)
+    while choice is None:
+        try:
+            choice = _beaupy().select(options=choices, return_index=True)
+        except KeyboardInterrupt:
+            sys.exit(1)
+
+    return _chosen(all_choices, _unhide(choice, hidden_choices))
+
+
+def _chosen(all_choices, choice):
+    """Show the choice that was picked, tell choice_listeners, return it."""
+    write(f"[i]choice:[/] [b]{all_choices[choice]}[/]")
+    for listener in choice_listeners:
+        listener(all_choices, choice)
+    return choice
+
+
+def _visible_choices(all_choices, hidden_choices):
+    """Return the choices to show and the sorted indexes of the hidden ones."""
     # Hide hidden indexes
     if hidden_choices:
         for idx in hidden_choices:
@@ -247,28 +718,217 @@ def get_choice(all_choices: Iterable[str], hidden_choices: Iterable[int] = None)
         ]
     else:
         choices = [str(all_choices[idx]) for idx in range(len(all_choices))]
+    return choices, hidden_choices
 
-    choice = None
-    while choice is None:
-        try:
-            choice = select(options=choices, return_index=True)
-        except KeyboardInterrupt:
-            sys.exit(1)
 
+def _unhide(choice, hidden_choices):
+    """Turn an index into the shown choices into one into all the choices."""
     # Adjust choice to account for hidden indexes
     if hidden_choices:
         for idx in hidden_choices:
             if idx <= choice:
                 choice += 1
-
-    write(f"[i]choice:[/] [b]{all_choices[choice]}[/]")
     return choice
 
 
+# Parser mode: choices picked by typing a command such as "go south".
+
+_parser_mode = False
+
+# Words a player may type, and the word the game's choices use for them.
+SYNONYMS = {
+    "go": ("walk", "move", "head", "travel"),
+    "take": ("get", "grab", "pick", "collect"),
+    "examine": ("view", "look", "inspect", "check", "x", "l"),
+    "attack": ("fight", "hit", "kill", "strike"),
+    "call": ("shout", "yell"),
+    "turn": ("switch",),
+    "run": ("flee", "bolt"),
+    "north": ("n",),
+    "south": ("s",),
+    "east": ("e",),
+    "west": ("w",),
+    "inventory": ("inv", "i", "items"),
+    "keycard": ("card", "key"),
+    "flashlight": ("light", "torch"),
+    "b-0b": ("bob", "b0b"),
+}
+_CANONICAL = {word: canon for canon, words in SYNONYMS.items() for word in words}
+
+# Words a command can do without.
+STOPWORDS = frozenset(("a", "an", "the", "to", "at", "my", "your", "into", "towards"))
+
+_WORD = re.compile(r"[a-z0-9]+(?:-[a-z0-9]+)*")
+
+
+def _words(text):
+    return [_CANONICAL.get(word, word) for word in _WORD.findall(text.lower())]
+
+
+class _TrieNode:
+    __slots__ = ("children", "mask", "word")
+
+    def __init__(self):
+        self.children = {}
+        self.mask = 0  # the choices with a word that starts here
+        self.word = None  # the word that ends here, if any
+
+
+class CommandParser:
+    """Resolves typed commands such as "go south" or "take keycard" to the
+    index of one of a menu's choices.
+
+    Every word of a choice (as SYNONYMS names it) is indexed once, both in a
+    dict and in a trie of its letters, along with a bitmask of the choices it
+    appears in. A command picks the choice that has every word in it, so
+    resolving one costs a lookup per word typed and an AND of the masks,
+    however many choices or words there are. A word that is not in the dict
+    is taken as the start of one (so "tak key" works), and the trie suggests
+    how to finish it. The choices' own words go in the trie too, and only
+    they are suggested: "View Inventory" is completed as "view", never as
+    "examine".
+    """
+
+    def __init__(self, choices):
+        self.choices = tuple(choices)
+        self._masks = {}
+        self._shown = {}  # each word as the choices spell it: their mask
+        self._trie = _TrieNode()
+        for index, choice in enumerate(self.choices):
+            for shown in _WORD.findall(choice.lower()):
+                self._add(shown, 1 << index)
+
+    def _add(self, shown, bit):
+        word = _CANONICAL.get(shown, shown)
+        self._masks[word] = self._masks.get(word, 0) | bit
+        self._shown[shown] = self._shown.get(shown, 0) | bit
+        self._insert(word, bit)
+        self._insert(shown, bit).word = shown
+
+    def _insert(self, word, bit):
+        node = self._trie
+        node.mask |= bit
+        for letter in word:
+            node = node.children.setdefault(letter, _TrieNode())
+            node.mask |= bit
+        return node
+
+    def _prefix(self, prefix):
+        node = self._trie
+        for letter in prefix:
+            node = node.children.get(letter)
+            if node is None:
+                return None
+        return node
+
+    def _mask(self, word):
+        mask = self._masks.get(word)
+        if mask is None:
+            node = self._prefix(word)
+            mask = node.mask if node else 0
+        return mask
+
+    def _command_mask(self, command):
+        words = [word for word in _words(command) if word not in STOPWORDS]
+        if not words:
+            return 0
+        mask = (1 << len(self.choices)) - 1
+        for word in words:
+            mask &= self._mask(word)
+        return mask
+
+    def matches(self, command):
+        """Return the indexes of every choice the command could mean."""
+        mask = self._command_mask(command)
+        found = []
+        while mask:
+            lowest = mask & -mask
+            found.append(lowest.bit_length() - 1)
+            mask ^= lowest
+        return found
+
+    def resolve(self, command):
+        """Return the index of the one choice the command means, or None if
+        it means none or more than one of them."""
+        mask = self._command_mask(command)
+        if mask and not mask & (mask - 1):
+            return mask.bit_length() - 1
+        return None
+
+    def complete(self, text):
+        """Return the ways of finishing the last word of text that still
+        leave a choice to pick, as whole commands."""
+        typed = text.lower()
+        head, _, partial = typed.rpartition(" ")
+        mask = (1 << len(self.choices)) - 1
+        typed_words = set(_words(head)) - STOPWORDS
+        for word in typed_words:
+            mask &= self._mask(word)
+        node = self._prefix(partial)
+        if node is None or not node.mask & mask:
+            return []
+        skip = typed_words | STOPWORDS
+        found, stack = [], [node]
+        while stack:
+            node = stack.pop()
+            word = node.word
+            if word and _CANONICAL.get(word, word) not in skip and self._shown[word] & mask:
+                found.append(word)
+            stack.extend(child for child in node.children.values() if child.mask & mask)
+        prefix = f"{head} " if head else ""
+        return [prefix + word for word in sorted(found)]
+
+
+@lru_cache(maxsize=256)
+def _command_parser(choices):
+    return CommandParser(choices)
+
+
+def command_parser(choices):
+    """Return the CommandParser for a list of choices, building it the first
+    time that list is seen and reusing it for every visit after that."""
+    return _command_parser(tuple(choices))
+
+
+def set_parser_mode(enabled=True):
+    """Let players pick choices by typing commands instead of from a menu.
+
+    The choices are still listed, but the player types what to do ("go
+    south", "take keycard", "look at inventory") and get_choice() works out
+    which choice that means, with Tab completing words. The number or the
+    whole text of a choice still works too, as it does for piped input.
+    """
+    global _parser_mode
+    _parser_mode = enabled
+
+
+def _choose_by_command(choices):
+    parser = command_parser(choices)
+    write(choices, bulleted=True)
+    while True:
+        try:
+            command = _beaupy().prompt("What do you do?", completion=parser.complete)
+        except KeyboardInterrupt:
+            sys.exit(1)
+        choice = _pick(command, choices)
+        if choice is not None:
+            return choice
+        write(_INVALID_INPUT)
+
+
 def clear():
     """Clears the terminal window."""
-    _console.clear()
-    
+    # Output streams that keep a copy of the current screen (see broadcast.py)
+    # are told that a new one is starting.
+    console = _current_console()
+    new_frame = getattr(console.file, "new_frame", None)
+    if new_frame:
+        new_frame()
+    if _is_plain(console):
+        console.line()
+        return
+    console.clear()
+
 
 def pause(message="Press any key to continue...", style="", justify="left"):
     """Displays a message and waits for a user to press any key.
@@ -279,7 +939,13 @@ def pause(message="Press any key to continue...", style="", justify="left"):
     This function takes optional, named arguments for style and justify that are
     identical to those used in write().
     """
-    _console.print(message, style=style, justify=justify)
+    console = _current_console()
+    console.print(message, style=style, justify=justify)
+
+    if _non_interactive():
+        _read_line()
+        console.line()
+        return
 
     import platform
 
@@ -288,15 +954,15 @@ def pause(message="Press any key to continue...", style="", justify="left"):
 
         code = ord(msvcrt.getwch())
         if code in (3, 26):
-            exit(0)
-        print()
+            sys.exit(0)
+        console.line()
     else:
         import os
 
         code = os.system(f"/bin/bash -c 'read -s -n 1'")
         if code != 0:
-            exit(0)
-        print()
+            sys.exit(0)
+        console.line()
 
 
 SpinnerNames = Literal[
@@ -389,5 +1055,20 @@ def spin(seconds: float, message: str = "", spinner: SpinnerNames = None):
     values enumerated elsewhere. The spinner animation will display to the left
     of any message and will also disappear once the timer expires.
     """
-    with _console.status(message, spinner=spinner):
+    console = _current_console()
+    if _is_plain(console):
+        if message:
+            console.print(message)
         sleep(seconds)
+        return
+
+    # Output streams that can coalesce frames (see outqueue.py) are told that
+    # the spinner's frames are disposable.
+    transient = getattr(console.file, "transient", nullcontext)
+
+    refresh_rate = 4 if console.output_profile == "16color" else 12.5
+    with transient(), console.status(
+        message, spinner=spinner, refresh_per_second=refresh_rate
+    ):
+        sleep(seconds)
+
@@ -0,0 +1,396 @@
+"""
+HIBERNATE.PY
+
+Parks idle players' games on disk and brings them back when they return.
+
+A player who walks away from a pause() or get_choice() prompt keeps their
+whole game in memory: its console, its copy of the scenes and game state, and
+the coroutine stack of the scene waiting for them. After idle_timeout seconds
+without input (checked by one sweep over all parked games every so often,
+rather than a timer per game), the game is written to a small JSON file
+instead and everything but the connection is let go.
+
+A scene cannot be frozen halfway through, but it can be run again. So the
+file holds the scene the player is in, game_state and inventory as they were
+when the scene started, the prompt the player is looking at, and every line
+they have typed since the scene started (plus the seed of any fight in it,
+so fights turn out the same). When the player types again, the scene is run
+from its start with those lines as input and its output thrown away, since
+the player has seen it all already. That leaves the game waiting at the same
+prompt as before, which the new line then answers.
+
+    python hibernate.py serve --port 4000 --idle 300
+    python hibernate.py bench
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import sys
+import time
+from collections import deque
+from uuid import uuid4
+
+import encounters
+import gametools
+from asyncgame import new_game, play
+from asyncgametools import Session
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+FOLDER = os.path.join(HERE, "hibernated")
+
+
+class _Hibernate(BaseException):
+    """Unwinds a scene whose player has been idle too long.
+
+    A BaseException, so no except Exception in a scene can catch it.
+    """
+
+
+class _HibernatingSession(Session):
+    """A Session that can be put to sleep at a prompt and replayed to it."""
+
+    def __init__(self, reader, writer, width, profile, parked, record=None):
+        super().__init__(reader, writer, width, profile)
+        self.parked = parked  # the hibernator's set of games waiting for input
+        self.parked_since = 0.0
+        self.evicted = False
+        self._task = None
+        self.inputs = []  # lines read since the scene started
+        self.seeds = []  # fight seeds drawn since the scene started
+        self.prompt = []  # what has been drawn since the last line was read
+        self.replaying = record is not None
+        self.replay = deque(record["inputs"] if record else ())
+        self.replay_seeds = deque(record["seeds"] if record else ())
+        self.woken_by = None
+        self.on_caught_up = None
+
+    def scene_started(self):
+        self.inputs.clear()
+        self.seeds.clear()
+
+    def write(self, text):
+        if self.replaying:
+            return len(text)
+        self.prompt.append(text)
+        return super().write(text)
+
+    async def read_line(self):
+        if self.replaying:
+            if self.replay:
+                line = self.replay.popleft()
+                self.inputs.append(line)
+                return line
+            self.replaying = False
+            if self.on_caught_up:
+                self.on_caught_up()
+            line = self.woken_by
+        else:
+            await self.writer.drain()
+            raw = await self._wait_for_line()
+            if not raw:
+                raise SystemExit(0)
+            line = raw.decode(self.encoding, "replace").rstrip("\r\n")
+        self.inputs.append(line)
+        self.prompt = []
+        return line
+
+    async def _wait_for_line(self):
+        self.parked_since = time.monotonic()
+        self._task = asyncio.current_task()
+        self.parked.add(self)
+        try:
+            return await self.reader.readline()
+        except asyncio.CancelledError:
+            if not self.evicted:
+                raise
+            self._task.uncancel()
+            raise _Hibernate from None
+        finally:
+            self.parked.discard(self)
+
+    def evict(self):
+        """Hibernate the game; only call while it is waiting for input."""
+        self.evicted = True
+        self._task.cancel()
+
+    def next_seed(self):
+        seed = self.replay_seeds.popleft() if self.replay_seeds else encounters.new_seed()
+        self.seeds.append(seed)
+        return seed
+
+
+class Hibernator:
+    """Plays networked games, parking idle ones in a folder on disk."""
+
+    def __init__(self, folder=FOLDER, idle_timeout=300.0, width=80, profile=None):
+        os.makedirs(folder, exist_ok=True)
+        self.folder = folder
+        self.idle_timeout = idle_timeout
+        self.width = width
+        self.profile = profile
+        self.resident = 0
+        self.hibernated = 0
+        self.hibernations = 0
+        self.rehydrations = 0
+        self.rehydrate_seconds = deque(maxlen=10_000)
+        self._parked = set()
+
+    def stats(self):
+        """Return how many games are in memory and on disk, and how long
+        bringing them back has taken."""
+        latencies = sorted(self.rehydrate_seconds)
+
+        def percentile(percent):
+            if not latencies:
+                return 0.0
+            rank = min(len(latencies) - 1, int(len(latencies) * percent / 100))
+            return round(latencies[rank] * 1e3, 2)
+
+        return {
+            "resident": self.resident,
+            "parked": len(self._parked),
+            "hibernated": self.hibernated,
+            "hibernations": self.hibernations,
+            "rehydrations": self.rehydrations,
+            "rehydrate_ms_p50": percentile(50),
+            "rehydrate_ms_p95": percentile(95),
+            "rehydrate_ms_max": percentile(100),
+        }
+
+    def sweep(self, idle_timeout=None):
+        """Hibernate every game that has been waiting for input for longer
+        than idle_timeout seconds (default: the hibernator's own)."""
+        limit = self.idle_timeout if idle_timeout is None else idle_timeout
+        now = time.monotonic()
+        for session in list(self._parked):
+            if now - session.parked_since >= limit:
+                session.evict()
+
+    async def sweep_forever(self):
+        """Sweep ten times per idle_timeout, for as long as the loop runs."""
+        while True:
+            await asyncio.sleep(self.idle_timeout / 10)
+            self.sweep()
+
+    async def play(self, reader, writer, session_id=None):
+        """Play one player's game to the end, hibernating it whenever they
+        leave it idle."""
+        path = os.path.join(self.folder, f"{session_id or uuid4().hex}.json")
+        record = woken_by = woke_at = None
+        while True:
+            self.resident += 1
+            try:
+                record = await self._run(reader, writer, record, woken_by, woke_at)
+            finally:
+                self.resident -= 1
+            if record is None:
+                return  # the game is over
+
+            with open(path + ".tmp", "w", encoding="utf-8") as file:
+                json.dump(record, file)
+            os.replace(path + ".tmp", path)
+            record = None
+            self.hibernations += 1
+
+            self.hibernated += 1
+            try:
+                line = await reader.readline()
+            finally:
+                self.hibernated -= 1
+            if not line:
+                os.remove(path)
+                return
+            woke_at = time.perf_counter()
+            woken_by = line.decode("utf-8", "replace").rstrip("\r\n")
+            with open(path, encoding="utf-8") as file:
+                record = json.load(file)
+            os.remove(path)
+
+    async def _run(self, reader, writer, record, woken_by, woke_at):
+        """Play until the game ends (returns None) or is left idle (returns
+        the record to hibernate)."""
+        scenes = new_game()
+        session = _HibernatingSession(
+            reader, writer, self.width, self.profile, self._parked, record
+        )
+        session.woken_by = woken_by
+        scenes["resolve"] = _seeded(encounters.resolve, session)
+        scenes["flee"] = _seeded(encounters.flee, session)
+
+        def caught_up():
+            self.rehydrations += 1
+            self.rehydrate_seconds.append(time.perf_counter() - woke_at)
+
+        session.on_caught_up = caught_up
+
+        entry = {}
+
+        def on_scene(scene):
+            entry.update(
+                scene=scene.__name__,
+                game_state=list(scenes["game_state"]),
+                inventory=list(scenes["inventory"]),
+            )
+            session.scene_started()
+
+        if record:
+            scenes["game_state"][:] = record["game_state"]
+            scenes["inventory"][:] = record["inventory"]
+        start = scenes[record["scene"] if record else "intro"]
+        try:
+            with session.activate():
+                await play(start, on_scene)
+            await writer.drain()
+            return None
+        except _Hibernate:
+            return dict(
+                entry,
+                inputs=session.inputs,
+                seeds=session.seeds,
+                prompt="".join(session.prompt),
+            )
+
+
+def _seeded(fight, session):
+    """Make a fight function take its seed from the session."""
+
+    def seeded(*args, seed=None, **options):
+        if seed is None:
+            seed = session.next_seed()
+        return fight(*args, seed=seed, **options)
+
+    return seeded
+
+
+async def serve(
+    host="127.0.0.1", port=4000, folder=FOLDER, idle_timeout=300.0,
+    width=80, profile="full", status_interval=10.0,
+):
+    """Host the game from one event loop, hibernating idle players."""
+    hibernator = Hibernator(folder, idle_timeout, width, profile)
+
+    async def handle(reader, writer):
+        try:
+            await hibernator.play(reader, writer)
+        except OSError:
+            pass  # the player hung up
+        finally:
+            writer.close()
+
+    server = await asyncio.start_server(handle, host, port, backlog=4096)
+    sweeper = asyncio.create_task(hibernator.sweep_forever())
+    print(f"hosting on {host}:{port}, hibernating after {idle_timeout:g}s idle",
+          file=sys.stderr)
+    async with server:
+        while True:
+            await asyncio.sleep(status_interval)
+            print(json.dumps(hibernator.stats()), file=sys.stderr)
+
+
+class _Transcript:
+    """Fingerprints what a benchmark player is sent."""
+
+    def __init__(self):
+        self.digest = hashlib.sha256()
+
+    def write(self, data):
+        self.digest.update(data)
+
+    async def drain(self):
+        pass
+
+
+def bench(sessions=1000):
+    """Park games at different prompts, hibernate them, then finish them.
+
+    Reports memory held with every game resident and with every game
+    hibernated, rehydration latency, and checks every transcript against a
+    game that was never hibernated.
+    """
+    import shutil
+    import tempfile
+    import tracemalloc
+
+    import playthrough
+
+    answers = playthrough.WALKTHROUGH
+    encounters.new_seed = lambda: 2110  # every fight the same, to compare
+    gametools.set_output_profile("full")
+
+    def feed(reader, lines):
+        reader.feed_data("".join(line + "\n" for line in lines).encode())
+
+    async def main(folder):
+        hibernator = Hibernator(folder)
+
+        # What every game should look like.
+        reader, expected = asyncio.StreamReader(), _Transcript()
+        feed(reader, answers)
+        reader.feed_eof()
+        await Hibernator(folder, 60).play(reader, expected)
+
+        tracemalloc.start()
+        games = []
+        for number in range(sessions):
+            reader, writer = asyncio.StreamReader(), _Transcript()
+            stop = number % len(answers)  # park at every prompt in turn
+            feed(reader, answers[:stop])
+            task = asyncio.create_task(hibernator.play(reader, writer))
+            games.append((reader, writer, stop, task))
+
+        while len(hibernator._parked) < sessions:
+            await asyncio.sleep(0.05)
+        resident = tracemalloc.get_traced_memory()[0]
+        print(f"{hibernator.resident} games resident: {resident / 1e6:8.1f} MB")
+
+        hibernator.sweep(0)
+        while hibernator.hibernated < sessions:
+            await asyncio.sleep(0.05)
+        hibernated = tracemalloc.get_traced_memory()[0]
+        on_disk = sum(entry.stat().st_size for entry in os.scandir(folder))
+        print(f"{hibernator.hibernated} games hibernated: {hibernated / 1e6:7.1f} MB "
+              f"in memory, {on_disk / 1e6:.1f} MB on disk")
+        tracemalloc.stop()
+
+        for reader, _, stop, _ in games:
+            feed(reader, answers[stop:])
+            reader.feed_eof()
+        await asyncio.gather(*(task for *_, task in games))
+
+        expected = expected.digest.digest()
+        wrong = sum(writer.digest.digest() != expected for _, writer, _, _ in games)
+        print(json.dumps(hibernator.stats()))
+        print(f"transcripts that differ from a game never hibernated: {wrong}")
+
+    folder = tempfile.mkdtemp()
+    try:
+        asyncio.run(main(folder))
+    finally:
+        shutil.rmtree(folder)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    commands = parser.add_subparsers(dest="command", required=True)
+    serve_command = commands.add_parser("serve", help="host the game")
+    serve_command.add_argument("--host", default="127.0.0.1")
+    serve_command.add_argument("--port", type=int, default=4000)
+    serve_command.add_argument("--folder", default=FOLDER)
+    serve_command.add_argument("--idle", type=float, default=300.0,
+                               help="seconds without input before hibernating")
+    serve_command.add_argument("--width", type=int, default=80)
+    serve_command.add_argument(
+        "--profile", choices=gametools.OUTPUT_PROFILES, default="full"
+    )
+    test = commands.add_parser("bench", help="hibernate and rehydrate many games")
+    test.add_argument("--sessions", type=int, default=1000)
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        asyncio.run(serve(args.host, args.port, args.folder, args.idle,
+                          args.width, args.profile))
+    else:
+        bench(args.sessions)
@@ -0,0 +1,592 @@
+"""
+HOST.PY
+
+Hosts game.py for players connecting over the network (telnet, nc, ...).
+
+A single Python process can only render one scene at a time, so the host runs
+several worker processes, one per core by default, behind a parent process
+that accepts connections. Each new connection is handed to the least loaded
+worker, socket and all, and the session stays on that worker until it ends:
+sessions are never moved or split between workers. A worker plays all of its
+sessions at once, each on a thread of its own in its own copy of the game
+(see new_game()), so a player who is thinking only holds up their own
+thread. Each session reads the player's lines as piped input and sends output
+through a bounded queue (see outqueue.py). With --compress, players whose
+clients support it get compressed output (see compression.py).
+
+Workers report their load (active and queued sessions, sessions served,
+output queue depth and dropped spinner frames) to the parent, which prints a
+health line for every worker at a regular interval. Sending the parent
+SIGTERM or SIGINT starts a graceful drain: the parent stops accepting
+connections and every worker finishes the sessions it already has before
+exiting.
+
+    python host.py serve --port 4000 --workers 4
+    python host.py loadtest             # players who think between answers
+"""
+
+import argparse
+import io
+import json
+import multiprocessing
+import os
+import queue
+import selectors
+import signal
+import socket
+import sys
+import threading
+import time
+from functools import lru_cache
+
+import compression
+import gametools
+from outqueue import OutputQueue
+from scenegraph import GAME_PATH
+
+_DRAIN = b"drain"
+_SESSION = b"session"
+_SWITCH_INTERVAL = 0.05  # seconds; see _worker_main
+
+
+class _Worker:
+    """The parent's view of one worker process."""
+
+    def __init__(self, index, process, channel):
+        self.index = index
+        self.process = process
+        self.channel = channel
+        self.active = 0
+        self.queued = 0
+        self.served = 0
+        self.output_depth = 0
+        self.dropped_frames = 0
+        self.alive = True
+        self.last_report = time.monotonic()
+
+    @property
+    def load(self):
+        return self.active + self.queued
+
+    def status(self):
+        return {
+            "worker": self.index,
+            "pid": self.process.pid,
+            "alive": self.alive,
+            "active": self.active,
+            "queued": self.queued,
+            "served": self.served,
+            "output_depth": self.output_depth,
+            "dropped_frames": self.dropped_frames,
+            "last_report": round(time.monotonic() - self.last_report, 1),
+        }
+
+
+@lru_cache(maxsize=None)
+def compiled_game(path=GAME_PATH):
+    """Return game.py compiled, once per process (compile it before forking,
+    and every worker shares it)."""
+    with open(path, encoding="utf-8") as source:
+        return compile(source.read(), path, "exec")
+
+
+def _print(*values, sep=" ", end="\n", file=None, flush=False):
+    """The built-in print(), but to the current session's player."""
+    print(
+        *values,
+        sep=sep,
+        end=end,
+        file=file or gametools._current_console().file,
+        flush=flush,
+    )
+
+
+def new_game(path=GAME_PATH):
+    """Return a fresh copy of game.py's namespace, with its own game_state
+    and inventory, for one session.
+
+    game.py keeps its state in module globals, so sessions that share a
+    process each run their own copy, executed from the same compiled code,
+    with print() and exit() that stay inside the session.
+    """
+    # The built-in exit() closes sys.stdin on its way out, which every other
+    # session is still using.
+    namespace = {"__name__": "host.session", "print": _print, "exit": sys.exit}
+    exec(compiled_game(path), namespace)
+    return namespace
+
+
+def serve_session(conn, width, output, profile=None):
+    """Play one game over a connected socket, in the calling thread.
+
+    The game gets a console, type-ahead and game state of its own (see
+    new_game()), so any number of sessions can play in one process.
+    Telnet commands are taken out of what the player sends before the game
+    reads it.
+    """
+    answers = io.BufferedReader(compression.TelnetInput(conn))
+    profile = profile or gametools.get_output_profile()
+    try:
+        # Players connect from terminals, whatever output is here.
+        with gametools.session(
+            output, answers, width, profile, force_terminal=profile != "plain"
+        ):
+            scenes = new_game()
+            scenes["play"](scenes["intro"])
+        output.flush()
+    except OSError:
+        pass  # the player hung up
+    finally:
+        for stream in (answers, output):
+            try:
+                stream.close()
+            except OSError:
+                pass
+        conn.close()
+
+
+def open_output(conn, queue_bytes, compress):
+    """Offer compression if enabled and return the session's output queue."""
+    compressor = None
+    if compress:
+        compressor = compression.negotiate(conn, compression.scene_dictionary())
+    return OutputQueue(conn, max_bytes=queue_bytes, compressor=compressor)
+
+
+def _worker_main(
+    index, channel, width, profile, heartbeat, queue_bytes, compress=False
+):
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    gametools.set_output_profile(profile)
+    # Hundreds of idle players can stop waiting at once (a network drops, or
+    # a server restarts), and every one of their threads then wants the GIL.
+    # At the default interval of 5 ms, the waiting threads wake to ask for it
+    # so often that with a couple of thousand of them the worker does little
+    # else; longer turns keep that in check. A turn rarely runs that long
+    # anyway, since a session gives up the GIL whenever it waits or sends.
+    sys.setswitchinterval(_SWITCH_INTERVAL)
+
+    sessions = queue.Queue()
+    counts = {"active": 0, "served": 0, "dropped_frames": 0, "output_depth": 0}
+    outputs = set()  # of the sessions in play
+    lock = threading.Lock()  # for counts and outputs
+    changed = threading.Event()
+
+    def report(measure=False):
+        with lock:
+            # Summing the queues takes a look at every session, so it is only
+            # done once a heartbeat; the reports in between repeat its total.
+            if measure:
+                counts["output_depth"] = sum(
+                    output.stats()["depth"] for output in outputs
+                )
+            message = dict(counts, worker=index, queued=sessions.qsize())
+        # Never wait on the parent: it may itself be waiting to hand this
+        # worker a session, and the next report supersedes this one anyway.
+        try:
+            channel.send(json.dumps(message).encode(), socket.MSG_DONTWAIT)
+        except OSError:
+            pass  # full, or the parent has gone; the sessions carry on
+
+    def receive():
+        while True:
+            try:
+                message, fds, _, _ = socket.recv_fds(channel, 64, 1)
+            except OSError:
+                message, fds = b"", []
+            if message == _SESSION and fds:
+                sessions.put(socket.socket(fileno=fds[0]))
+                changed.set()
+            else:  # drain requested, or the parent went away
+                sessions.put(None)
+                return
+
+    def beat():
+        # The only thread that reports: soon after anything changes, and at
+        # least once a heartbeat. Sessions ending all at once (say, when a
+        # network drops) then cost one report, not a queue of threads taking
+        # turns at the channel.
+        measured = time.monotonic()
+        while True:
+            changed.wait(heartbeat)
+            changed.clear()
+            measure = time.monotonic() - measured >= heartbeat
+            if measure:
+                measured = time.monotonic()
+            report(measure)
+            time.sleep(0.01)  # gather the changes that come in a burst
+
+    def play(conn):
+        try:
+            output = open_output(conn, queue_bytes, compress)
+        except OSError:  # the player hung up during negotiation
+            conn.close()
+            return
+        with lock:
+            counts["active"] += 1
+            outputs.add(output)
+        changed.set()
+        try:
+            serve_session(conn, width, output, profile)
+        finally:
+            with lock:
+                outputs.discard(output)
+                counts["active"] -= 1
+                counts["served"] += 1
+                counts["dropped_frames"] += output.dropped_frames
+            changed.set()
+
+    threading.Thread(target=receive, daemon=True).start()
+    threading.Thread(target=beat, daemon=True).start()
+
+    # Every session gets a thread of its own, which only waits while its
+    # player is thinking, so one idle player never holds up another.
+    players = []
+    while True:
+        conn = sessions.get()
+        if conn is None:
+            break
+        player = threading.Thread(target=play, args=(conn,), name="session")
+        player.start()
+        players = [thread for thread in players if thread.is_alive()]
+        players.append(player)
+    for player in players:
+        player.join()
+    channel.close()
+
+
+class Host:
+    """Accepts connections and spreads them over worker processes."""
+
+    def __init__(
+        self,
+        address=("127.0.0.1", 4000),
+        workers=None,
+        width=80,
+        profile="full",
+        status_interval=10.0,
+        heartbeat=1.0,
+        queue_bytes=256 * 1024,
+        compress=False,
+        log=sys.stderr,
+    ):
+        self.address = address
+        self.worker_count = workers or os.cpu_count() or 1
+        self.width = width
+        self.profile = profile
+        self.status_interval = status_interval
+        self.heartbeat = heartbeat
+        self.queue_bytes = queue_bytes
+        self.compress = compress
+        self.log = log
+        self.workers = []
+        self.listener = None
+        self.draining = False
+        self._selector = selectors.DefaultSelector()
+
+    def start(self):
+        """Open the listening socket and start the workers."""
+        self.listener = socket.create_server(self.address, backlog=512)
+        self.listener.setblocking(False)
+        self.address = self.listener.getsockname()
+        self._selector.register(self.listener, selectors.EVENT_READ, self._accept)
+
+        compiled_game()  # once, before forking
+        if self.compress:
+            compression.scene_dictionary()  # build it once, before forking
+        context = multiprocessing.get_context("fork")
+        for index in range(self.worker_count):
+            parent_end, worker_end = socket.socketpair(
+                socket.AF_UNIX, socket.SOCK_SEQPACKET
+            )
+            process = context.Process(
+                target=_worker_main,
+                args=(
+                    index,
+                    worker_end,
+                    self.width,
+                    self.profile,
+                    self.heartbeat,
+                    self.queue_bytes,
+                    self.compress,
+                ),
+                daemon=True,
+            )
+            process.start()
+            worker_end.close()
+            worker = _Worker(index, process, parent_end)
+            self.workers.append(worker)
+            self._selector.register(parent_end, selectors.EVENT_READ, worker)
+        return self.address
+
+    def status(self):
+        """Return the last reported health of every worker."""
+        return [worker.status() for worker in self.workers]
+
+    def drain(self, *_):
+        """Stop accepting new players and let the workers finish up."""
+        if self.draining:
+            return
+        self.draining = True
+        self._selector.unregister(self.listener)
+        self.listener.close()
+        for worker in self.workers:
+            if worker.alive:
+                try:
+                    worker.channel.send(_DRAIN)
+                except OSError:
+                    pass
+
+    def serve_forever(self):
+        """Run until drained and every worker has exited."""
+        signal.signal(signal.SIGTERM, self.drain)
+        signal.signal(signal.SIGINT, self.drain)
+        next_status = time.monotonic() + self.status_interval
+        while any(worker.alive for worker in self.workers):
+            for key, _ in self._selector.select(timeout=0.5):
+                if key.data == self._accept:
+                    self._accept()
+                else:
+                    self._read_report(key.data)
+            if self.status_interval and time.monotonic() >= next_status:
+                next_status += self.status_interval
+                for line in self.status():
+                    print(json.dumps(line), file=self.log)
+        for worker in self.workers:
+            worker.process.join()
+
+    def _accept(self):
+        try:
+            conn, _ = self.listener.accept()
+        except (BlockingIOError, OSError):
+            return
+        live = [worker for worker in self.workers if worker.alive]
+        if not live:
+            conn.close()
+            return
+        worker = min(live, key=lambda w: w.load)
+        try:
+            socket.send_fds(worker.channel, [_SESSION], [conn.fileno()])
+            worker.queued += 1  # until the worker's own report arrives
+        except OSError:
+            pass
+        conn.close()
+
+    def _read_report(self, worker):
+        try:
+            message = worker.channel.recv(4096)
+        except OSError:
+            message = b""
+        if not message:
+            worker.alive = False
+            self._selector.unregister(worker.channel)
+            worker.channel.close()
+            return
+        report = json.loads(message)
+        worker.active = report["active"]
+        worker.queued = report["queued"]
+        worker.served = report["served"]
+        worker.output_depth = report["output_depth"]
+        worker.dropped_frames = report["dropped_frames"]
+        worker.last_report = time.monotonic()
+
+
+def _run_host(address, workers, ready):
+    host = Host(address, workers, status_interval=0)
+    ready.put(host.start())
+    host.serve_forever()
+
+
+def _process_stats(pid):
+    """Return a process's resident memory in KiB and its number of threads."""
+    fields = {}
+    with open(f"/proc/{pid}/status") as status:
+        for line in status:
+            key, _, value = line.partition(":")
+            fields[key] = value.split()
+    return int(fields["VmRSS"][0]), int(fields["Threads"][0])
+
+
+async def _player(address, answers, think, waits):
+    """Play the recorded playthrough like a person would: read a screen,
+    think, answer. Adds the time from each answer to the first byte of its
+    reply to waits."""
+    import asyncio
+
+    reader, writer = await asyncio.open_connection(*address)
+    replied = asyncio.Event()
+
+    async def read_all():
+        while await reader.read(65536):
+            replied.set()
+        replied.set()
+
+    reading = asyncio.create_task(read_all())
+    await replied.wait()
+    for answer in answers:
+        await asyncio.sleep(think)
+        replied.clear()
+        sent = time.perf_counter()
+        writer.write(answer + b"\n")
+        await replied.wait()
+        waits.append(time.perf_counter() - sent)
+    await reading
+    writer.close()
+
+
+async def _idle_player(address, seated, leave):
+    """Connect, read the first screen, and then never answer."""
+    import asyncio
+
+    reader, writer = await asyncio.open_connection(*address)
+    await reader.read(65536)
+    seated.release()
+    await leave.wait()
+    writer.close()
+
+
+async def _play(address, players, think, idle=0, sample=None):
+    """Seat idle players on the host, then play the active ones at the same
+    time. Returns the active players' wall time, their waits (sorted) and
+    what sample() returns once they are done, before the idle players go."""
+    import asyncio
+
+    import playthrough
+
+    answers = [answer.encode() for answer in playthrough.WALKTHROUGH]
+    # Idle players arrive a few at a time, as real ones would, rather than
+    # all in the same instant.
+    seated, leave = asyncio.Semaphore(0), asyncio.Event()
+    idlers = []
+    for first in range(0, idle, 50):
+        arriving = min(50, idle - first)
+        for _ in range(arriving):
+            idlers.append(asyncio.create_task(_idle_player(address, seated, leave)))
+        for _ in range(arriving):
+            await seated.acquire()
+    waits = []
+    start = time.perf_counter()
+    await asyncio.gather(
+        *(_player(address, answers, think, waits) for _ in range(players))
+    )
+    wall = time.perf_counter() - start
+    sampled = sample() if sample else None
+    leave.set()
+    await asyncio.gather(*idlers)
+    return wall, sorted(waits), sampled
+
+
+def _percentile(values, fraction):
+    return values[min(int(len(values) * fraction), len(values) - 1)] if values else 0.0
+
+
+def loadtest(
+    worker_counts=None, players=64, think=0.5, idle_counts=(500, 1000, 2000)
+):
+    """Measure how long players wait for replies while the others think.
+
+    Every player plays the recorded playthrough at the same time, thinking
+    for think seconds before each answer. For each number of workers this
+    prints sessions completed per second and the time from an answer to the
+    first byte of its reply.
+
+    Then, on a single worker, idle players who connect and never answer are
+    seated before the same players play: the worker's memory and threads show
+    what each idle player costs, and the waits show whether they slow down
+    the players who are still answering.
+    """
+    import asyncio
+
+    if worker_counts is None:
+        worker_counts = [1]
+        while worker_counts[-1] * 2 <= (os.cpu_count() or 1):
+            worker_counts.append(worker_counts[-1] * 2)
+
+    context = multiprocessing.get_context("fork")
+
+    def run(workers, idle=0):
+        ready = context.Queue()
+        server = context.Process(
+            target=_run_host, args=(("127.0.0.1", 0), workers, ready)
+        )
+        server.start()
+        address = ready.get()
+
+        def sample():
+            with open(f"/proc/{server.pid}/task/{server.pid}/children") as pids:
+                return _process_stats(int(pids.read().split()[0]))
+
+        try:
+            wall, waits, (rss, threads) = asyncio.run(
+                _play(address, players, think, idle, sample)
+            )
+        finally:
+            os.kill(server.pid, signal.SIGTERM)
+            server.join()
+        return wall, waits, rss, threads
+
+    print(f"{'workers':>7}{'players':>9}{'sessions/s':>12}"
+          f"{'wait p50':>10}{'wait p99':>10}")
+    for count in worker_counts:
+        wall, waits, _, _ = run(count)
+        print(f"{count:>7}{players:>9}{players / wall:>12.1f}"
+              f"{_percentile(waits, 0.5) * 1e3:>8.1f}ms"
+              f"{_percentile(waits, 0.99) * 1e3:>8.1f}ms")
+
+    print(f"\n{'idle':>7}{'worker rss':>12}{'per idle':>10}{'threads':>9}"
+          f"{'wait p50':>10}{'wait p99':>10}   (one worker, {players} players)")
+    _, _, base_rss, _ = run(1)
+    for idle in idle_counts:
+        _, waits, rss, threads = run(1, idle)
+        print(f"{idle:>7}{rss / 1024:>10.1f}MB{(rss - base_rss) / idle:>8.0f}KB"
+              f"{threads:>9}{_percentile(waits, 0.5) * 1e3:>8.1f}ms"
+              f"{_percentile(waits, 0.99) * 1e3:>8.1f}ms")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    serve = commands.add_parser("serve", help="host the game")
+    serve.add_argument("--host", default="127.0.0.1")
+    serve.add_argument("--port", type=int, default=4000)
+    serve.add_argument("--workers", type=int, default=None)
+    serve.add_argument("--width", type=int, default=80)
+    serve.add_argument(
+        "--profile", choices=gametools.OUTPUT_PROFILES, default="full"
+    )
+    serve.add_argument("--status-interval", type=float, default=10.0)
+    serve.add_argument(
+        "--compress", action="store_true",
+        help="offer compressed output to clients that support MCCP2",
+    )
+
+    test = commands.add_parser(
+        "loadtest", help="measure waits with players who think between answers"
+    )
+    test.add_argument("--workers", type=int, nargs="*", default=None)
+    test.add_argument("--players", type=int, default=64)
+    test.add_argument("--think", type=float, default=0.5)
+    test.add_argument("--idle", type=int, nargs="*", default=[500, 1000, 2000])
+
+    args = parser.parse_args(argv)
+    if args.command == "serve":
+        host = Host(
+            (args.host, args.port),
+            args.workers,
+            args.width,
+            args.profile,
+            args.status_interval,
+            compress=args.compress,
+        )
+        address = host.start()
+        print(f"hosting on {address[0]}:{address[1]} with "
+              f"{host.worker_count} workers", file=sys.stderr)
+        host.serve_forever()
+    else:
+        loadtest(args.workers, args.players, args.think, args.idle)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,218 @@
+"""
+LATENCY.PY
+
+Measures what players actually feel: the delay between pressing a key at a
+get_choice() or pause() prompt and the next frame appearing on their screen.
+
+game.py is started under a pseudo-terminal, exactly as if a player had run it
+in their terminal, so beaupy's menus and pause()'s key reads behave as they do
+for real. The recorded playthrough is typed into it one answer at a time,
+picking each menu option with the arrow keys as it appears on screen. For
+every batch the time until the first byte of the response arrives and the
+time until the frame is complete (no more output for a short quiet period)
+are recorded. Each frame is matched to its scene by the scene's heading, and
+the results are reported per scene transition as p50, p95 and p99 latencies.
+
+    python latency.py              # 5 playthroughs
+    python latency.py --runs 20
+"""
+
+import argparse
+import ast
+import os
+import pty
+import re
+import select
+import struct
+import sys
+import time
+from collections import defaultdict
+from dataclasses import dataclass
+
+import playthrough
+import scenegraph
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+DOWN = b"\x1b[B"
+ENTER = b"\r"
+ANY_KEY = b" "
+
+_ANSI = re.compile(rb"\x1b\[[0-9;?]*[A-Za-z]|\x1b[()][A-Z0-9]")
+
+
+@dataclass
+class Sample:
+    """The response to one batch of keystrokes."""
+
+    transition: str
+    first_byte: float
+    frame: float
+
+
+def scene_headings(path=scenegraph.GAME_PATH):
+    """Map the heading each scene opens with to the scene's name."""
+    with open(path, encoding="utf-8") as source:
+        tree = ast.parse(source.read())
+    headings = {}
+    for func in tree.body:
+        if not isinstance(func, ast.FunctionDef):
+            continue
+        for node in ast.walk(func):
+            if (
+                isinstance(node, ast.Call)
+                and getattr(node.func, "id", None) == "write_md"
+                and node.args
+                and isinstance(node.args[0], (ast.Constant, ast.JoinedStr))
+            ):
+                arg = node.args[0]
+                parts = arg.values if isinstance(arg, ast.JoinedStr) else [arg]
+                text = "".join(
+                    part.value for part in parts if isinstance(part, ast.Constant)
+                )
+                match = re.search(r"^\s*# (.+?)\s*$", text, re.MULTILINE)
+                if match:
+                    headings[match.group(1)] = func.name
+                break
+    return headings
+
+
+def _menu(plain):
+    """Return the options of the menu on screen, top to bottom."""
+    start = plain.rfind("\r> ")
+    if start < 0:
+        return []
+    options = []
+    for line in plain[start + 1 :].splitlines():
+        if not line.startswith(("> ", "  ")):
+            break
+        options.append(line[2:].strip())
+    return options
+
+
+def keystrokes(answer, screen):
+    """Return the keys a player would press to give answer on this screen.
+
+    Menu options are picked with the down arrow and Enter, counting from the
+    top of the menu shown; every other prompt gets a single key press.
+    """
+    if not answer:
+        return ANY_KEY
+    options = _menu(screen)
+    if answer not in options:
+        raise ValueError(f"{answer!r} is not on the menu {options}")
+    return DOWN * options.index(answer) + ENTER
+
+
+def _read_frame(fd, quiet, timeout):
+    """Read until the output goes quiet; return (first, last, data)."""
+    first = last = None
+    data = b""
+    deadline = time.perf_counter() + timeout
+    while True:
+        wait = quiet if first is not None else deadline - time.perf_counter()
+        ready, _, _ = select.select([fd], [], [], max(wait, 0))
+        if not ready:
+            break
+        try:
+            chunk = os.read(fd, 65536)
+        except OSError:  # the game has exited
+            chunk = b""
+        if not chunk:
+            break
+        last = time.perf_counter()
+        if first is None:
+            first = last
+        data += chunk
+    return first, last, data
+
+
+def trace(
+    answers=playthrough.WALKTHROUGH,
+    command=None,
+    quiet=0.1,
+    timeout=10.0,
+    width=80,
+    height=24,
+):
+    """Play the game under a pseudo-terminal and time every response."""
+    import fcntl
+    import termios
+
+    command = command or [sys.executable, os.path.join(HERE, "game.py")]
+    headings = scene_headings()
+    pid, fd = pty.fork()
+    if pid == 0:
+        os.chdir(HERE)
+        os.environ["TERM"] = os.environ.get("TERM", "xterm-256color")
+        os.execv(command[0], command)
+
+    fcntl.ioctl(fd, termios.TIOCSWINSZ, struct.pack("HHHH", height, width, 0, 0))
+
+    def scene_in(plain, current):
+        found = [(plain.rfind(text), name) for text, name in headings.items()]
+        found = [item for item in found if item[0] >= 0]
+        return max(found)[1] if found else current
+
+    samples = []
+    try:
+        _, _, data = _read_frame(fd, quiet, timeout)
+        screen = _ANSI.sub(b"", data).decode("utf-8", "replace")
+        scene = scene_in(screen, "start")
+        for answer in answers:
+            key = keystrokes(answer, screen)
+            sent = time.perf_counter()
+            os.write(fd, key)
+            first, last, data = _read_frame(fd, quiet, timeout)
+            if first is None:
+                break
+            screen = _ANSI.sub(b"", data).decode("utf-8", "replace")
+            next_scene = scene_in(screen, scene)
+            samples.append(
+                Sample(f"{scene} -> {next_scene}", first - sent, last - sent)
+            )
+            scene = next_scene
+    finally:
+        os.close(fd)
+        os.waitpid(pid, 0)
+    return samples
+
+
+def percentile(values, percent):
+    """Nearest-rank percentile of a list of numbers."""
+    ordered = sorted(values)
+    rank = max(1, -(-len(ordered) * percent // 100))
+    return ordered[int(rank) - 1]
+
+
+def report(samples):
+    """Print frame latency percentiles for every scene transition."""
+    by_transition = defaultdict(list)
+    for sample in samples:
+        by_transition[sample.transition].append(sample)
+
+    print(
+        f"{'transition':<28}{'n':>4}{'first p50':>11}"
+        f"{'frame p50':>11}{'p95':>9}{'p99':>9}   (ms)"
+    )
+    for transition, group in by_transition.items():
+        frames = [sample.frame * 1e3 for sample in group]
+        firsts = [sample.first_byte * 1e3 for sample in group]
+        print(
+            f"{transition:<28}{len(group):>4}{percentile(firsts, 50):>11.1f}"
+            f"{percentile(frames, 50):>11.1f}{percentile(frames, 95):>9.1f}"
+            f"{percentile(frames, 99):>9.1f}"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Time keypress-to-frame latency.")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--quiet", type=float, default=0.1,
+                        help="seconds of silence that end a frame")
+    args = parser.parse_args()
+
+    samples = []
+    for _ in range(args.runs):
+        samples.extend(trace(quiet=args.quiet))
+    report(samples)
@@ -0,0 +1,79 @@
+"""
+MARKDOWN_BENCH.PY
+
+Checks that write_md()'s fast markdown renderer gives exactly the same output
+as rich.Markdown for every passage in game.py, and times the two.
+
+Run it with: python markdown_bench.py
+"""
+
+import ast
+from textwrap import dedent
+from timeit import timeit
+
+from rich.console import Console
+from rich.markdown import Markdown
+
+import gametools
+from scenegraph import GAME_PATH
+
+
+def scene_passages(path=GAME_PATH):
+    """Return every passage game.py passes to write_md(), dedented and stripped.
+
+    f-strings are filled in with each value the game can give them.
+    """
+    with open(path, encoding="utf-8") as source:
+        tree = ast.parse(source.read())
+    passages = []
+    for node in ast.walk(tree):
+        if not (
+            isinstance(node, ast.Call)
+            and getattr(node.func, "id", None) == "write_md"
+            and node.args
+        ):
+            continue
+        arg = node.args[0]
+        if isinstance(arg, ast.Constant):
+            passages.append(arg.value)
+        elif isinstance(arg, ast.JoinedStr):
+            code = compile(ast.Expression(arg), path, "eval")
+            for door_state in ("open", "sealed"):
+                passages.append(eval(code, {}, {"door_state": door_state}))
+    return [dedent(text).strip() for text in passages]
+
+
+def render(renderable, width, color_system):
+    console = Console(width=width, force_terminal=True, color_system=color_system)
+    with console.capture() as capture:
+        console.print(renderable)
+    return capture.get()
+
+
+if __name__ == "__main__":
+    passages = scene_passages()
+    fast = [gametools._parse_simple_markdown(text) for text in passages]
+    on_fast_path = sum(blocks is not None for blocks in fast)
+    print(f"{len(passages)} passages, {on_fast_path} on the fast path")
+
+    mismatches = 0
+    for text, blocks in zip(passages, fast):
+        if blocks is None:
+            continue
+        for width in (40, 80, 120):
+            for color_system in ("truecolor", "standard", None):
+                expected = render(Markdown(text), width, color_system)
+                actual = render(gametools._SimpleMarkdown(blocks), width, color_system)
+                mismatches += expected != actual
+    print(f"mismatched renders: {mismatches}")
+
+    runs = 20
+    for label, make in (
+        ("rich.Markdown", Markdown),
+        ("fast path", gametools._markdown),
+    ):
+        seconds = timeit(
+            lambda: [render(make(text), 80, "truecolor") for text in passages],
+            number=runs,
+        )
+        print(f"{label:<14} {seconds / runs / len(passages) * 1e3:7.3f} ms per passage")
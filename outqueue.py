@@ -0,0 +1,183 @@
+"""
+OUTQUEUE.PY
+
+A bounded output queue for a player connected over a socket.
+
+Everything the game prints is queued here and sent by a background thread, so
+a player on a slow connection never stalls the scene mid-sentence. The queue
+is kept small in two ways:
+
+- At every input point (gametools flushes stdout before it waits for input)
+  the scene is paused until the player has caught up to the low water mark.
+  Scenes only print a screenful or so between prompts, so the queue stays
+  bounded. If a scene prints more than max_bytes in one go, it is held up
+  right there until there is room.
+- Spinner frames from spin() are transient: a new frame replaces any frame
+  that has not been sent yet instead of queuing behind it. Only the most
+  recent frame is ever waiting, and every frame replaced this way is counted
+  as dropped.
+
+stats() reports the queue depth and dropped-frame counts.
+
+If the player negotiated compression (see compression.py), queued text is
+compressed by the sending thread just before it goes out. The stream is
+flushed whenever the queue runs empty, so a burst of writes is compressed
+together but nothing is ever held back.
+"""
+
+import io
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+
+class OutputQueue(io.TextIOBase):
+    """A file-like object that sends text to a socket through a bounded queue.
+
+    Use it in place of sys.stdout for a networked session.
+    """
+
+    def __init__(
+        self,
+        sock,
+        low_water=16 * 1024,
+        max_bytes=256 * 1024,
+        encoding="utf-8",
+        newline="\r\n",
+        compressor=None,
+    ):
+        self.sock = sock
+        self.compressor = compressor
+        self.low_water = low_water
+        self.max_bytes = max_bytes
+        self._encoding = encoding
+        self._newline = newline
+        self._chunks = deque()  # [bytes, transient]
+        self._depth = 0
+        self._transient = False
+        self._closed = False
+        self._failed = False
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+
+        self.bytes_sent = 0
+        self.max_depth = 0
+        self.dropped_frames = 0
+        self.stalls = 0
+        self.stalled_seconds = 0.0
+
+        self._sender = threading.Thread(target=self._send_loop, daemon=True)
+        self._sender.start()
+
+    @property
+    def encoding(self):
+        return self._encoding
+
+    def writable(self):
+        return True
+
+    def isatty(self):
+        return False
+
+    @contextmanager
+    def transient(self):
+        """Mark everything written inside the block as a replaceable frame."""
+        self._transient = True
+        try:
+            yield
+        finally:
+            self._transient = False
+
+    def write(self, text):
+        if self._failed:
+            raise BrokenPipeError("the player has disconnected")
+        data = text.replace("\n", self._newline).encode(self._encoding, "replace")
+        with self._lock:
+            if self._transient:
+                if self._chunks and self._chunks[-1][1]:
+                    self._depth -= len(self._chunks.pop()[0])
+                    self.dropped_frames += 1
+            else:
+                self._wait_below(self.max_bytes - len(data))
+            self._chunks.append([data, self._transient])
+            self._depth += len(data)
+            self.max_depth = max(self.max_depth, self._depth)
+            self._changed.notify_all()
+        return len(text)
+
+    def flush(self):
+        """Wait until the player has caught up to the low water mark."""
+        with self._lock:
+            self._wait_below(self.low_water)
+        if self._failed:
+            raise BrokenPipeError("the player has disconnected")
+
+    def close(self, timeout=5.0):
+        """Send whatever is left (waiting up to timeout seconds) and stop."""
+        with self._lock:
+            deadline = time.monotonic() + timeout
+            while self._depth and not self._failed:
+                if not self._changed.wait(deadline - time.monotonic()):
+                    break
+            self._closed = True
+            self._changed.notify_all()
+        self._sender.join(timeout)
+        super().close()
+
+    def stats(self):
+        """Return the queue's current depth and its counters so far."""
+        with self._lock:
+            return {
+                "depth": self._depth,
+                "max_depth": self.max_depth,
+                "bytes_sent": self.bytes_sent,
+                "dropped_frames": self.dropped_frames,
+                "stalls": self.stalls,
+                "stalled_seconds": round(self.stalled_seconds, 3),
+            }
+
+    def _wait_below(self, limit):
+        # called with the lock held
+        if self._depth <= max(limit, 0) or self._failed:
+            return
+        self.stalls += 1
+        start = time.monotonic()
+        while self._depth > max(limit, 0) and not self._failed:
+            self._changed.wait()
+        self.stalled_seconds += time.monotonic() - start
+
+    def _send_loop(self):
+        while True:
+            with self._lock:
+                while not self._chunks and not self._closed:
+                    self._changed.wait()
+                if not self._chunks:
+                    break
+                chunk = self._chunks[0]
+                chunk[1] = False  # being sent: no longer replaceable
+                last = len(self._chunks) == 1
+            data = chunk[0]
+            if self.compressor:
+                data = self.compressor.compress(data, flush=last)
+            try:
+                self.sock.sendall(data)
+            except OSError:
+                with self._lock:
+                    self._failed = True
+                    self._chunks.clear()
+                    self._depth = 0
+                    self._changed.notify_all()
+                return
+            with self._lock:
+                self._chunks.popleft()
+                self._depth -= len(chunk[0])
+                self.bytes_sent += len(chunk[0])
+                self._changed.notify_all()
+        # Ending the stream here rather than in close(), which may give up
+        # waiting, means nothing can be sent after it.
+        if self.compressor:
+            try:
+                self.sock.sendall(self.compressor.finish())
+            except OSError:
+                pass
@@ -0,0 +1,61 @@
+"""
+PARSER_BENCH.PY
+
+Times gametools.CommandParser on menus with ever larger vocabularies: building
+it, resolving a command, and completing one, with resolving compared against
+checking every choice's words in turn.
+
+Run it with: python parser_bench.py
+"""
+
+import random
+from time import perf_counter
+
+from gametools import CommandParser, _words
+
+
+def scan(menu_words, command):
+    """Resolve command the slow way, by checking every choice's words."""
+    return [
+        index
+        for index, words in enumerate(menu_words)
+        if all(any(w.startswith(typed) for w in words) for typed in _words(command))
+    ]
+
+
+def bench(sizes=(10, 1_000, 10_000)):
+    chooser = random.Random(2110)
+    vocabulary = [
+        "".join(chooser.choice("abcdefghijklmnopqrstuvwxyz") for _ in range(7))
+        for _ in range(50_000)
+    ]
+    print(f"{'choices':>8}{'build':>10}{'resolve':>12}{'scan':>12}{'complete':>12}")
+    for size in sizes:
+        menu = [f"Go {vocabulary[2 * i]} {vocabulary[2 * i + 1]}" for i in range(size)]
+        commands = [f"go {chooser.choice(menu).split()[2][:5]}" for _ in range(1000)]
+
+        start = perf_counter()
+        parser = CommandParser(menu)
+        build = perf_counter() - start
+
+        start = perf_counter()
+        picked = [parser.resolve(command) for command in commands]
+        resolve = (perf_counter() - start) / len(commands)
+
+        menu_words = [_words(choice) for choice in menu]
+        start = perf_counter()
+        scanned = [scan(menu_words, command) for command in commands[:20]]
+        scanned_each = (perf_counter() - start) / 20
+        assert [found[0] if len(found) == 1 else None for found in scanned] == picked[:20]
+
+        start = perf_counter()
+        for command in commands[:100]:
+            parser.complete(command[:-2])
+        complete = (perf_counter() - start) / 100
+
+        print(f"{size:>8}{build * 1e3:>8.1f}ms{resolve * 1e6:>10.1f}us"
+              f"{scanned_each * 1e6:>10.0f}us{complete * 1e6:>10.1f}us")
+
+
+if __name__ == "__main__":
+    bench()
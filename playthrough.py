@@ -0,0 +1,103 @@
+"""
+PLAYTHROUGH.PY
+
+A recorded playthrough of game.py that visits every scene a player can reach
+from intro(), a helper that replays it without anyone at the keyboard, and one
+that catches what the game prints instead of showing it:
+
+    text = play_captured(profile="plain").getvalue()
+"""
+
+import io
+import sys
+from contextlib import contextmanager
+
+import game
+import gametools
+
+# One line per prompt, in the order the game asks for them, exactly as a player
+# would pipe them in. Menus are answered with the text of the option to pick;
+# pauses with an empty line.
+WALKTHROUGH = [
+    "",  # intro: find your feet
+    "Examine your inventory",
+    "",
+    "Call out to see if anyone is alive",
+    "",
+    "Turn on the flashlight",
+    "",
+    "Examine your inventory",
+    "",
+    "Go South through the cell door",
+    "Go East (toward the big door)",  # sealed without the keycard
+    "",
+    "View Inventory",
+    "",
+    "Take the Level-1 Keycard",
+    "",
+    "Go North (back to cell)",
+    "Go South through the cell door",
+    "Go East (toward the big door)",
+    "",  # swipe the keycard
+    "",  # accept the end
+]
+
+
+def replay(answers=WALKTHROUGH, start=None, on_scene=None):
+    """Run the game from start (intro by default) answering from a list.
+
+    If on_scene is given it is called with the name of each scene just before
+    the scene runs, and once more with None when the game ends.
+    """
+    def on_each_scene(scene):
+        if on_scene:
+            on_scene(scene.__name__)
+
+    gametools.set_input_source(answers)
+    try:
+        game.play(start or game.intro, on_scene=on_each_scene)
+    finally:
+        gametools.set_input_source()
+        if on_scene:
+            on_scene(None)
+
+
+@contextmanager
+def captured(output=None, profile=None, width=None):
+    """Send everything the game prints inside the block to output (a new
+    StringIO by default), which is yielded.
+
+    If given, the output profile and terminal width are used inside the block
+    and put back after it.
+    """
+    output = io.StringIO() if output is None else output
+    saved_stdout, saved_profile = sys.stdout, gametools.get_output_profile()
+    sys.stdout = output
+    try:
+        if profile:
+            gametools.set_output_profile(profile)
+        if width:
+            gametools.set_terminal_width(width)
+        yield output
+    finally:
+        sys.stdout = saved_stdout
+        if profile:
+            gametools.set_output_profile(saved_profile)
+        if width:
+            gametools.set_terminal_width()
+
+
+def play_captured(
+    answers=WALKTHROUGH,
+    start=None,
+    on_scene=None,
+    output=None,
+    profile=None,
+    width=None,
+):
+    """Start a new game and replay() it inside captured(); return the output
+    it was sent to."""
+    with captured(output, profile, width) as output:
+        game.reset()
+        replay(answers, start, on_scene)
+    return output
@@ -0,0 +1,374 @@
+"""
+SCENEGRAPH.PY
+
+Works out which scene can follow which in game.py without running the game.
+
+Scenes pick their successor by returning a function, so the only way to know
+"what can come after hall()?" at runtime is to play it. This module reads
+game.py's source instead: every function that clears the screen is a scene,
+and its return statements, calls to other scenes and calls to exit() are its
+ways out. For each of these it also records the menu the player was choosing
+from and the state checks (if statements) that guard it.
+
+The result is a transition table, mapping each scene name to the names of the
+scenes that can follow it, so a scene's successors are one dictionary lookup
+away (zygote.py walks it to warm up every scene a player can reach). The
+runtime builds it in memory; it can also be saved as JSON for reading.
+
+Run this file to print the table along with any problems found:
+
+    python scenegraph.py            # report
+    python scenegraph.py --write    # also save scene_table.json
+"""
+
+import ast
+import inspect
+import json
+import os
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+from functools import lru_cache, wraps
+
+GAME_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "game.py")
+TABLE_PATH = os.path.join(os.path.dirname(GAME_PATH), "scene_table.json")
+
+START_SCENE = "intro"
+
+
+@dataclass
+class Transition:
+    """One way out of a scene."""
+
+    target: str  # a scene name, "exit" or "end" (the scene returned None)
+    kind: str  # "return", "call" or "exit"
+    line: int
+    conditions: list = field(default_factory=list)
+
+
+@dataclass
+class Scene:
+    """Everything the analyzer learned about one scene function."""
+
+    name: str
+    line: int
+    transitions: list = field(default_factory=list)
+    menus: list = field(default_factory=list)
+    dead_choices: list = field(default_factory=list)
+
+    @property
+    def successors(self):
+        """Names of the scenes that can follow this one, in source order."""
+        names = []
+        for transition in self.transitions:
+            if transition.kind != "exit" and transition.target not in names:
+                names.append(transition.target)
+        return names
+
+
+def _is_scene(func):
+    for node in ast.walk(func):
+        if (
+            isinstance(node, ast.Call)
+            and isinstance(node.func, ast.Name)
+            and node.func.id == "clear"
+        ):
+            return True
+    return False
+
+
+def _call_name(node):
+    if isinstance(node, ast.Call) and isinstance(node.func, ast.Name):
+        return node.func.id
+    return None
+
+
+class _SceneVisitor(ast.NodeVisitor):
+    """Walks one scene function, keeping track of the if tests around it."""
+
+    def __init__(self, scene, scene_names):
+        self.scene = scene
+        self.scene_names = scene_names
+        self.conditions = []
+        self.lists = {}  # variable name -> list literal assigned to it
+        self.menus = {}  # variable holding a choice -> number of options
+
+    def _add(self, target, kind, node):
+        self.scene.transitions.append(
+            Transition(target, kind, node.lineno, list(self.conditions))
+        )
+
+    def visit_If(self, node):
+        test = ast.unparse(node.test)
+        self.visit(node.test)
+        self.conditions.append(test)
+        for child in node.body:
+            self.visit(child)
+        self.conditions[-1] = f"not ({test})"
+        for child in node.orelse:
+            self.visit(child)
+        self.conditions.pop()
+        self._check_dead_choice(node.test)
+
+    def visit_Assign(self, node):
+        if isinstance(node.value, ast.List):
+            for target in node.targets:
+                if isinstance(target, ast.Name):
+                    self.lists[target.id] = node.value
+        if _call_name(node.value) == "get_choice" and node.value.args:
+            options = node.value.args[0]
+            if isinstance(options, ast.Name):
+                options = self.lists.get(options.id)
+            if isinstance(options, ast.List):
+                texts = [ast.literal_eval(elt) for elt in options.elts]
+                self.scene.menus.append(texts)
+                for target in node.targets:
+                    if isinstance(target, ast.Name):
+                        self.menus[target.id] = len(texts)
+        self.generic_visit(node)
+
+    def visit_Return(self, node):
+        value = node.value
+        if value is None or (isinstance(value, ast.Constant) and value.value is None):
+            self._add("end", "return", node)
+        elif isinstance(value, ast.Name) and value.id in self.scene_names:
+            self._add(value.id, "return", node)
+        elif _call_name(value) in self.scene_names:
+            self._add(value.func.id, "call", node)
+            return
+        self.generic_visit(node)
+
+    def visit_Call(self, node):
+        name = _call_name(node)
+        if name in ("exit", "quit") or ast.unparse(node.func) == "sys.exit":
+            self._add("exit", "exit", node)
+        elif name in self.scene_names:
+            self._add(name, "call", node)
+        self.generic_visit(node)
+
+    def _check_dead_choice(self, test):
+        # choice == 4 when the menu only has options 0..3 can never be true
+        if (
+            isinstance(test, ast.Compare)
+            and isinstance(test.left, ast.Name)
+            and test.left.id in self.menus
+            and len(test.ops) == 1
+            and isinstance(test.ops[0], ast.Eq)
+            and isinstance(test.comparators[0], ast.Constant)
+            and isinstance(test.comparators[0].value, int)
+            and test.comparators[0].value >= self.menus[test.left.id]
+        ):
+            self.scene.dead_choices.append(test.lineno)
+
+
+def _is_exit(node):
+    return isinstance(node, ast.Expr) and isinstance(node.value, ast.Call) and (
+        _call_name(node.value) in ("exit", "quit")
+        or ast.unparse(node.value.func) == "sys.exit"
+    )
+
+
+def _falls_through(body):
+    last = body[-1]
+    if isinstance(last, (ast.Return, ast.Raise)) or _is_exit(last):
+        return False
+    if isinstance(last, ast.If):
+        return (
+            _falls_through(last.body)
+            or not last.orelse
+            or _falls_through(last.orelse)
+        )
+    return True
+
+
+def analyze(path=GAME_PATH):
+    """Read a game file and return a dict of scene name -> Scene."""
+    with open(path, encoding="utf-8") as source:
+        tree = ast.parse(source.read(), filename=path)
+
+    funcs = [
+        node
+        for node in tree.body
+        if isinstance(node, ast.FunctionDef) and _is_scene(node)
+    ]
+    scene_names = {func.name for func in funcs}
+    scenes = {}
+    for func in funcs:
+        scene = Scene(func.name, func.lineno)
+        _SceneVisitor(scene, scene_names).visit(func)
+        # Falling off the end of a scene returns None, which ends the game
+        if _falls_through(func.body):
+            line = func.body[-1].end_lineno
+            scene.transitions.append(Transition("end", "return", line))
+        scenes[func.name] = scene
+    return scenes
+
+
+@lru_cache(maxsize=None)
+def scene_names(path=GAME_PATH):
+    """Return the names of the scenes in a game file, in source order."""
+    return tuple(analyze(path))
+
+
+@contextmanager
+def watching_scenes(namespace, entered):
+    """Call entered(name) whenever a scene starts inside the block.
+
+    Every scene function in namespace (a game module's globals, or a namespace
+    from asyncgame.new_game()) is swapped for a wrapper while the block runs,
+    so scenes that call the next scene directly are seen as well as the ones
+    game.play() starts. Scenes must be looked up inside the block to be seen:
+    game.play(game.intro), not game.play().
+    """
+    originals = {
+        name: namespace[name] for name in scene_names() if name in namespace
+    }
+    for name, scene in originals.items():
+        namespace[name] = _entering(scene, name, entered)
+    try:
+        yield
+    finally:
+        namespace.update(originals)
+
+
+def _entering(scene, name, entered):
+    """Wrap a scene function so entered(name) is called whenever it starts."""
+    if inspect.iscoroutinefunction(scene):
+
+        @wraps(scene)
+        async def wrapper(*args, **kwargs):
+            entered(name)
+            return await scene(*args, **kwargs)
+
+    else:
+
+        @wraps(scene)
+        def wrapper(*args, **kwargs):
+            entered(name)
+            return scene(*args, **kwargs)
+
+    return wrapper
+
+
+def reachable(scenes, start=START_SCENE):
+    """Return the set of scene names that can be reached from start."""
+    seen = {start}
+    waiting = [start]
+    while waiting:
+        for name in scenes[waiting.pop()].successors:
+            if name in scenes and name not in seen:
+                seen.add(name)
+                waiting.append(name)
+    return seen
+
+
+def started_by_play(scenes, start=START_SCENE):
+    """Return the set of scene names that game.play() itself starts.
+
+    play() sees the start scene and every scene another scene returns. A scene
+    that is only ever called directly runs inside its caller's turn, so
+    play()'s on_scene hook never sees it begin.
+    """
+    started = {start}
+    for scene in scenes.values():
+        for transition in scene.transitions:
+            if transition.kind == "return" and transition.target in scenes:
+                started.add(transition.target)
+    return started
+
+
+def problems(scenes, start=START_SCENE):
+    """Return a list of human readable problems found in the scene graph."""
+    found = []
+    seen = reachable(scenes, start)
+    for name, scene in scenes.items():
+        if name not in seen:
+            found.append(f"{name}() (line {scene.line}) can never be reached")
+        for transition in scene.transitions:
+            if transition.kind == "call":
+                found.append(
+                    f"{name}() calls {transition.target}() on line "
+                    f"{transition.line} instead of returning it"
+                )
+            elif transition.target == "end":
+                found.append(
+                    f"{name}() can return None on line {transition.line}, "
+                    "which ends the game"
+                )
+        for line in scene.dead_choices:
+            found.append(
+                f"{name}() tests for a choice that is not offered on line {line}"
+            )
+    return found
+
+
+def build_table(scenes, start=START_SCENE):
+    """Turn analyzed scenes into the plain dictionary saved as JSON."""
+    return {
+        "start": start,
+        "successors": {name: scene.successors for name, scene in scenes.items()},
+        "unreachable": sorted(set(scenes) - reachable(scenes, start)),
+        "scenes": {name: asdict(scene) for name, scene in scenes.items()},
+    }
+
+
+def write_table(path=TABLE_PATH, game_path=GAME_PATH):
+    """Analyze the game and save its transition table as JSON."""
+    table = build_table(analyze(game_path))
+    with open(path, "w", encoding="utf-8") as out:
+        json.dump(table, out, indent=2)
+    return table
+
+
+@lru_cache(maxsize=None)
+def _table(game_path, modified):
+    return build_table(analyze(game_path))
+
+
+def load_table(game_path=GAME_PATH):
+    """Return the transition table, analyzing the game again only if it has
+    changed since the last call. The table is kept in memory, so nothing is
+    written next to the source (which may be read-only)."""
+    return _table(game_path, os.path.getmtime(game_path))
+
+
+class TransitionTable:
+    """Constant-time lookups over a transition table.
+
+    Scene functions are looked up by name in the module they came from, so the
+    runtime can go from the scene that is running to the functions that may
+    run next, for example to warm up caches for them.
+    """
+
+    def __init__(self, module, table=None):
+        self.table = table or load_table()
+        self.functions = {
+            name: getattr(module, name) for name in self.table["successors"]
+        }
+        self._next = {
+            name: tuple(self.functions[n] for n in names if n in self.functions)
+            for name, names in self.table["successors"].items()
+        }
+
+    def successors(self, scene):
+        """Return the scene functions that can follow a scene (or its name)."""
+        name = scene if isinstance(scene, str) else scene.__name__
+        return self._next.get(name, ())
+
+    def prewarm(self, scene, warm):
+        """Call warm() with every scene that can follow the given scene."""
+        for successor in self.successors(scene):
+            warm(successor)
+
+
+if __name__ == "__main__":
+    import sys
+
+    scenes = analyze()
+    for name, scene in scenes.items():
+        print(f"{name:<20} -> {', '.join(scene.successors) or '(none)'}")
+    print()
+    for problem in problems(scenes):
+        print(f"  ! {problem}")
+    if "--write" in sys.argv:
+        write_table()
+        print(f"\nsaved {TABLE_PATH}")
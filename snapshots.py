@@ -0,0 +1,176 @@
+"""
+SNAPSHOTS.PY
+
+Snapshots of a game in progress, so alternative choices can be tried from the
+same point without replaying the whole game from intro().
+
+A snapshot is taken between scenes, so all it needs is the name of the scene
+about to run plus the game_state and inventory lists. Both are stored as
+tuples, which every fork of a snapshot shares instead of copying: forking only
+builds whatever was changed.
+
+    start = take_snapshot("final_signal")
+    results = run_branches(start, [["Run toward the flare"], ["Hide and observe"]])
+
+Run this file to compare the cost of forking with a full replay.
+"""
+
+from dataclasses import dataclass, replace
+
+import game
+import gametools
+import playthrough
+from scenegraph import analyze, started_by_play
+
+
+@dataclass(frozen=True)
+class Snapshot:
+    """The point between two scenes that a branch can be started from."""
+
+    scene: str
+    game_state: tuple = ()
+    inventory: tuple = ()
+
+    def fork(self, **changes):
+        """Return a copy of this snapshot with some fields changed.
+
+        Fields that are not changed are shared with this snapshot, for example
+        snapshot.fork(inventory=snapshot.inventory + ("Pipe Spear",)).
+        """
+        return replace(self, **changes)
+
+
+@dataclass
+class BranchResult:
+    """What happened when a branch was played out."""
+
+    answers: list
+    scenes: list
+    game_state: tuple
+    inventory: tuple
+    transcript: str
+
+
+class _Stop(Exception):
+    pass
+
+
+def take_snapshot(scene):
+    """Capture the running game just before the given scene (or scene name)."""
+    if callable(scene):
+        scene = scene.__name__
+    return Snapshot(scene, tuple(game.game_state), tuple(game.inventory))
+
+
+def restore(snapshot):
+    """Load a snapshot into the game and return the scene it stopped before."""
+    game.game_state[:] = snapshot.game_state
+    game.inventory[:] = snapshot.inventory
+    return getattr(game, snapshot.scene)
+
+
+def snapshot_after(answers, scene):
+    """Play from intro() answering from a list and snapshot the game just
+    before the named scene next runs after the answers have been used up.
+
+    Returns None if the game ends before getting there. Raises ValueError for
+    a scene that play() never sees start, because other scenes only ever call
+    it directly (see scenegraph.started_by_play()).
+    """
+    scenes = analyze()
+    if scene not in scenes:
+        raise ValueError(f"{scene!r} is not a scene in game.py")
+    if scene not in started_by_play(scenes):
+        callers = sorted(
+            name
+            for name, caller in scenes.items()
+            if any(t.target == scene for t in caller.transitions)
+        )
+        raise ValueError(
+            f"{scene}() is only ever called directly (by {', '.join(callers)}), "
+            "so play() never sees it start; snapshot before its caller instead"
+        )
+
+    taken = []
+    remaining = [len(answers)]
+    answers = iter(answers)
+
+    def counted():
+        for answer in answers:
+            remaining[0] -= 1
+            yield answer
+
+    def on_scene(current):
+        if remaining[0] == 0 and current.__name__ == scene and not taken:
+            taken.append(take_snapshot(current))
+            raise _Stop
+
+    restore(Snapshot("intro"))
+    try:
+        _play_quietly(game.intro, counted(), on_scene)
+    except _Stop:
+        pass
+    return taken[0] if taken else None
+
+
+def run_branch(snapshot, answers):
+    """Play from a snapshot answering from a list until the game ends or the
+    answers run out. The output is captured rather than shown."""
+    answers = list(answers)
+    scenes = []
+    start = restore(snapshot)
+    transcript = _play_quietly(
+        start, answers, lambda scene: scenes.append(scene.__name__)
+    )
+    return BranchResult(
+        list(answers),
+        scenes,
+        tuple(game.game_state),
+        tuple(game.inventory),
+        transcript,
+    )
+
+
+def run_branches(snapshot, branches):
+    """Play out each list of answers from the same snapshot."""
+    return [run_branch(snapshot, answers) for answers in branches]
+
+
+def _play_quietly(scene, answers, on_scene):
+    gametools.set_input_source(answers)
+    try:
+        with playthrough.captured() as output:
+            game.play(scene, on_scene=on_scene)
+    finally:
+        gametools.set_input_source()
+    return output.getvalue()
+
+
+if __name__ == "__main__":
+    from timeit import timeit
+
+    # Stand in the corridor with the keycard in hand, then try every way out.
+    prefix = playthrough.WALKTHROUGH[:16]
+    branches = [
+        ["Go East (toward the big door)", "", ""],
+        ["Go North (back to cell)", "Go South through the cell door"],
+        ["View Inventory", ""],
+    ]
+    start = snapshot_after(prefix, "hall")
+    print(f"snapshot: {start}")
+    for result in run_branches(start, branches):
+        print(f"  {result.answers[0]!r:36} -> {' > '.join(result.scenes)}")
+
+    runs = 200
+    fork = timeit(lambda: start.fork(), number=runs) / runs
+    from_snapshot = timeit(lambda: run_branches(start, branches), number=runs) / runs
+    from_intro = (
+        timeit(
+            lambda: [run_branch(Snapshot("intro"), prefix + b) for b in branches],
+            number=runs,
+        )
+        / runs
+    )
+    print(f"fork:                       {fork * 1e6:10.2f} us")
+    print(f"{len(branches)} branches from snapshot:   {from_snapshot * 1e3:10.2f} ms")
+    print(f"{len(branches)} branches replayed from intro: {from_intro * 1e3:7.2f} ms")
@@ -0,0 +1,297 @@
+"""
+STORE.PY
+
+Keeps every player's game (current scene, game_state and inventory) in a
+SQLite database so it survives between visits.
+
+Saving after every scene transition would normally mean one disk sync per
+transition. Instead, saves are collected in memory and written together in a
+single transaction every few milliseconds, or as soon as enough sessions are
+waiting, whichever comes first. Several saves of the same session in that
+window are folded into one. The database runs in WAL mode, so readers are
+never blocked by these batched writes, and a small pool of connections lets
+several threads read at once. Recently used sessions are also kept in memory
+so most loads never touch the database.
+
+By default the database runs with synchronous=NORMAL: in WAL mode a commit is
+then only synced to disk at checkpoints, so a crash of the process loses
+nothing, but a power cut can lose the last commits. Pass synchronous="FULL"
+to sync every commit; batching is what keeps that affordable.
+
+    store = SessionStore("players.db")
+    game.play(on_scene=store.tracker("alice"))
+    ...
+    saved = store.load("alice")  # a snapshots.Snapshot, or None
+
+Run this file to benchmark transitions per second with and without batching,
+at both settings of synchronous.
+"""
+
+import json
+import logging
+import queue
+import sqlite3
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import game
+from snapshots import Snapshot, restore, take_snapshot
+
+_log = logging.getLogger(__name__)
+
+_CREATE = """
+CREATE TABLE IF NOT EXISTS sessions (
+    session_id TEXT PRIMARY KEY,
+    scene TEXT NOT NULL,
+    game_state TEXT NOT NULL,
+    inventory TEXT NOT NULL
+)
+"""
+_UPSERT = """
+INSERT INTO sessions (session_id, scene, game_state, inventory)
+VALUES (?, ?, ?, ?)
+ON CONFLICT (session_id) DO UPDATE SET
+    scene = excluded.scene,
+    game_state = excluded.game_state,
+    inventory = excluded.inventory
+"""
+_SELECT = "SELECT scene, game_state, inventory FROM sessions WHERE session_id = ?"
+
+
+class SessionStore:
+    """A SQLite-backed store of saved games, one row per session."""
+
+    def __init__(
+        self,
+        path,
+        pool_size=4,
+        flush_interval=0.05,
+        flush_size=256,
+        cache_size=1024,
+        synchronous="NORMAL",
+    ):
+        self.path = path
+        self.synchronous = synchronous
+        self.flush_interval = flush_interval
+        self.flush_size = flush_size
+        self.cache_size = cache_size
+        self.writes = 0
+        self.commits = 0
+        self.error = None  # what the last failed background write raised
+
+        self._pool = queue.Queue()
+        for _ in range(max(pool_size, 1)):
+            self._pool.put(self._connect())
+        with self._connection() as conn:
+            conn.execute(_CREATE)
+
+        self._cache = OrderedDict()
+        self._pending = {}
+        self._lock = threading.Lock()
+        # Held from taking a batch until it is written, so two flushes (the
+        # flusher's and a manual one) can't commit an older save after a
+        # newer one.
+        self._write_lock = threading.Lock()
+        self._wake = threading.Condition(self._lock)
+        self._closed = False
+        self._flusher = None
+        if flush_size > 1:
+            self._flusher = threading.Thread(target=self._flush_loop, daemon=True)
+            self._flusher.start()
+
+    def _connect(self):
+        conn = sqlite3.connect(
+            self.path, check_same_thread=False, isolation_level=None
+        )
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(f"PRAGMA synchronous={self.synchronous}")
+        return conn
+
+    @contextmanager
+    def _connection(self):
+        conn = self._pool.get()
+        try:
+            yield conn
+        finally:
+            self._pool.put(conn)
+
+    def save(self, session_id, snapshot):
+        """Remember a session's latest snapshot; it is written in the next batch."""
+        with self._lock:
+            self._remember(session_id, snapshot)
+            self._pending[session_id] = snapshot
+            if self._flusher is not None:
+                if len(self._pending) >= self.flush_size:
+                    self._wake.notify()
+                return
+        self.flush()
+
+    def load(self, session_id):
+        """Return a session's latest snapshot, or None if it was never saved."""
+        with self._lock:
+            if session_id in self._cache:
+                self._cache.move_to_end(session_id)
+                return self._cache[session_id]
+        with self._connection() as conn:
+            row = conn.execute(_SELECT, (session_id,)).fetchone()
+        if row is None:
+            return None
+        scene, game_state, inventory = row
+        snapshot = Snapshot(
+            scene, tuple(json.loads(game_state)), tuple(json.loads(inventory))
+        )
+        with self._lock:
+            # a newer save may have arrived while the database was read
+            if session_id not in self._cache:
+                self._remember(session_id, snapshot)
+            return self._cache[session_id]
+
+    def tracker(self, session_id):
+        """Return an on_scene callback for game.play() that saves every scene."""
+
+        def on_scene(scene):
+            self.save(session_id, take_snapshot(scene))
+
+        return on_scene
+
+    def flush(self):
+        """Write every waiting save to the database now.
+
+        If the write fails the saves stay waiting for the next one, and the
+        error is raised.
+        """
+        with self._write_lock:
+            with self._lock:
+                batch = self._take_pending()
+            try:
+                self._write(batch)
+            except Exception:
+                with self._lock:
+                    # saves that arrived in the meantime are newer
+                    self._pending = {**batch, **self._pending}
+                raise
+
+    def close(self):
+        """Write what is left and close every connection.
+
+        Raises whatever stops the last saves from being written.
+        """
+        with self._lock:
+            self._closed = True
+            self._wake.notify()
+        if self._flusher:
+            self._flusher.join()
+        try:
+            self.flush()
+        finally:
+            while not self._pool.empty():
+                self._pool.get().close()
+
+    def _remember(self, session_id, snapshot):
+        self._cache[session_id] = snapshot
+        self._cache.move_to_end(session_id)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    def _take_pending(self):
+        batch, self._pending = self._pending, {}
+        return batch
+
+    def _flush_loop(self):
+        # Nothing may end this thread but close(): a failed write is logged,
+        # its saves are kept, and it is tried again after flush_interval.
+        failing = False
+        while True:
+            with self._lock:
+                if not self._closed and (
+                    failing or len(self._pending) < self.flush_size
+                ):
+                    self._wake.wait(self.flush_interval)
+                if self._closed:
+                    return  # close() writes what is left, and raises if it can't
+            try:
+                self.flush()
+            except Exception as error:
+                if not failing:
+                    _log.exception("saving sessions to %s failed", self.path)
+                failing = True
+                self.error = error
+            else:
+                if failing:
+                    _log.warning("saving sessions to %s works again", self.path)
+                failing = False
+                self.error = None
+
+    def _write(self, batch):
+        if not batch:
+            return
+        rows = [
+            (
+                session_id,
+                snapshot.scene,
+                json.dumps(snapshot.game_state),
+                json.dumps(snapshot.inventory),
+            )
+            for session_id, snapshot in batch.items()
+        ]
+        with self._connection() as conn:
+            conn.execute("BEGIN")
+            try:
+                conn.executemany(_UPSERT, rows)
+                conn.execute("COMMIT")
+            except BaseException:
+                if conn.in_transaction:
+                    conn.execute("ROLLBACK")
+                raise
+        self.writes += len(rows)
+        self.commits += 1
+
+
+def resume(store, session_id):
+    """Load a saved session into the game and return the scene to play next.
+
+    Starts a new game from intro() if the session was never saved.
+    """
+    snapshot = store.load(session_id)
+    if snapshot is None:
+        game.reset()
+        return game.intro
+    return restore(snapshot)
+
+
+if __name__ == "__main__":
+    import os
+    import tempfile
+    from time import perf_counter
+
+    scenes = ["intro", "cell", "hall", "attack_bob"]
+    transitions = 20_000
+    sessions = 1_000
+
+    def run(label, **options):
+        with tempfile.TemporaryDirectory() as folder:
+            store = SessionStore(os.path.join(folder, "bench.db"), **options)
+            start = perf_counter()
+            for number in range(transitions):
+                snapshot = Snapshot(
+                    scenes[number % len(scenes)],
+                    ("flashlight_on",),
+                    ("Level-1 Keycard",) * (number % 3),
+                )
+                store.save(f"player-{number % sessions}", snapshot)
+            store.close()
+            elapsed = perf_counter() - start
+        print(
+            f"{label:<18} {transitions / elapsed:10,.0f} transitions/s "
+            f"({store.commits:,} commits for {store.writes:,} rows)"
+        )
+
+    for synchronous in ("FULL", "NORMAL"):
+        run(f"unbatched {synchronous}", flush_size=1, synchronous=synchronous)
+        run(
+            f"batched {synchronous}",
+            flush_interval=0.05,
+            flush_size=256,
+            synchronous=synchronous,
+        )
@@ -0,0 +1,70 @@
+import threading
+
+import pytest
+
+import analytics
+import gametools
+
+pytest.importorskip("numpy")
+
+
+def logged(tmp_path, games):
+    """Log each game (a list of scene names) as a session; return the events."""
+    log = analytics.ColumnarLog(str(tmp_path))
+    for number, scenes in enumerate(games):
+        session = log.session(f"player{number}")
+        for scene in scenes:
+            log.append(session, analytics.SCENE, scene)
+        log.append(session, analytics.END, scenes[-1])
+    log.flush()
+    return analytics.load(str(tmp_path))
+
+
+def test_funnel_counts_sessions_that_took_the_steps_in_order(tmp_path):
+    events = logged(
+        tmp_path,
+        [
+            ["intro", "hall", "cell", "lab"],  # in order, with a detour
+            ["intro", "lab", "hall"],  # lab before hall
+            ["intro", "hall", "lab", "hall"],
+            ["hall", "lab"],  # never saw the intro
+        ],
+    )
+    assert analytics.funnel(events, ["intro", "hall", "lab"]) == [
+        ("intro", 3),
+        ("hall", 3),
+        ("lab", 2),
+    ]
+
+
+def test_funnel_needs_a_fresh_visit_for_a_repeated_step(tmp_path):
+    events = logged(tmp_path, [["hall", "lab", "hall"], ["hall", "lab"]])
+    assert analytics.funnel(events, ["hall", "lab", "hall"]) == [
+        ("hall", 2),
+        ("lab", 2),
+        ("hall", 1),
+    ]
+
+
+def test_recording_only_logs_the_choices_made_in_its_own_context(tmp_path):
+    log = analytics.ColumnarLog(str(tmp_path))
+    recorded = threading.Event()
+    done = threading.Event()
+
+    def other_game():
+        recorded.wait()
+        gametools._chosen(["Wait", "Run"], 1)  # another player's choice
+        done.set()
+
+    thread = threading.Thread(target=other_game)
+    thread.start()
+    with log.recording("alice", namespace={}):
+        recorded.set()
+        done.wait()
+        gametools._chosen(["Look", "Open the door"], 0)
+    thread.join()
+    log.flush()
+
+    events = analytics.load(str(tmp_path))
+    labels = [events.names[code] for code in events.label[events.kind == analytics.CHOICE]]
+    assert labels == ["Look"]
@@ -0,0 +1,98 @@
+import asyncio
+import sys
+
+import pytest
+
+import asyncgame
+import asyncgametools
+import gametools
+
+
+class _Reader:
+    def __init__(self, *lines):
+        self.lines = list(lines)
+
+    async def readline(self):
+        return self.lines.pop(0) if self.lines else b""
+
+
+class _Writer:
+    def __init__(self):
+        self.sent = b""
+
+    def write(self, data):
+        self.sent += data
+
+    async def drain(self):
+        pass
+
+
+@pytest.fixture
+def global_profile():
+    """Set the process-wide profile for one test, and put it back after."""
+    saved = gametools.get_output_profile()
+    yield gametools.set_output_profile
+    gametools.set_output_profile(saved)
+
+
+def run(profile, scene):
+    """Run scene in a session of the given profile; return what it sent."""
+    writer = _Writer()
+    session = asyncgametools.Session(_Reader(), writer, profile=profile)
+
+    async def main():
+        with session.activate():
+            await scene()
+
+    asyncio.run(main())
+    return writer.sent
+
+
+def test_clear_follows_the_session_profile_not_the_global_one(global_profile):
+    global_profile("full")
+    assert run("plain", asyncgametools.clear) == b"\r\n"
+
+    global_profile("plain")
+    assert b"\x1b[2J" in run("full", asyncgametools.clear)
+
+
+def test_sessions_with_different_profiles_clear_side_by_side(global_profile):
+    global_profile("full")
+    sent = {}
+
+    async def one(profile):
+        writer = _Writer()
+        session = asyncgametools.Session(_Reader(), writer, profile=profile)
+        with session.activate():
+            await asyncio.sleep(0)
+            await asyncgametools.clear()
+        sent[profile] = writer.sent
+
+    async def main():
+        await asyncio.gather(one("plain"), one("full"))
+
+    asyncio.run(main())
+    assert sent["plain"] == b"\r\n"
+    assert b"\x1b[2J" in sent["full"]
+
+
+def test_spin_shows_its_message_to_the_session_only(global_profile, capsys):
+    global_profile("full")
+
+    async def scene():
+        await asyncgametools.spin(0, "Waiting for the lift...")
+
+    for profile in ("plain", "full"):
+        sent = run(profile, scene)
+        assert b"Waiting for the lift..." in sent
+        assert b"\x1b[" not in sent
+    assert capsys.readouterr().out == ""
+
+
+def test_a_game_ending_leaves_the_process_stdin_open():
+    scenes = asyncgame.new_game()
+    assert scenes["exit"] is sys.exit
+    stdin = sys.stdin
+    with pytest.raises(SystemExit):
+        scenes["exit"](0)
+    assert sys.stdin is stdin and not stdin.closed
@@ -0,0 +1,43 @@
+import io
+import re
+import socket
+
+import gametools
+from broadcast import Broadcast, BroadcastStream
+
+
+class _Sink(io.StringIO):
+    def isatty(self):
+        return False
+
+
+def watched(broadcast):
+    """Add a spectator with small socket buffers, so it soon falls behind."""
+    ours, theirs = socket.socketpair()
+    ours.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 4096)
+    theirs.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4096)
+    broadcast.watch(ours)
+    return theirs
+
+
+def test_a_spectator_who_falls_behind_in_a_plain_game_sees_no_line_twice():
+    broadcast = Broadcast(max_pending=2048)
+    theirs = watched(broadcast)
+    output = BroadcastStream(_Sink(), broadcast)
+    with gametools.session(output, io.BytesIO(), width=80, profile="plain"):
+        gametools.clear()  # a plain screen is never cleared: one long frame
+        for number in range(3000):
+            gametools.write(f"line {number}")
+
+    received = b""
+    theirs.settimeout(5)
+    while b"line 2999\r\n" not in received:
+        received += theirs.recv(65536)
+    broadcast.close()
+    theirs.close()
+
+    numbers = [int(n) for n in re.findall(rb"line (\d+)\r\n", received)]
+    assert broadcast.skipped_ahead > 0
+    assert numbers[-1] == 2999
+    assert all(a < b for a, b in zip(numbers, numbers[1:]))
+    assert not re.search(rb"line \d+line", received)  # no chunk was cut short
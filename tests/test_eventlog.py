@@ -0,0 +1,117 @@
+import io
+
+import pytest
+
+import game
+import gametools
+from eventlog import (
+    NEW_GAME,
+    EventLog,
+    FlagSet,
+    GameReset,
+    ItemGained,
+    SceneEntered,
+    dumps,
+    loads,
+)
+
+EVENTS = [
+    GameReset(),
+    SceneEntered("cell"),
+    FlagSet("flashlight_on"),
+    SceneEntered("hall"),
+    ItemGained("Level-1 Keycard"),
+]
+
+
+def filled(count, snapshot_every=4):
+    log = EventLog(snapshot_every=snapshot_every)
+    for number in range(count):
+        log.append(EVENTS[number % len(EVENTS)])
+    return log
+
+
+def replayed(events, state=NEW_GAME):
+    for event in events:
+        state = event.apply(state)
+    return state
+
+
+def test_events_are_numbered_in_the_order_they_were_appended():
+    log = EventLog()
+    assert [log.append(event) for event in EVENTS] == [0, 1, 2, 3, 4]
+    assert list(log.history(since=3)) == [(3, EVENTS[3]), (4, EVENTS[4])]
+
+
+def test_rebuilding_from_snapshots_matches_applying_every_event():
+    log = filled(23)
+    events = [EVENTS[number % len(EVENTS)] for number in range(23)]
+    for upto in range(24):
+        assert log.rebuild(upto) == replayed(events[:upto])
+
+
+def test_events_survive_a_round_trip_through_json():
+    for seq, event in enumerate(EVENTS):
+        assert loads(dumps(seq, event)) == (seq, event)
+
+
+def test_compaction_keeps_the_numbers_and_the_latest_state():
+    log = filled(23)
+    state = log.rebuild()
+    assert log.compact() == 20
+    assert (log.start, len(log)) == (20, 23)
+    assert log.rebuild() == state
+    assert [seq for seq, _ in log.history()] == [20, 21, 22]
+    with pytest.raises(IndexError):
+        log.rebuild(19)
+
+
+def test_a_streamed_log_rebuilds_the_same_state():
+    log = filled(23)
+    stream = io.StringIO()
+    log.subscribe(stream.write, since=0)
+    copy = EventLog.from_lines(stream.getvalue().splitlines())
+    assert copy.rebuild() == log.rebuild()
+    assert len(copy) == 23
+
+
+def test_a_compacted_log_streams_from_its_oldest_snapshot():
+    log = filled(23)
+    log.compact()
+    applied, state = log.snapshots[0]
+    stream = io.StringIO()
+    log.subscribe(stream.write, since=applied)
+    log.append(SceneEntered("lab"))
+
+    copy = EventLog.from_lines(
+        stream.getvalue().splitlines(), snapshot_every=4, base=state, start=applied
+    )
+    assert (copy.start, len(copy)) == (log.start, len(log))
+    assert copy.rebuild() == log.rebuild()
+    assert copy.rebuild().scene == "lab"
+
+
+def test_lines_that_skip_events_are_refused():
+    lines = [dumps(seq, event) for seq, event in enumerate(EVENTS)]
+    with pytest.raises(ValueError, match="expected event 2, got event 3"):
+        EventLog.from_lines(lines[:2] + lines[3:])
+    with pytest.raises(ValueError, match="expected event 0, got event 20"):
+        EventLog.from_lines([dumps(20, EVENTS[0])])
+
+
+def test_recording_logs_the_scenes_other_scenes_call_directly():
+    log = EventLog()
+    radio_tower = game.radio_tower
+    # final_signal() counts its choices from 1, so the second one survives
+    answers = io.BufferedReader(io.BytesIO(b"\n2\n\n"))
+    with gametools.session(io.StringIO(), answers, width=80, profile="plain"):
+        game.reset()
+        try:
+            with log.recording():
+                game.play(game.radio_tower)
+        finally:
+            game.reset()
+    scenes = [event.scene for _, event in log.history() if event.kind == "scene"]
+    assert scenes == ["radio_tower", "final_signal", "ending_survivors"]
+    assert log.rebuild().scene == "ending_survivors"
+    assert game.radio_tower is radio_tower  # the scenes are unwrapped again
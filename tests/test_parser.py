@@ -0,0 +1,84 @@
+import pytest
+
+import gametools
+from gametools import CommandParser
+
+HALL = [
+    "View Inventory",
+    "Go North (back to cell)",
+    "Go East (toward the big door)",
+    "Take the Level-1 Keycard",
+]
+
+
+@pytest.fixture
+def parser():
+    return CommandParser(HALL)
+
+
+@pytest.mark.parametrize(
+    "command, choice",
+    [
+        ("go north", 1),
+        ("walk east", 2),  # a synonym of the choice's verb
+        ("look at inventory", 0),  # a synonym of View, with a stopword
+        ("examine inventory", 0),
+        ("tak key", 3),  # the starts of words
+        ("TAKE THE KEYCARD", 3),
+        ("vie inv", 0),  # the start of the choice's own word
+    ],
+)
+def test_commands_resolve_to_the_one_choice_they_mean(parser, command, choice):
+    assert parser.resolve(command) == choice
+
+
+def test_commands_that_mean_several_choices_or_none_resolve_to_nothing(parser):
+    assert parser.matches("go") == [1, 2]
+    assert parser.resolve("go") is None
+    assert parser.resolve("go west") is None
+    assert parser.resolve("the") is None
+    assert parser.resolve("") is None
+
+
+def test_completing_nothing_suggests_every_word_the_menu_uses(parser):
+    assert parser.complete("") == [
+        "back",
+        "big",
+        "cell",
+        "door",
+        "east",
+        "go",
+        "inventory",
+        "keycard",
+        "level-1",
+        "north",
+        "take",
+        "toward",
+        "view",
+    ]
+
+
+def test_completions_use_the_menus_words_not_their_synonyms(parser):
+    assert parser.complete("v") == ["view"]
+    assert "examine" not in parser.complete("")
+    assert parser.complete("exa") == []
+    assert parser.complete("look ") == ["look inventory"]
+
+
+def test_completions_only_leave_choices_that_can_still_be_picked(parser):
+    assert parser.complete("go ") == [
+        "go back",
+        "go big",
+        "go cell",
+        "go door",
+        "go east",
+        "go north",
+        "go toward",
+    ]
+    assert parser.complete("go n") == ["go north"]
+    assert parser.complete("take k") == ["take keycard"]
+    assert parser.complete("take n") == []
+
+
+def test_a_parser_is_built_once_per_menu():
+    assert gametools.command_parser(HALL) is gametools.command_parser(list(HALL))
@@ -0,0 +1,53 @@
+import threading
+
+from snapshots import Snapshot
+from store import SessionStore
+
+
+def saved_scene(path, session_id):
+    """Read a session's scene straight from the database, past every cache."""
+    store = SessionStore(path, flush_size=1)
+    try:
+        return store.load(session_id).scene
+    finally:
+        store.close()
+
+
+def test_saves_reach_the_database_in_batches(tmp_path):
+    path = str(tmp_path / "players.db")
+    store = SessionStore(path, flush_interval=60, flush_size=1000)
+    for scene in ("intro", "cell", "hall"):
+        store.save("alice", Snapshot(scene))
+    store.save("bob", Snapshot("cell"))
+    store.flush()
+    assert (store.commits, store.writes) == (1, 2)
+    store.close()
+    assert saved_scene(path, "alice") == "hall"
+
+
+def test_overlapping_flushes_never_commit_an_older_save_last(tmp_path):
+    path = str(tmp_path / "players.db")
+    store = SessionStore(path, flush_interval=60, flush_size=1000)
+    writing, finish = threading.Event(), threading.Event()
+    write = store._write
+
+    def slow_write(batch):
+        if batch.get("alice") == Snapshot("cell"):
+            writing.set()
+            finish.wait(5)
+        write(batch)
+
+    store._write = slow_write
+    store.save("alice", Snapshot("cell"))
+    first = threading.Thread(target=store.flush)
+    first.start()
+    writing.wait(5)  # the first flush has taken "cell" and is writing it
+    store.save("alice", Snapshot("hall"))
+    second = threading.Thread(target=store.flush)
+    second.start()
+    second.join(0.2)
+    finish.set()
+    first.join()
+    second.join()
+    store.close()
+    assert saved_scene(path, "alice") == "hall"
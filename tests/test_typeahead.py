@@ -0,0 +1,137 @@
+import io
+import os
+
+import pytest
+
+import gametools
+
+
+@pytest.fixture
+def piped():
+    """Run gametools in a session of its own, answering from a stream."""
+
+    def start(stream):
+        output = io.StringIO()
+        context = gametools.session(output, stream, width=80, profile="plain")
+        context.__enter__()
+        opened.append(context)
+        return output
+
+    opened = []
+    yield start
+    for context in opened:
+        context.__exit__(None, None, None)
+
+
+def test_lines_piped_in_one_batch_answer_the_prompts_in_order(piped):
+    piped(io.BufferedReader(io.BytesIO(b"2\nOpen the door\nAda\n")))
+    assert gametools.get_choice(["Wait", "Look", "Open the door"]) == 1
+    assert gametools.get_choice(["Wait", "Look", "Open the door"]) == 2
+    assert gametools.get_input("Name", min_length=1) == "Ada"
+
+
+def test_choices_are_matched_by_text_regardless_of_case(piped):
+    piped(io.BufferedReader(io.BytesIO(b"LOOK\n")))
+    assert gametools.get_choice(["Wait", "Look"]) == 1
+
+
+def test_hidden_choices_are_neither_shown_nor_counted(piped):
+    output = piped(io.BufferedReader(io.BytesIO(b"Look\n2\n")))
+    assert gametools.get_choice(["Wait", "Look", "Run"], hidden_choices=[1]) == 2
+    assert output.getvalue().count("INVALID INPUT") == 1
+    assert "Look" not in output.getvalue()
+
+
+def test_invalid_answers_are_reported_and_the_next_line_is_used(piped):
+    output = piped(io.BufferedReader(io.BytesIO(b"7\nFly\n1\n")))
+    assert gametools.get_choice(["Wait", "Look"]) == 0
+    assert output.getvalue().count("INVALID INPUT") == 2
+
+
+def test_get_input_validates_against_its_choices(piped):
+    piped(io.BufferedReader(io.BytesIO(b"maybe\nyes\n")))
+    assert gametools.get_input("Sure?", choices=["yes", "no"]) == "yes"
+
+
+def test_get_input_shows_its_prompt_before_reading_the_answer(piped):
+    seen = []
+
+    class Player(io.RawIOBase):
+        """Answers only once it has been asked, as a remote player would."""
+
+        def readable(self):
+            return True
+
+        def readinto(self, buffer):
+            seen.append(output.getvalue())
+            answer = b"\nAda\n"[: len(buffer)] if len(seen) == 1 else b""
+            buffer[: len(answer)] = answer
+            return len(answer)
+
+    output = piped(io.BufferedReader(Player()))
+    assert gametools.get_input("Name", min_length=1) == "Ada"
+    assert "Name" in seen[0]
+    assert output.getvalue().count("Name") == 2  # asked twice: once empty
+    assert output.getvalue().rstrip().endswith("Ada")
+    assert "Name: Ada" not in output.getvalue()
+
+
+def test_crlf_line_endings_and_a_last_line_without_one(piped):
+    piped(io.BufferedReader(io.BytesIO(b"1\r\n\r\nlast")))
+    assert gametools.get_choice(["Wait", "Look"]) == 0
+    gametools.pause()
+    assert gametools.get_input("Name", min_length=1) == "last"
+
+
+def test_utf8_split_across_reads_is_decoded_whole(piped):
+    class Trickle(io.RawIOBase):
+        """Hands over one byte per read, as a slow link might."""
+
+        def __init__(self, data):
+            self.data = data
+
+        def readable(self):
+            return True
+
+        def readinto(self, buffer):
+            if not self.data:
+                return 0
+            buffer[0], self.data = self.data[0], self.data[1:]
+            return 1
+
+    piped(io.BufferedReader(Trickle("Zoë\n".encode()), buffer_size=1))
+    assert gametools.get_input("Name", min_length=1) == "Zoë"
+
+
+def test_text_streams_are_read_a_line_at_a_time(piped):
+    piped(io.StringIO("1\nAda\n"))
+    assert gametools.get_choice(["Wait", "Look"]) == 0
+    assert gametools.get_input("Name", min_length=1) == "Ada"
+
+
+def test_lines_already_buffered_by_the_stream_are_not_skipped(piped):
+    read, write = os.pipe()
+    os.write(write, b"skipped\n2\n1\n")
+    os.close(write)
+    with open(read, "rb") as stream:
+        assert stream.readline() == b"skipped\n"  # the rest is in its buffer
+        piped(stream)
+        assert gametools.get_choice(["Wait", "Look"]) == 1
+        assert gametools.get_choice(["Wait", "Look"]) == 0
+
+
+def test_the_game_exits_when_the_input_runs_out(piped):
+    piped(io.BufferedReader(io.BytesIO(b"1\n")))
+    gametools.get_choice(["Wait", "Look"])
+    with pytest.raises(SystemExit) as exited:
+        gametools.get_choice(["Wait", "Look"])
+    assert exited.value.code == 0
+
+
+def test_set_input_source_answers_from_a_list():
+    gametools.set_input_source(["2", "Ada"])
+    try:
+        assert gametools.get_choice(["Wait", "Look"]) == 1
+        assert gametools.get_input("Name", min_length=1) == "Ada"
+    finally:
+        gametools.set_input_source()
@@ -0,0 +1,244 @@
+"""
+THREADHOST.PY
+
+Hosts game.py for network players on a pool of threads, running its scenes
+exactly as they are written.
+
+asyncgame.py fits thousands of games into one process by rewriting the scenes
+as coroutines. This host leaves them as the blocking functions they are and
+gives every player a thread from a pool instead, which only waits (and lets
+the other threads run) while that player is thinking.
+
+Two things a game normally shares with everything else in the process are
+made per session. gametools draws to one console and reads from one stdin, so
+each session opens gametools.session() in its thread's own context: its
+console, its output stream and its type-ahead belong to it alone. game.py
+keeps game_state and inventory in module globals, so each session runs in a
+fresh copy of game.py's namespace (host.new_game(), as host.py's workers
+use), executed from the same compiled code, with print() and exit() that stay
+inside the session.
+
+A pool of N threads plays N games at once; any more players wait for a free
+thread in the order they connected.
+
+    python threadhost.py serve --port 4000 --threads 256
+    python threadhost.py stress        # hundreds of concurrent sessions
+"""
+
+import argparse
+import socket
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import gametools
+from host import compiled_game, new_game
+
+
+def play_session(conn, width=80, profile=None):
+    """Play one game over a connected socket, in the calling thread."""
+    output = conn.makefile("w", encoding="utf-8", errors="replace", newline="\r\n")
+    answers = conn.makefile("rb")
+    profile = profile or gametools.get_output_profile()
+    try:
+        with gametools.session(
+            output, answers, width, profile, force_terminal=profile != "plain"
+        ):
+            scenes = new_game()
+            scenes["play"](scenes["intro"])
+        output.flush()
+    except OSError:
+        pass  # the player hung up
+    finally:
+        for stream in (answers, output):
+            try:
+                stream.close()
+            except OSError:
+                pass
+        conn.close()
+
+
+class ThreadHost:
+    """Accepts connections and plays each one's game on a pooled thread."""
+
+    def __init__(self, address=("127.0.0.1", 4000), threads=256, width=80,
+                 profile="full"):
+        self.address = address
+        self.threads = threads
+        self.width = width
+        self.profile = profile
+        self.active = 0
+        self.served = 0
+        self._lock = threading.Lock()
+        self._listener = None
+        self._pool = None
+
+    def start(self):
+        """Listen, and return the address actually bound."""
+        compiled_game()  # before the first player, not during their first scene
+        self._listener = socket.create_server(self.address, backlog=4096)
+        self._pool = ThreadPoolExecutor(self.threads, thread_name_prefix="session")
+        self.address = self._listener.getsockname()
+        return self.address
+
+    def serve_forever(self):
+        """Accept connections until close()."""
+        while True:
+            try:
+                conn, _ = self._listener.accept()
+            except OSError:
+                return  # closed
+            self._pool.submit(self._session, conn)
+
+    def close(self, wait=True):
+        """Stop accepting, and (if wait) let every game in play finish."""
+        try:
+            self._listener.shutdown(socket.SHUT_RDWR)  # wakes serve_forever()
+        except OSError:
+            pass
+        self._listener.close()
+        self._pool.shutdown(wait=wait)
+
+    def stats(self):
+        with self._lock:
+            return {"threads": self.threads, "active": self.active,
+                    "served": self.served}
+
+    def _session(self, conn):
+        with self._lock:
+            self.active += 1
+        try:
+            play_session(conn, self.width, self.profile)
+        finally:
+            with self._lock:
+                self.active -= 1
+                self.served += 1
+
+
+def serve(address, threads=256, width=80, profile="full"):
+    host = ThreadHost(address, threads, width, profile)
+    gametools.set_output_profile(profile)
+    host.start()
+    print(f"hosting on {address[0]}:{address[1]} with {threads} threads",
+          file=sys.stderr)
+    host.serve_forever()
+
+
+# Stress test: hundreds of sessions at once, every transcript checked.
+
+
+def _players(address_pipe, result_pipe, think):
+    """Play every game the parent asks for at once, and send back a digest
+    of each transcript."""
+    import asyncio
+    import hashlib
+
+    import playthrough
+
+    async def one(address):
+        reader, writer = await asyncio.open_connection(*address)
+
+        async def type_answers():
+            for answer in playthrough.WALKTHROUGH:
+                await asyncio.sleep(think)
+                writer.write(answer.encode() + b"\n")
+            writer.write_eof()
+
+        typing = asyncio.create_task(type_answers())
+        transcript = hashlib.sha256()
+        while chunk := await reader.read(65536):
+            transcript.update(chunk)
+        typing.cancel()
+        writer.close()
+        return transcript.hexdigest()
+
+    async def play_all(address, count):
+        return await asyncio.gather(*(one(address) for _ in range(count)))
+
+    while True:
+        job = address_pipe.recv()
+        if job is None:
+            return
+        address, count = job
+        result_pipe.send(asyncio.run(play_all(address, count)))
+
+
+def stress(counts=(1, 100, 300, 500), think=0.05, width=80, profile="plain"):
+    """Play many games at once through a ThreadHost with a thread for each,
+    and check that every player got exactly the transcript a lone player gets.
+    """
+    import multiprocessing
+    import time
+
+    import encounters
+    import playthrough
+
+    # Players run in their own process, forked before any thread exists here.
+    context = multiprocessing.get_context("fork")
+    jobs, theirs = context.Pipe()
+    results, their_results = context.Pipe()
+    players = context.Process(target=_players, args=(theirs, their_results, think))
+    players.start()
+
+    encounters.new_seed = lambda: 2110  # every fight the same, to compare
+    gametools.set_output_profile(profile)
+    prompts = len(playthrough.WALKTHROUGH)
+    expected = None
+    print(f"{'sessions':>8}{'wall':>9}{'sessions/s':>12}{'prompts/s':>11}"
+          f"{'cpu':>8}{'peak threads':>14}{'garbled':>9}")
+    try:
+        for count in counts:
+            host = ThreadHost(("127.0.0.1", 0), count, width, profile)
+            address = host.start()
+            acceptor = threading.Thread(target=host.serve_forever)
+            acceptor.start()
+
+            peak = [0]
+            done = threading.Event()
+
+            def watch():
+                while not done.wait(0.05):
+                    peak[0] = max(peak[0], threading.active_count())
+
+            watcher = threading.Thread(target=watch)
+            watcher.start()
+            start, cpu = time.perf_counter(), time.process_time()
+            jobs.send((address, count))
+            digests = results.recv()
+            wall, cpu = time.perf_counter() - start, time.process_time() - cpu
+            done.set()
+            watcher.join()
+            host.close()
+            acceptor.join()
+
+            if expected is None:
+                expected = digests[0]
+            garbled = sum(digest != expected for digest in digests)
+            print(f"{count:>8}{wall:>8.2f}s{count / wall:>12.1f}"
+                  f"{count * prompts / wall:>11.0f}{cpu:>7.2f}s{peak[0]:>14}"
+                  f"{garbled:>9}")
+    finally:
+        jobs.send(None)
+        players.join()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    commands = parser.add_subparsers(dest="command", required=True)
+    serve_command = commands.add_parser("serve", help="host the game")
+    serve_command.add_argument("--host", default="127.0.0.1")
+    serve_command.add_argument("--port", type=int, default=4000)
+    serve_command.add_argument("--threads", type=int, default=256)
+    serve_command.add_argument("--width", type=int, default=80)
+    serve_command.add_argument(
+        "--profile", choices=gametools.OUTPUT_PROFILES, default="full"
+    )
+    test = commands.add_parser("stress", help="play hundreds of games at once")
+    test.add_argument("--sessions", type=int, nargs="*", default=[1, 100, 300, 500])
+    test.add_argument("--think", type=float, default=0.05)
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        serve((args.host, args.port), args.threads, args.width, args.profile)
+    else:
+        stress(args.sessions, args.think)
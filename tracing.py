@@ -0,0 +1,346 @@
+"""
+TRACING.PY
+
+Traces of individual turns: how long each scene visit took, and within it
+each render, each wait for the player and each spinner.
+
+A trace starts when a scene starts with no scene already running, and every
+span in it is timed from start to end:
+
+- a span for each scene visit; a scene that calls the next scene directly
+  (as many in game.py do) has that scene's span inside its own
+- inside it, a span for every write() and write_md() (attributes: length of
+  the text, console width), get_choice(), get_input() and pause() (the wait
+  for the player, with the choice picked) and spin()
+
+Spans go to an exporter: JsonLinesExporter appends one JSON line per span to a
+local file, and Collector keeps them in a list in this process.
+
+Tracing every turn of every game would cost more than it tells, so traces are
+sampled: only sample_rate of the scene visits that start a trace are traced,
+along with everything under them. For the rest, all that a traced function
+does is look up the current span and find that it is not sampled. A game that
+is not instrumented at all pays nothing.
+
+    tracer = Tracer(JsonLinesExporter("traces.jsonl"), sample_rate=0.01)
+    with tracer.instrument():          # or instrument(asyncgame.new_game())
+        game.play(game.intro)
+
+As with analytics.py, start the game from a scene looked up inside the block,
+so its first scene is traced too.
+
+    python tracing.py run traces.jsonl     # trace one playthrough
+    python tracing.py bench                # overhead at different sample rates
+"""
+
+import argparse
+import functools
+import inspect
+import json
+import random
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import asdict, dataclass, field
+
+import gametools
+
+# The span running in the current context: a Span, _UNSAMPLED inside a scene
+# visit that was not sampled, or None outside any scene.
+_current = ContextVar("tracing_current_span", default=None)
+_UNSAMPLED = object()
+
+
+@dataclass
+class Span:
+    """One timed step of a game."""
+
+    trace: str
+    span: str
+    parent: str
+    name: str
+    kind: str  # "scene", "render", "wait" or "spin"
+    start: float  # seconds since the epoch
+    duration_ms: float = 0.0
+    attributes: dict = field(default_factory=dict)
+
+
+class Collector:
+    """Keeps every finished span in a list."""
+
+    def __init__(self):
+        self.spans = []
+
+    def __call__(self, span):
+        self.spans.append(span)
+
+    def traces(self):
+        """Return {trace id: [spans, in the order they started]}."""
+        traces = {}
+        for span in sorted(self.spans, key=lambda span: span.start):
+            traces.setdefault(span.trace, []).append(span)
+        return traces
+
+
+class JsonLinesExporter:
+    """Appends every finished span to a file as a line of JSON."""
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, "a", encoding="utf-8")
+        self._lock = threading.Lock()
+
+    def __call__(self, span):
+        line = json.dumps(asdict(span), separators=(",", ":")) + "\n"
+        with self._lock:
+            self._file.write(line)
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+def _text_length(content):
+    if isinstance(content, str):
+        return len(content)
+    return sum(len(str(item)) for item in content)
+
+
+def _rendered(args, kwargs):
+    content = args[0] if args else kwargs.get("content", "")
+    return {
+        "length": _text_length(content),
+        "width": gametools._current_console().width,
+    }
+
+
+def _argument(args, kwargs, name):
+    return args[0] if args else kwargs[name]
+
+
+def _nothing(args, kwargs):
+    return {}
+
+
+# The gametools functions game.py uses: the kind of span each gets, and the
+# attributes it gets from the arguments.
+TRACED = {
+    "write": ("render", _rendered),
+    "write_md": ("render", _rendered),
+    "clear": ("render", _nothing),
+    "get_choice": (
+        "wait",
+        lambda args, kwargs: {"choices": len(_argument(args, kwargs, "all_choices"))},
+    ),
+    "get_input": ("wait", _nothing),
+    "pause": ("wait", _nothing),
+    "spin": ("spin", lambda args, kwargs: {"seconds": _argument(args, kwargs, "seconds")}),
+}
+
+
+class Tracer:
+    """Times sampled scene visits and the gametools calls inside them, and
+    hands every finished span to export()."""
+
+    def __init__(self, export, sample_rate=1.0):
+        self.export = export
+        self.sample_rate = sample_rate
+        self.started = 0  # scene visits that could have started a trace
+        self.sampled = 0
+        self._random = random.Random()
+
+    def _id(self):
+        return f"{self._random.getrandbits(64):016x}"
+
+    def _traced(self, func, name, kind, attributes):
+        """Wrap func so each call is a span, if it is in a sampled trace."""
+
+        def enter(args, kwargs):
+            parent = _current.get()
+            if parent is _UNSAMPLED:
+                return None
+            if parent is None:
+                if kind != "scene":
+                    return None  # only scenes start traces
+                self.started += 1
+                if self._random.random() >= self.sample_rate:
+                    return _current.set(_UNSAMPLED), None
+                self.sampled += 1
+            span = Span(
+                trace=parent.trace if parent else self._id(),
+                span=self._id(),
+                parent=parent.span if parent else None,
+                name=name,
+                kind=kind,
+                start=time.time(),
+                attributes=attributes(args, kwargs),
+            )
+            return _current.set(span), span
+
+        def leave(entered, began, result, error):
+            token, span = entered
+            _current.reset(token)
+            if span is None:
+                return
+            span.duration_ms = (time.perf_counter() - began) * 1e3
+            if error is not None:
+                span.attributes["error"] = type(error).__name__
+            elif name == "get_choice":
+                span.attributes["choice"] = result
+            self.export(span)
+
+        if inspect.iscoroutinefunction(func):
+
+            @functools.wraps(func)
+            async def wrapper(*args, **kwargs):
+                entered = enter(args, kwargs)
+                if entered is None:
+                    return await func(*args, **kwargs)
+                began, result, error = time.perf_counter(), None, None
+                try:
+                    result = await func(*args, **kwargs)
+                    return result
+                except BaseException as exc:
+                    error = exc
+                    raise
+                finally:
+                    leave(entered, began, result, error)
+
+        else:
+
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                entered = enter(args, kwargs)
+                if entered is None:
+                    return func(*args, **kwargs)
+                began, result, error = time.perf_counter(), None, None
+                try:
+                    result = func(*args, **kwargs)
+                    return result
+                except BaseException as exc:
+                    error = exc
+                    raise
+                finally:
+                    leave(entered, began, result, error)
+
+        return wrapper
+
+    @contextmanager
+    def instrument(self, namespace=None):
+        """Trace the scenes and gametools calls in namespace (game.py's
+        globals by default, or a namespace from asyncgame.new_game() or
+        threadhost.new_game()) inside the block."""
+        import game
+        from scenegraph import scene_names
+
+        namespace = vars(game) if namespace is None else namespace
+        originals = {}
+        for name in scene_names():
+            if name in namespace:
+                originals[name] = namespace[name]
+                namespace[name] = self._traced(namespace[name], name, "scene", _nothing)
+        for name, (kind, attributes) in TRACED.items():
+            if name in namespace:
+                originals[name] = namespace[name]
+                namespace[name] = self._traced(namespace[name], name, kind, attributes)
+        try:
+            yield self
+        finally:
+            namespace.update(originals)
+
+
+def print_tree(spans):
+    """Print one trace's spans as an indented tree."""
+    children = {}
+    for span in spans:
+        children.setdefault(span.parent, []).append(span)
+
+    def show(span, depth):
+        details = " ".join(f"{key}={value}" for key, value in span.attributes.items())
+        print(f"{span.duration_ms:9.2f} ms  {'  ' * depth}{span.name}  {details}")
+        for child in children.get(span.span, []):
+            show(child, depth + 1)
+
+    for root in children.get(None, []):
+        show(root, 0)
+
+
+def _play(tracer=None):
+    import game
+    import playthrough
+
+    if tracer is None:
+        playthrough.play_captured()
+    else:
+        with tracer.instrument():
+            playthrough.play_captured(start=game.intro)
+
+
+def bench(runs=100):
+    """Time the playthrough untraced and traced at different sample rates,
+    and the cost of one traced call on its own."""
+    import encounters
+
+    encounters.new_seed = lambda: 2110  # every run plays the same
+    gametools.set_output_profile("plain")
+    _play()
+
+    def per_game(tracer):
+        # best of five batches, since rendering varies more than tracing costs
+        best = float("inf")
+        for _ in range(5):
+            start = time.perf_counter()
+            for _ in range(runs // 5):
+                _play(tracer)
+            best = min(best, (time.perf_counter() - start) / (runs // 5))
+        return best
+
+    def per_call(tracer, scene_sampled):
+        def scene():
+            for _ in range(10_000):
+                write("")
+
+        def write(content):
+            pass
+
+        write = tracer._traced(write, "write", "render", _nothing)
+        scene = tracer._traced(scene, "scene", "scene", _nothing)
+        tracer.sample_rate = 1.0 if scene_sampled else 0.0
+        start = time.perf_counter()
+        scene()
+        return (time.perf_counter() - start) / 10_000
+
+    baseline = per_game(None)
+    untraced = per_call(Tracer(Collector(), 0.0), False)
+    print(f"{'tracing':<20}{'per game':>10}{'overhead':>10}{'spans':>8}")
+    print(f"{'not instrumented':<20}{baseline * 1e3:>8.2f}ms")
+    for rate in (0.0, 0.01, 0.1, 1.0):
+        collector = Collector()
+        elapsed = per_game(Tracer(collector, rate))
+        spans = len(collector.spans) / (runs // 5 * 5)
+        print(f"{f'sample rate {rate:g}':<20}{elapsed * 1e3:>8.2f}ms"
+              f"{(elapsed / baseline - 1) * 100:>9.1f}%{spans:>8.1f}")
+    sampled = per_call(Tracer(Collector(), 1.0), True)
+    print(f"one traced call: {untraced * 1e6:.2f} us when not sampled, "
+          f"{sampled * 1e6:.2f} us when sampled")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    commands = parser.add_subparsers(dest="command", required=True)
+    run = commands.add_parser("run", help="trace one playthrough")
+    run.add_argument("path", help="JSON lines file to append the spans to")
+    test = commands.add_parser("bench", help="overhead at different sample rates")
+    test.add_argument("--runs", type=int, default=100)
+    args = parser.parse_args()
+
+    if args.command == "run":
+        collector = Collector()
+        exporter = JsonLinesExporter(args.path)
+        _play(Tracer(lambda span: (collector(span), exporter(span))))
+        exporter.close()
+        for spans in collector.traces().values():
+            print_tree(spans)
+    else:
+        bench(args.runs)
@@ -0,0 +1,308 @@
+"""
+ZYGOTE.PY
+
+Starts network sessions by forking a process that is already warmed up,
+instead of starting a new Python for every player.
+
+A fresh interpreter per player pays for importing rich and beaupy, building
+the Console and compiling every scene's first render before the player sees
+anything. The zygote does all of that once: it imports game and gametools,
+optionally renders every scene a player can reach once into a throwaway
+buffer so rich's caches are filled, freezes the garbage collector's view of
+those objects and only then starts accepting connections. Every connection is
+served by a child forked from it, which shares the warmed memory
+copy-on-write and only pays for the pages it changes.
+
+    python zygote.py serve --port 4000
+    python zygote.py bench      # session start latency and memory per child
+"""
+
+import argparse
+import gc
+import os
+import selectors
+import signal
+import socket
+import subprocess
+import sys
+import time
+
+import compression
+import game
+import gametools
+import host
+from scenegraph import TransitionTable
+from snapshots import Snapshot, run_branch
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def prewarm():
+    """Render the opening of every scene a player can reach, up to its first
+    prompt, following the transition table out from the first scene.
+
+    The output is thrown away; what is kept is everything rich and the
+    markdown renderer build the first time round.
+    """
+    table = TransitionTable(game)
+    waiting = [table.functions[table.table["start"]]]
+    warmed = set()
+    while waiting:
+        scene = waiting.pop(0)
+        if scene in warmed:
+            continue
+        warmed.add(scene)
+        run_branch(Snapshot(scene.__name__), [])
+        table.prewarm(scene, waiting.append)
+    game.reset()
+
+
+def memory(pid):
+    """Return how much of a process's memory is shared and private, in KiB."""
+    fields = {}
+    with open(f"/proc/{pid}/smaps_rollup") as smaps:
+        for line in smaps:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == "kB":
+                fields[parts[0].rstrip(":")] = int(parts[1])
+    return {
+        "rss": fields.get("Rss", 0),
+        "pss": fields.get("Pss", 0),
+        "shared": fields.get("Shared_Clean", 0) + fields.get("Shared_Dirty", 0),
+        "private": fields.get("Private_Clean", 0) + fields.get("Private_Dirty", 0),
+    }
+
+
+class Zygote:
+    """Accepts connections and serves each one in a child forked from itself."""
+
+    def __init__(
+        self,
+        address=("127.0.0.1", 4000),
+        width=80,
+        profile="full",
+        warm=True,
+        queue_bytes=256 * 1024,
+        compress=False,
+    ):
+        self.address = address
+        self.width = width
+        self.profile = profile
+        self.warm = warm
+        self.queue_bytes = queue_bytes
+        self.compress = compress
+        self.children = set()
+        self.listener = None
+        self.draining = False
+        self._selector = selectors.DefaultSelector()
+
+    def start(self):
+        """Warm up, then open the listening socket."""
+        gametools.set_output_profile(self.profile)
+        gametools.set_terminal_width(self.width)
+        host.compiled_game()  # every session runs its own copy of game.py from this
+        if self.warm:
+            prewarm()
+        if self.compress:
+            compression.scene_dictionary()
+        # Move everything allocated so far out of the collector's reach, so
+        # collections in the children never touch (and so copy) those pages.
+        gc.collect()
+        gc.freeze()
+
+        self.listener = socket.create_server(self.address, backlog=512)
+        self.address = self.listener.getsockname()
+        self._selector.register(self.listener, selectors.EVENT_READ)
+        return self.address
+
+    def drain(self, *_):
+        """Stop accepting new players; sessions already running carry on."""
+        if self.draining:
+            return
+        self.draining = True
+        self._selector.unregister(self.listener)
+        self.listener.close()
+
+    def serve_forever(self):
+        """Run until drained and every child has exited."""
+        signal.signal(signal.SIGTERM, self.drain)
+        signal.signal(signal.SIGINT, self.drain)
+        while not self.draining or self.children:
+            if not self.draining:
+                for _ in self._selector.select(timeout=0.5):
+                    self._accept()
+            else:
+                time.sleep(0.05)
+            self._reap()
+
+    def _accept(self):
+        try:
+            conn, _ = self.listener.accept()
+        except OSError:
+            return
+        pid = os.fork()
+        if pid == 0:
+            self._child(conn)
+        self.children.add(pid)
+        conn.close()
+
+    def _child(self, conn):
+        status = 0
+        try:
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            self.listener.close()
+            output = host.open_output(conn, self.queue_bytes, self.compress)
+            host.serve_session(conn, self.width, output)
+        except BaseException:
+            status = 1
+        finally:
+            os._exit(status)
+
+    def _reap(self):
+        while self.children:
+            try:
+                pid, _ = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                self.children.clear()
+                return
+            if pid == 0:
+                return
+            self.children.discard(pid)
+
+
+def _children_of(pid):
+    with open(f"/proc/{pid}/task/{pid}/children") as children:
+        return [int(child) for child in children.read().split()]
+
+
+def _run_zygote(warm, ready):
+    zygote = Zygote(("127.0.0.1", 0), warm=warm)
+    ready.send(zygote.start())
+    zygote.serve_forever()
+
+
+def _run_fresh(ready):
+    """The baseline: a new interpreter running game.py for every player."""
+    listener = socket.create_server(("127.0.0.1", 0))
+    ready.send(listener.getsockname())
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    signal.signal(signal.SIGCHLD, signal.SIG_IGN)  # reap games as they end
+    env = dict(os.environ, FORCE_COLOR="1")
+    while True:
+        conn, _ = listener.accept()
+        subprocess.Popen(
+            [sys.executable, os.path.join(HERE, "game.py")],
+            stdin=conn,
+            stdout=conn,
+            stderr=subprocess.DEVNULL,
+            cwd=HERE,
+            env=env,
+        )
+        conn.close()
+
+
+def bench(sessions=8, rounds=5):
+    """Compare session start latency and per-child memory.
+
+    Each round opens several sessions at once and times each one from
+    connecting to the first byte of the intro. While they are all waiting at
+    the intro's first prompt, the memory of every child is sampled.
+    """
+    import multiprocessing
+
+    context = multiprocessing.get_context("fork")
+    launchers = {
+        "fresh interpreter": (_run_fresh, ()),
+        "zygote (cold)": (_run_zygote, (False,)),
+        "zygote (prewarmed)": (_run_zygote, (True,)),
+    }
+    print(
+        f"{'launcher':<20}{'start p50':>11}{'max':>9}"
+        f"{'rss':>9}{'shared':>9}{'private':>9}{'pss':>9}"
+    )
+    for label, (target, args) in launchers.items():
+        receiving, sending = context.Pipe(duplex=False)
+        server = context.Process(target=target, args=args + (sending,))
+        server.start()
+        address = receiving.recv()
+
+        latencies = []
+        samples = []
+        for _ in range(rounds):
+            conns = []
+            for _ in range(sessions):
+                start = time.perf_counter()
+                conn = socket.create_connection(address)
+                conn.recv(1)
+                latencies.append(time.perf_counter() - start)
+                conns.append(conn)
+            time.sleep(0.2)  # let every child finish drawing the intro
+            for pid in _children_of(server.pid):
+                try:
+                    samples.append(memory(pid))
+                except OSError:
+                    pass
+            for conn in conns:
+                conn.close()
+            deadline = time.monotonic() + 10
+            while _children_of(server.pid) and time.monotonic() < deadline:
+                time.sleep(0.05)
+
+        os.kill(server.pid, signal.SIGTERM)
+        server.join()
+        latencies.sort()
+
+        def mean(key):
+            return sum(sample[key] for sample in samples) / max(len(samples), 1)
+
+        print(
+            f"{label:<20}{latencies[len(latencies) // 2] * 1e3:>9.1f}ms"
+            f"{latencies[-1] * 1e3:>7.1f}ms"
+            f"{mean('rss') / 1024:>7.1f}MB{mean('shared') / 1024:>7.1f}MB"
+            f"{mean('private') / 1024:>7.1f}MB{mean('pss') / 1024:>7.1f}MB"
+        )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    serve = commands.add_parser("serve", help="host the game")
+    serve.add_argument("--host", default="127.0.0.1")
+    serve.add_argument("--port", type=int, default=4000)
+    serve.add_argument("--width", type=int, default=80)
+    serve.add_argument(
+        "--profile", choices=gametools.OUTPUT_PROFILES, default="full"
+    )
+    serve.add_argument(
+        "--no-prewarm", dest="warm", action="store_false",
+        help="skip rendering every scene before accepting players",
+    )
+    serve.add_argument(
+        "--compress", action="store_true",
+        help="offer compressed output to clients that support MCCP2",
+    )
+
+    test = commands.add_parser("bench", help="measure start latency and memory")
+    test.add_argument("--sessions", type=int, default=8)
+    test.add_argument("--rounds", type=int, default=5)
+
+    args = parser.parse_args(argv)
+    if args.command == "serve":
+        zygote = Zygote(
+            (args.host, args.port),
+            args.width,
+            args.profile,
+            args.warm,
+            compress=args.compress,
+        )
+        address = zygote.start()
+        print(f"hosting on {address[0]}:{address[1]}", file=sys.stderr)
+        zygote.serve_forever()
+    else:
+        bench(args.sessions, args.rounds)
+
+
+if __name__ == "__main__":
+    main()